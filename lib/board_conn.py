@@ -0,0 +1,107 @@
+
+import logging
+import os
+import re
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import collections
+
+import progplatform
+
+const_envnameboxcmd = "EMBEXP_BOX_CONNECT_CMD"
+
+def get_default_connect_cmd(embexp_arg = None):
+	if const_envnameboxcmd in os.environ:
+		return os.environ[const_envnameboxcmd]
+	embexp_box_path = progplatform.get_embexp_box_path(embexp_arg)
+	return f"{embexp_box_path}/interface/remote.py {{board_type}}"
+
+# a long-lived connection to a board through EmbExp-Box, as otherwise started by hand with interface/remote.py,
+# the command is a template with {board_type} and {slot}, which makes it possible to use a stand-in for the box
+class BoardConnection:
+	def __init__(self, connect_cmd, board_type, slot = 0, ready_pattern = None, settle_time = 5, ready_timeout = 120):
+		self.cmdl = shlex.split(connect_cmd.format(board_type=board_type, slot=slot))
+		self.board_type = board_type
+		self.slot = slot
+		# the connection is established when the output matches ready_pattern, or after settle_time without it
+		self.ready_pattern = None if ready_pattern == None else re.compile(ready_pattern)
+		self.settle_time = settle_time
+		self.ready_timeout = ready_timeout
+
+		self._proc = None
+		self._ready = threading.Event()
+		self._output = collections.deque(maxlen=50)
+		self.n_connects = 0
+		self.n_failures = 0
+
+	def _read_output(self, proc):
+		for line in proc.stdout:
+			line = line.decode(errors="replace").rstrip()
+			self._output.append(line)
+			logging.debug(f"board connection {self.slot}: {line}")
+			if self.ready_pattern != None and self.ready_pattern.search(line):
+				self._ready.set()
+
+	def connect(self):
+		logging.info(f"connecting to board {self.board_type} for slot {self.slot}: {self.cmdl}")
+		self._ready.clear()
+		self._output.clear()
+		self._proc = subprocess.Popen(self.cmdl, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+		threading.Thread(target=self._read_output, args=(self._proc,), name=f"board_conn_{self.slot}", daemon=True).start()
+		self.n_connects += 1
+
+		deadline = time.monotonic() + (self.ready_timeout if self.ready_pattern != None else self.settle_time)
+		while time.monotonic() < deadline:
+			if self._proc.poll() != None:
+				raise Exception(f"board connection terminated while connecting ({self._proc.returncode}): {list(self._output)[-5:]}")
+			if self._ready.wait(0.1):
+				break
+		else:
+			if self.ready_pattern != None:
+				self.disconnect()
+				raise Exception(f"board connection not ready after {self.ready_timeout}s: {list(self._output)[-5:]}")
+		logging.info(f"board connection of slot {self.slot} established")
+
+	def disconnect(self):
+		if self._proc == None:
+			return
+		if self._proc.poll() == None:
+			try:
+				os.killpg(self._proc.pid, signal.SIGTERM)
+				self._proc.wait(10)
+			except subprocess.TimeoutExpired:
+				os.killpg(self._proc.pid, signal.SIGKILL)
+				self._proc.wait()
+			except ProcessLookupError:
+				pass
+		self._proc = None
+
+	def reconnect(self):
+		self.disconnect()
+		self.connect()
+
+	def is_alive(self):
+		return self._proc != None and self._proc.poll() == None
+
+	def ensure(self):
+		# connects if there is no connection or the connection process died
+		if not self.is_alive():
+			if self._proc != None:
+				logging.warning(f"board connection of slot {self.slot} terminated ({self._proc.returncode}), reconnecting")
+			self.reconnect()
+
+	def report_success(self):
+		self.n_failures = 0
+
+	def report_failure(self):
+		# a dead connection is replaced right away, a live one after repeated failures, e.g. of a hung board
+		self.n_failures += 1
+		if not self.is_alive() or self.n_failures >= 2:
+			logging.warning(f"reconnecting board connection of slot {self.slot} after {self.n_failures} failed runs")
+			self.reconnect()
+			self.n_failures = 0
+			return True
+		return False
@@ -0,0 +1,117 @@
+
+import logging
+import os
+import shutil
+import hashlib
+import json
+import threading
+import time
+
+# caches the build output of ProgPlatform, keyed by a digest of the experiment configuration,
+# the generated experiment headers and the ProgPlatform commit, with LRU eviction by disk size,
+# the artifacts are the directories of the working copy that make writes the image to
+default_artifact_dirs = ["output"]
+
+class BuildCache:
+	def __init__(self, cache_path, max_size = 2 * 1024**3, artifact_dirs = None):
+		self.cache_path = os.path.abspath(cache_path)
+		self.max_size = max_size
+		self.artifact_dirs = list(default_artifact_dirs if artifact_dirs == None else artifact_dirs)
+		self._lock = threading.Lock()
+		if not os.path.isdir(self.cache_path):
+			os.makedirs(self.cache_path)
+
+	def get_key(self, progplat):
+		h = hashlib.sha256()
+		h.update(progplat.get_commit_hash().encode("ascii") + b"\0")
+		inputs = ["Makefile.config"]
+		exp_dir = "all/inc/experiment"
+		inputs += sorted(map(lambda x: f"{exp_dir}/{x}", os.listdir(os.path.join(progplat.progplat_path, exp_dir))))
+		for path in inputs:
+			with open(os.path.join(progplat.progplat_path, path), "rb") as f:
+				data = f.read()
+			h.update(path.encode() + b"\0" + len(data).to_bytes(8, "little") + data)
+		return h.hexdigest()
+
+	def _entry_path(self, key):
+		return os.path.join(self.cache_path, key)
+
+	def restore(self, progplat, key):
+		entry_path = self._entry_path(key)
+		if not os.path.isdir(entry_path):
+			return False
+		try:
+			# an entry with other artifacts, e.g. stored with another configuration, is not used
+			with open(os.path.join(entry_path, "entry.json"), "r") as f:
+				if json.load(f).get("artifact_dirs") != self.artifact_dirs:
+					logging.info(f"build cache entry has other artifacts: {key}")
+					return False
+			for d in self.artifact_dirs:
+				target = os.path.join(progplat.progplat_path, d)
+				if os.path.isdir(target):
+					shutil.rmtree(target)
+				shutil.copytree(os.path.join(entry_path, d), target)
+		except FileNotFoundError:
+			# evicted concurrently
+			logging.info(f"build cache entry disappeared: {key}")
+			return False
+		# the artifacts have to be newer than the freshly written headers, so that make skips compile and link
+		now = time.time()
+		for d in self.artifact_dirs:
+			for (root, dirs, files) in os.walk(os.path.join(progplat.progplat_path, d)):
+				for filename in files:
+					os.utime(os.path.join(root, filename), (now, now))
+		# mark as recently used
+		os.utime(entry_path)
+		logging.info(f"build cache hit: {key}")
+		return True
+
+	def store(self, progplat, key):
+		entry_path = self._entry_path(key)
+		if os.path.isdir(entry_path):
+			return
+		# only complete build output is cached, a restored entry replaces the artifacts of the last build
+		for d in self.artifact_dirs:
+			source = os.path.join(progplat.progplat_path, d)
+			if not os.path.isdir(source) or len(os.listdir(source)) == 0:
+				logging.warning(f"no build output in {source}, not cached, check the artifact directories of the build cache")
+				return
+		temp_path = f"{entry_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+		size = 0
+		for d in self.artifact_dirs:
+			source = os.path.join(progplat.progplat_path, d)
+			shutil.copytree(source, os.path.join(temp_path, d))
+			for (root, dirs, files) in os.walk(source):
+				size += sum(map(lambda x: os.path.getsize(os.path.join(root, x)), files))
+		with open(os.path.join(temp_path, "entry.json"), "w") as f:
+			json.dump({"size": size, "artifact_dirs": self.artifact_dirs}, f)
+		try:
+			os.rename(temp_path, entry_path)
+		except OSError:
+			# stored concurrently by another board slot
+			shutil.rmtree(temp_path)
+			return
+		logging.info(f"build cache store: {key} ({size} bytes)")
+		self._evict()
+
+	def _evict(self):
+		with self._lock:
+			entries = []
+			total = 0
+			for entry in os.scandir(self.cache_path):
+				if not entry.is_dir() or ".tmp." in entry.name:
+					continue
+				try:
+					with open(os.path.join(entry.path, "entry.json"), "r") as f:
+						size = json.load(f)["size"]
+					entries.append((entry.stat().st_mtime, size, entry.path))
+				except (FileNotFoundError, ValueError, KeyError):
+					continue
+				total += size
+			entries.sort()
+			for (mtime, size, entry_path) in entries:
+				if total <= self.max_size:
+					break
+				logging.info(f"build cache evict: {os.path.basename(entry_path)}")
+				shutil.rmtree(entry_path, ignore_errors=True)
+				total -= size
@@ -0,0 +1,153 @@
+
+import logging
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# watchers for the experiment directories of an experiment class,
+# wait(timeout) returns the set of experiment directory names that changed, or None if everything has to be rescanned
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ONLYDIR     = 0x01000000
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+_event_struct = struct.Struct("iIII")
+
+class InotifyWatcher:
+	_mask_class = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+	_mask_exp   = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_ONLYDIR
+
+	def __init__(self, exps_dir):
+		self.exps_dir = exps_dir
+		libc_name = ctypes.util.find_library("c")
+		self._libc = ctypes.CDLL(libc_name, use_errno=True)
+		self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self._fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self._wds = {}
+		# scans instead once no more watches can be added, e.g. at the limit of fs.inotify.max_user_watches
+		self._fallback = None
+		try:
+			self._class_wd = self._add_watch(exps_dir, self._mask_class)
+			for entry in os.scandir(exps_dir):
+				if entry.is_dir():
+					self._watch_exp(entry.name)
+		except:
+			os.close(self._fd)
+			raise
+
+	def _add_watch(self, path, mask):
+		wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+		if wd < 0:
+			errno = ctypes.get_errno()
+			raise OSError(errno, f"inotify_add_watch failed for {path}: {os.strerror(errno)}")
+		return wd
+
+	def _watch_exp(self, data_id):
+		wd = self._add_watch(os.path.join(self.exps_dir, data_id), self._mask_exp)
+		self._wds[wd] = data_id
+
+	def _read_events(self):
+		changed = set()
+		while True:
+			try:
+				buf = os.read(self._fd, 64 * 1024)
+			except BlockingIOError:
+				return changed
+			offset = 0
+			while offset < len(buf):
+				(wd, mask, cookie, namelen) = _event_struct.unpack_from(buf, offset)
+				offset += _event_struct.size
+				name = buf[offset:offset + namelen].rstrip(b"\0").decode()
+				offset += namelen
+				if mask & IN_Q_OVERFLOW:
+					return None
+				if wd == self._class_wd:
+					if not (mask & IN_ISDIR):
+						continue
+					changed.add(name)
+					if mask & (IN_CREATE | IN_MOVED_TO):
+						try:
+							self._watch_exp(name)
+						except FileNotFoundError:
+							pass
+						except OSError as e:
+							logging.warning(f"can't watch more experiment directories, falling back to scanning: {e}")
+							self._fallback = ScanWatcher(self.exps_dir)
+							os.close(self._fd)
+							return None
+					continue
+				data_id = self._wds.get(wd)
+				if data_id == None:
+					continue
+				changed.add(data_id)
+				if mask & IN_IGNORED:
+					self._wds.pop(wd)
+
+	def wait(self, timeout):
+		if self._fallback != None:
+			return self._fallback.wait(timeout)
+		(readable, _, _) = select.select([self._fd], [], [], timeout)
+		if len(readable) == 0:
+			return set()
+		changed = self._read_events()
+		# let a writer finish the files of an experiment before reporting it
+		while changed != None and self._fallback == None:
+			(readable, _, _) = select.select([self._fd], [], [], 0.05)
+			if len(readable) == 0:
+				break
+			more = self._read_events()
+			changed = None if more == None else changed | more
+		return changed
+
+	def close(self):
+		if self._fallback == None:
+			os.close(self._fd)
+
+# fallback without inotify, compares the mtimes of the experiment directories
+class ScanWatcher:
+	def __init__(self, exps_dir, poll_interval = 2):
+		self.exps_dir = exps_dir
+		self.poll_interval = poll_interval
+		self._mtimes = self._scan()
+
+	def _scan(self):
+		mtimes = {}
+		for entry in os.scandir(self.exps_dir):
+			if entry.is_dir():
+				mtimes[entry.name] = entry.stat().st_mtime_ns
+		return mtimes
+
+	def wait(self, timeout):
+		deadline = time.monotonic() + timeout
+		while True:
+			mtimes = self._scan()
+			changed = set(filter(lambda x: self._mtimes.get(x) != mtimes[x], mtimes))
+			changed |= set(filter(lambda x: not x in mtimes, self._mtimes))
+			self._mtimes = mtimes
+			remaining = deadline - time.monotonic()
+			if len(changed) > 0 or remaining <= 0:
+				return changed
+			time.sleep(min(self.poll_interval, remaining))
+
+	def close(self):
+		pass
+
+def get_watcher(exps_dir):
+	try:
+		return InotifyWatcher(exps_dir)
+	except (OSError, AttributeError) as e:
+		logging.warning(f"inotify is not available, falling back to scanning: {e}")
+		return ScanWatcher(exps_dir)
@@ -0,0 +1,292 @@
+
+import logging
+import os
+import json
+import time
+import timeit
+import random
+import hashlib
+import platform
+import statistics
+
+import experiment
+import exp_catalog
+import exp_finder
+import exp_status
+from helpers import *
+
+# version of the json format of the results, results of different versions are not compared
+bench_format = 1
+
+bench_exp_class = "arm8/exps2/bench"
+bench_run_id = experiment.get_run_id("0" * 40, "rpi3")
+tree_version = 1
+
+# synthetic inputs
+# ======================================
+def gen_memmap(rnd, n_bytes):
+	# bytes scattered in runs over a small region, like the memory of generated experiments
+	memmap = {}
+	while len(memmap) < n_bytes:
+		addr = 0x80100000 + rnd.randrange(0, 0x10000)
+		for i in range(min(rnd.randint(1, 16), n_bytes - len(memmap))):
+			memmap[addr + i] = rnd.randrange(0, 256)
+	return memmap
+
+def gen_statemap(rnd, n_regs, n_bytes):
+	statemap = {}
+	for reg in rnd.sample(range(31), n_regs):
+		statemap[f"x{reg}"] = rnd.randrange(0, 2**64)
+	statemap["mem"] = gen_memmap(rnd, n_bytes)
+	return statemap
+
+def gen_uart_cache_dump(rnd, board_type, full, fill = 0.5):
+	# the lines of the uart output of a single experiment, as check_uart_experiment_base expects them
+	(num_sets, num_ways) = get_cache_geometry(board_type)
+	lines = ["Init complete.", "----", "print_cache_full" if full else "print_cache_valid", "----"]
+	for s in range(num_sets):
+		if full:
+			lines.append(f"set={s}")
+		for l in range(num_ways):
+			valid = rnd.random() < fill
+			tag = f"0x{rnd.randrange(0, 2**20):08x}"
+			if full:
+				lines += [f"line={l}", f"valid: {1 if valid else 0}", f"tag: {tag}"]
+			elif valid:
+				lines.append(f"{s} :: {l} :: tag: {tag}")
+	lines += ["----", "Experiment complete.", ""]
+	return lines
+
+# synthetic experiment trees
+# ======================================
+def _input_json(rnd, i):
+	base = 0x80100000 + (i % 1024) * 64
+	mem = dict(map(lambda x: (hex(base + x), hex(rnd.randrange(0, 256))), range(8)))
+	return json.dumps({"x5": hex(base), "x6": hex(rnd.randrange(0, 2**64)), "mem": mem})
+
+def gen_tree(tree_path, n, seed = 0):
+	# n pair experiments of the class bench_exp_class, the runs of bench_run_id are mostly complete
+	# with equal, unequal and inconclusive results, some are incomplete and some experiments have no run,
+	# an existing tree with the same parameters is reused
+	params = {"version": tree_version, "n": n, "seed": seed, "exp_class": bench_exp_class, "run_id": bench_run_id}
+	marker_path = os.path.join(tree_path, "tree.json")
+	if os.path.isfile(marker_path):
+		with open(marker_path, "r") as f:
+			if json.load(f) == params:
+				return
+	if os.path.exists(tree_path):
+		call_cmd(["rm", "-rf", tree_path], "could not remove the old benchmark tree")
+	logging.info(f"generating a benchmark tree with {n} experiments in {tree_path}")
+
+	rnd = random.Random(seed)
+	n_progs = max(1, n // 100)
+	for k in range(n_progs):
+		prog_path = os.path.join(tree_path, f"arm8/progs/p{k}")
+		os.makedirs(prog_path)
+		with open(os.path.join(prog_path, "code.asm"), "w") as f:
+			f.write(f"\tldr x{k % 8}, [x5]\n\tldr x9, [x6]\n")
+
+	run_dirname = experiment.get_run_dir(bench_run_id)
+	results = [("true", b"RESULT: EQUAL"), ("false", b"RESULT: UNEQUAL"), ("\"special :::: INCONCLUSIVE: 3 of 10\"", b"INCONCLUSIVE: 3 of 10")]
+	exps_path = os.path.join(tree_path, bench_exp_class)
+	os.makedirs(exps_path)
+	for i in range(n):
+		exp_path = os.path.join(exps_path, hashlib.sha1(f"{seed}.{i}".encode()).hexdigest())
+		os.mkdir(exp_path)
+		files = [("code.hash", f"p{rnd.randrange(n_progs)}\n"), ("input1.json", _input_json(rnd, i)), ("input2.json", _input_json(rnd, i)), ("train.json", _input_json(rnd, i))]
+		for (filename, content) in files:
+			with open(os.path.join(exp_path, filename), "w") as f:
+				f.write(content)
+		x = rnd.random()
+		if x < 0.2:
+			continue
+		run_path = os.path.join(exp_path, run_dirname)
+		os.mkdir(run_path)
+		(result, resultline) = results[0 if x < 0.6 else (1 if x < 0.8 else 2)]
+		with open(os.path.join(run_path, "output_uart.log"), "wb") as f:
+			f.write(b"Init complete.\n" + resultline + b"\nExperiment complete.\n")
+		if x < 0.9:
+			with open(os.path.join(run_path, "result.json"), "w") as f:
+				f.write(result)
+
+	with open(marker_path, "w") as f:
+		json.dump(params, f)
+
+# timing
+# ======================================
+def _get_stats(times, loops):
+	# seconds per call
+	per_call = list(map(lambda x: x / loops, times))
+	return {"loops": loops, "repeat": len(per_call), "min": round(min(per_call), 9),
+		"median": round(statistics.median(per_call), 9), "mean": round(statistics.mean(per_call), 9)}
+
+def time_micro(func, repeat):
+	# as many calls per repetition as take at least 0.2 seconds, like timeit
+	timer = timeit.Timer(func)
+	(loops, _) = timer.autorange()
+	return _get_stats(timer.repeat(repeat, loops), loops)
+
+def time_once(func, repeat, setup = None):
+	# one call per repetition, for the expensive benchmarks
+	times = []
+	for _ in range(repeat):
+		if setup != None:
+			setup()
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	return _get_stats(times, 1)
+
+def _cycle(vals):
+	state = {"i": 0}
+	def next_val():
+		i = state["i"]
+		state["i"] = (i + 1) % len(vals)
+		return vals[i]
+	return next_val
+
+def get_micro_benchmarks(seed = 0):
+	# name -> (params, function to call)
+	rnd = random.Random(seed)
+	benchmarks = {}
+
+	# more different inputs than the cache of gen_input_code holds, so that every call generates the code
+	for (name, n_regs, n_bytes) in [("typical", 4, 64), ("large", 31, 1024)]:
+		next_statemap = _cycle(list(map(lambda x: gen_statemap(rnd, n_regs, n_bytes), range(512))))
+		benchmarks[f"micro/gen_input_code/{name}"] = ({"regs": n_regs, "mem_bytes": n_bytes, "distinct": 512}, lambda f=next_statemap: gen_input_code(f()))
+	statemap = gen_statemap(rnd, 4, 64)
+	benchmarks["micro/gen_input_code/cached"] = ({"regs": 4, "mem_bytes": 64, "distinct": 1}, lambda: gen_input_code(statemap))
+
+	for (name, n_bytes) in [("typical", 64), ("large", 4096)]:
+		memmap = gen_memmap(rnd, n_bytes)
+		benchmarks[f"micro/mem_parse/{name}"] = ({"mem_bytes": n_bytes}, lambda m=memmap: mem_parse(m))
+
+	for board_type in sorted(cache_geometries):
+		for full in [True, False]:
+			lines = gen_uart_cache_dump(rnd, board_type, full)
+			func_name = "parse_uart_single_cache_experiment_full" if full else "parse_uart_single_cache_experiment_simp"
+			benchmarks[f"micro/{func_name}/{board_type}"] = ({"board_type": board_type, "lines": len(lines)}, lambda l=lines, b=board_type: parse_uart_single_cache_experiment(l, b))
+
+	pair_outputs = list(map(lambda x: ["Init complete.", x, "Experiment complete.", ""], ["RESULT: EQUAL", "RESULT: UNEQUAL"]))
+	next_output = _cycle(pair_outputs)
+	benchmarks["micro/eval_uart_pair_cache_experiment"] = ({}, lambda: eval_uart_pair_cache_experiment(next_output()))
+	return benchmarks
+
+def run_micro_benchmarks(name_filter, repeat, seed = 0):
+	results = {}
+	for (name, (params, func)) in get_micro_benchmarks(seed).items():
+		if not name_filter(name):
+			continue
+		logging.info(f"running {name}")
+		results[name] = dict(time_micro(func, repeat), params = params)
+	return results
+
+def run_tree_benchmarks(name_filter, tree_dir, sizes, repeat, jobs = 1, seed = 0):
+	results = {}
+	for n in sizes:
+		names = list(map(lambda x: f"tree/{x}/{n}", ["get_exps/cold", "get_exps/warm", "get_exps/fix", "status"]))
+		if not any(map(name_filter, names)):
+			continue
+		tree_path = os.path.abspath(os.path.join(tree_dir, f"tree_{n}_{seed}"))
+		gen_tree(tree_path, n, seed)
+
+		prev_logs_path = get_logs_path(".")
+		set_logs_path(tree_path)
+		try:
+			catalog_path = os.path.join(tree_path, ".cache/catalog.sqlite")
+			catalogs = []
+			def new_catalog():
+				if os.path.exists(catalog_path):
+					os.remove(catalog_path)
+				catalogs[:] = [exp_catalog.ExpCatalog(catalog_path)]
+
+			def get_exps():
+				assert len(exp_finder.get_exps(bench_exp_class, catalog = catalogs[0])) == n
+			def get_exps_fix():
+				(progplat_hash, board_type) = bench_run_id.split(".")
+				exp_finder.get_exps(bench_exp_class, "fix", progplat_hash, board_type, catalog = catalogs[0])
+			def collect_status():
+				status = exp_status.ExpStatus(bench_run_id)
+				status.collect("arm8", catalogs[0], None, jobs)
+				assert status.n_exps == n
+
+			params = {"n": n, "seed": seed}
+			benchmarks = [
+				(names[0], params, get_exps, new_catalog),
+				(names[1], params, get_exps, None),
+				(names[2], params, get_exps_fix, None),
+				(names[3], dict(params, jobs = jobs), collect_status, None),
+			]
+			# the warm benchmarks need a filled catalog
+			new_catalog()
+			exp_finder.get_exps(bench_exp_class, catalog = catalogs[0])
+			for (name, params, func, setup) in benchmarks:
+				if not name_filter(name):
+					continue
+				logging.info(f"running {name}")
+				results[name] = dict(time_once(func, repeat, setup), params = params)
+		finally:
+			set_logs_path(prev_logs_path)
+	return results
+
+def get_environment():
+	# only for information, not compared
+	return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+		"machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+
+def get_results_json(results):
+	return {"format": bench_format, "environment": get_environment(), "benchmarks": results}
+
+# comparison with a baseline
+# ======================================
+def compare_results(baseline, current, threshold = 0.1):
+	# (name, baseline min, current min, ratio, state) of all benchmarks in either of the results,
+	# a benchmark is slower or faster if the minimum time differs by more than the threshold
+	if baseline.get("format") != bench_format:
+		raise Exception(f"cannot compare with results of format {baseline.get('format')}, expected {bench_format}")
+	rows = []
+	base_benchmarks = baseline["benchmarks"]
+	cur_benchmarks = current["benchmarks"]
+	for name in sorted(set(base_benchmarks) | set(cur_benchmarks)):
+		if not name in cur_benchmarks:
+			rows.append((name, base_benchmarks[name]["min"], None, None, "missing"))
+			continue
+		if not name in base_benchmarks:
+			rows.append((name, None, cur_benchmarks[name]["min"], None, "new"))
+			continue
+		base_min = base_benchmarks[name]["min"]
+		cur_min = cur_benchmarks[name]["min"]
+		ratio = cur_min / base_min if base_min > 0 else None
+		if ratio == None:
+			state = "same"
+		elif ratio > 1 + threshold:
+			state = "slower"
+		elif ratio < 1 / (1 + threshold):
+			state = "faster"
+		else:
+			state = "same"
+		rows.append((name, base_min, cur_min, ratio, state))
+	return rows
+
+def format_time(t):
+	if t == None:
+		return "-"
+	for (unit, scale) in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+		if t >= scale:
+			return f"{t / scale:.3f}{unit}"
+	return f"{t / 1e-9:.1f}ns"
+
+def get_results_str(results):
+	width = max(map(len, list(results) + ["benchmark"]))
+	s = f"{'benchmark'.ljust(width)} | {'min':>10} | {'median':>10} | {'mean':>10} | {'calls':>8}\n"
+	for (name, r) in sorted(results.items()):
+		s += f"{name.ljust(width)} | {format_time(r['min']):>10} | {format_time(r['median']):>10} | {format_time(r['mean']):>10} | {r['loops'] * r['repeat']:>8}\n"
+	return s[:-1]
+
+def get_comparison_str(rows):
+	width = max(map(lambda x: len(x[0]), rows + [("benchmark",)]))
+	s = f"{'benchmark'.ljust(width)} | {'baseline':>10} | {'current':>10} | {'ratio':>6} | state\n"
+	for (name, base_min, cur_min, ratio, state) in rows:
+		ratio_str = "-" if ratio == None else f"{ratio:.2f}"
+		s += f"{name.ljust(width)} | {format_time(base_min):>10} | {format_time(cur_min):>10} | {ratio_str:>6} | {state}\n"
+	return s[:-1]
@@ -0,0 +1,226 @@
+
+import logging
+import os
+import sqlite3
+import threading
+
+import experiment
+import exp_pack
+from helpers import *
+
+def get_default_catalog_path():
+	return get_logs_path(".cache/catalog.sqlite")
+
+_default_catalog = None
+def get_default_catalog():
+	global _default_catalog
+	if _default_catalog == None:
+		_default_catalog = ExpCatalog(get_default_catalog_path())
+	return _default_catalog
+
+# persistent index of the experiments in the logs, refreshed incrementally based on directory mtimes
+class ExpCatalog:
+	def __init__(self, catalog_path):
+		catalog_dir = os.path.dirname(catalog_path)
+		if not os.path.isdir(catalog_dir):
+			os.makedirs(catalog_dir)
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(catalog_path, timeout=60, check_same_thread=False)
+		self._db.executescript("""
+			CREATE TABLE IF NOT EXISTS exps (
+				exp_id    TEXT PRIMARY KEY,
+				exp_class TEXT NOT NULL,
+				data_id   TEXT NOT NULL,
+				mtime_ns  INTEGER NOT NULL,
+				valid     INTEGER NOT NULL,
+				prog_id   TEXT,
+				exp_type  TEXT NOT NULL,
+				params_id TEXT NOT NULL
+			);
+			CREATE INDEX IF NOT EXISTS exps_class ON exps (exp_class, data_id);
+			CREATE TABLE IF NOT EXISTS runs (
+				exp_id   TEXT NOT NULL,
+				run_id   TEXT NOT NULL,
+				mtime_ns INTEGER NOT NULL,
+				complete INTEGER NOT NULL,
+				PRIMARY KEY (exp_id, run_id)
+			);
+			CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id, complete);
+		""")
+		self._db.commit()
+
+	def _scan_runs(self, exp_id, exp_path):
+		runs = []
+		prefix = "run."
+		for (name, run_path, mtime_ns) in exp_pack.scandir_dirs(exp_path):
+			if not name.startswith(prefix):
+				continue
+			runs.append(self._scan_run(exp_id, run_path, name[len(prefix):], mtime_ns))
+		return runs
+
+	def _scan_run(self, exp_id, run_path, run_id, mtime_ns):
+		# TODO: these filenames are specific to a certain type of experiment, see Experiment.is_incomplete_experiment
+		complete = all(map(lambda x: exp_pack.isfile(os.path.join(run_path, x)), ["output_uart.log", "result.json"]))
+		return (exp_id, run_id, mtime_ns, 1 if complete else 0)
+
+	def _scan_exp(self, exp_class, data_id, mtime_ns):
+		exp_id = f"{exp_class}/{data_id}"
+		exp = experiment.Experiment(exp_id)
+		valid = exp.is_valid_experiment()
+		prog_id = exp.get_prog_id() if valid else None
+		row = (exp_id, exp_class, data_id, mtime_ns, 1 if valid else 0, prog_id, exp.get_exp_type(), exp.get_exp_params_id())
+		return (row, self._scan_runs(exp_id, exp.get_path(".")))
+
+	def _iter_exp_dirs(self, exps_dir, data_ids, exp_prefix):
+		if data_ids == None:
+			for (name, exp_path, mtime_ns) in exp_pack.scandir_dirs(exps_dir):
+				if exp_prefix != None and not name.startswith(exp_prefix):
+					continue
+				yield (name, exp_path, mtime_ns)
+			return
+		for data_id in data_ids:
+			if exp_prefix != None and not data_id.startswith(exp_prefix):
+				continue
+			exp_path = os.path.join(exps_dir, data_id)
+			if not exp_pack.isdir(exp_path):
+				continue
+			yield (data_id, exp_path, exp_pack.get_mtime_ns(exp_path))
+
+	def _select_class(self, exp_class, exp_ids, query, exp_id_col):
+		if exp_ids == None:
+			return list(self._db.execute(query, (exp_class,)))
+		rows = []
+		# stay below the sqlite limit for the number of query parameters
+		for i in range(0, len(exp_ids), 500):
+			chunk = exp_ids[i:i+500]
+			rows += self._db.execute(query + f" AND {exp_id_col} IN ({', '.join('?' * len(chunk))})", [exp_class] + chunk)
+		return rows
+
+	def _flush(self, removed, rescanned, exp_rows, run_rows):
+		with self._lock:
+			self._db.executemany("DELETE FROM exps WHERE exp_id = ?", map(lambda x: (x,), removed))
+			self._db.executemany("DELETE FROM runs WHERE exp_id = ?", map(lambda x: (x,), removed + rescanned))
+			self._db.executemany("INSERT OR REPLACE INTO exps VALUES (?, ?, ?, ?, ?, ?, ?, ?)", exp_rows)
+			self._db.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)", run_rows)
+			self._db.commit()
+
+	def iter_refresh(self, exp_class, data_ids = None, exp_prefix = None, flush_size = 1000):
+		# refreshes the catalog while streaming (exp_id, valid, complete_run_ids) for every experiment directory,
+		# data_ids restricts the refresh to the given experiment directories, e.g. the ones that are known to have changed
+		exps_dir = get_logs_path(exp_class)
+		if not exp_pack.isdir(exps_dir):
+			raise Exception(f"not a directory in logs: {exp_class}")
+		if data_ids != None:
+			data_ids = list(data_ids)
+			exp_ids = list(map(lambda x: f"{exp_class}/{x}", data_ids))
+		else:
+			exp_ids = None
+		with self._lock:
+			known = {}
+			for (data_id, mtime_ns, valid) in self._select_class(exp_class, exp_ids, "SELECT data_id, mtime_ns, valid FROM exps WHERE exp_class = ?", "exp_id"):
+				known[data_id] = (mtime_ns, valid)
+			known_runs = {}
+			for (exp_id, run_id, mtime_ns, complete) in self._select_class(exp_class, exp_ids, "SELECT r.exp_id, r.run_id, r.mtime_ns, r.complete FROM runs r JOIN exps e ON r.exp_id = e.exp_id WHERE e.exp_class = ?", "e.exp_id"):
+				known_runs.setdefault(exp_id, []).append((run_id, mtime_ns, complete))
+
+		exp_rows = []
+		run_rows = []
+		rescanned = []
+		n_rescanned = 0
+		present = set()
+		for (data_id, exp_path, mtime_ns) in self._iter_exp_dirs(exps_dir, data_ids, exp_prefix):
+			present.add(data_id)
+			exp_id = f"{exp_class}/{data_id}"
+			k = known.get(data_id)
+			# a changed directory mtime means that files or runs were added or removed,
+			# invalid experiments are checked again because their program may have been added meanwhile
+			if k == None or k[0] != mtime_ns or k[1] == 0:
+				(row, runs) = self._scan_exp(exp_class, data_id, mtime_ns)
+				exp_rows.append(row)
+				rescanned.append(exp_id)
+				run_rows.extend(runs)
+			else:
+				row = None
+				# the complete runs of unchanged experiments only need to be checked by the mtimes of their directories
+				runs = []
+				for (run_id, run_mtime_ns, complete) in known_runs.get(exp_id, []):
+					run_path = os.path.join(exp_path, experiment.get_run_dir(run_id))
+					try:
+						st_mtime_ns = exp_pack.get_mtime_ns(run_path)
+					except FileNotFoundError:
+						rescanned.append(exp_id)
+						runs = self._scan_runs(exp_id, exp_path)
+						run_rows.extend(runs)
+						break
+					# incomplete runs are always checked again, the missing files may have been written within the same mtime tick
+					if st_mtime_ns != run_mtime_ns or complete == 0:
+						runs.append(self._scan_run(exp_id, run_path, run_id, st_mtime_ns))
+						if runs[-1] != (exp_id, run_id, run_mtime_ns, complete):
+							run_rows.append(runs[-1])
+					else:
+						runs.append((exp_id, run_id, run_mtime_ns, complete))
+			if len(exp_rows) + len(run_rows) >= flush_size:
+				n_rescanned += len(rescanned)
+				self._flush([], rescanned, exp_rows, run_rows)
+				(rescanned, exp_rows, run_rows) = ([], [], [])
+
+			valid = (row[4] if row != None else k[1]) == 1
+			yield (exp_id, valid, set(map(lambda x: x[1], filter(lambda x: x[3] == 1, runs))))
+
+		# only a complete refresh knows which experiments are gone
+		if exp_prefix == None:
+			checked = known if data_ids == None else filter(lambda x: x in known, data_ids)
+			removed = list(map(lambda x: f"{exp_class}/{x}", filter(lambda x: not x in present, checked)))
+		else:
+			removed = []
+		n_rescanned += len(rescanned)
+		self._flush(removed, rescanned, exp_rows, run_rows)
+		logging.info(f"catalog refresh of {exp_class}: {len(present)} directories, {n_rescanned} rescanned, {len(removed)} removed")
+
+	def refresh(self, exp_class, data_ids = None):
+		for _ in self.iter_refresh(exp_class, data_ids):
+			pass
+
+	def get_exp_ids(self, exp_class, exp_prefix = None, valid = True, incomplete_run_id = None, refresh = True, data_ids = None):
+		if refresh:
+			self.refresh(exp_class, data_ids)
+		query = "SELECT exp_id FROM exps e WHERE exp_class = ?"
+		params = [exp_class]
+		if valid != None:
+			query += " AND valid = ?"
+			params.append(1 if valid else 0)
+		if exp_prefix != None:
+			query += " AND data_id >= ? AND data_id < ?"
+			params += [exp_prefix, exp_prefix + "\U0010ffff"]
+		if incomplete_run_id != None:
+			query += " AND NOT EXISTS (SELECT 1 FROM runs r WHERE r.exp_id = e.exp_id AND r.run_id = ? AND r.complete = 1)"
+			params.append(incomplete_run_id)
+		with self._lock:
+			if data_ids == None:
+				return list(map(lambda x: x[0], self._db.execute(query + " ORDER BY data_id", params)))
+			data_ids = list(data_ids)
+			exp_ids = []
+			for i in range(0, len(data_ids), 500):
+				chunk = data_ids[i:i+500]
+				exp_ids += map(lambda x: x[0], self._db.execute(query + f" AND data_id IN ({', '.join('?' * len(chunk))})", params + chunk))
+			return sorted(exp_ids)
+
+	def get_exp_classes(self, arch_id):
+		# the experiment classes are the directories arch/type/params, except for the programs, or their packs
+		classes = set()
+		arch_path = get_logs_path(arch_id)
+		for et in sorted(os.listdir(arch_path)):
+			if et == "progs" or not os.path.isdir(os.path.join(arch_path, et)):
+				continue
+			for et2 in sorted(os.listdir(os.path.join(arch_path, et))):
+				if os.path.isdir(os.path.join(arch_path, et, et2)):
+					classes.add(f"{arch_id}/{et}/{et2}")
+				elif et2.endswith(exp_pack.pack_suffix) and os.path.isfile(os.path.join(arch_path, et, et2)):
+					classes.add(f"{arch_id}/{et}/{et2[:-len(exp_pack.pack_suffix)]}")
+		return sorted(classes)
+
+	def get_run_states(self, exp_class, run_id):
+		# maps exp_id of valid experiments to None (not run), False (incomplete) or True (complete)
+		query = "SELECT e.exp_id, r.complete FROM exps e LEFT JOIN runs r ON r.exp_id = e.exp_id AND r.run_id = ? WHERE e.exp_class = ? AND e.valid = 1 ORDER BY e.data_id"
+		with self._lock:
+			return dict(map(lambda x: (x[0], None if x[1] == None else x[1] == 1), self._db.execute(query, (run_id, exp_class))))
@@ -0,0 +1,151 @@
+
+import logging
+import os
+import subprocess
+import multiprocessing
+
+import experiment
+import exp_pack
+from helpers import *
+
+result_states = ["equal", "unequal", "inconclusive", "exception", "cachestate", "other", "missing"]
+
+def get_result_state(result):
+	if result == None:
+		return "missing"
+	elif result == b"true":
+		return "equal"
+	elif result == b"false":
+		return "unequal"
+	elif result.startswith(b"\"special :::: INCONCLUSIVE: "):
+		return "inconclusive"
+	elif result.startswith(b"\"embexp.board.exception :::: "):
+		return "exception"
+	elif result.startswith(b"["):
+		return "cachestate"
+	else:
+		return "other"
+
+# reads files of a commit through a single git cat-file process
+class GitBlobReader:
+	def __init__(self, repo_path, rev = "HEAD"):
+		self.rev = rev
+		self._proc = subprocess.Popen(["git", "-C", repo_path, "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+	def read(self, path):
+		self._proc.stdin.write(f"{self.rev}:./{path}\n".encode())
+		self._proc.stdin.flush()
+		header = self._proc.stdout.readline()
+		if header == b"":
+			raise Exception("git cat-file terminated unexpectedly")
+		parts = header.split()
+		if len(parts) != 3:
+			# missing or not a blob
+			return None
+		data = self._proc.stdout.read(int(parts[2]))
+		self._proc.stdout.read(1)
+		if parts[1] != b"blob":
+			return None
+		return data
+
+	def close(self):
+		self._proc.stdin.close()
+		self._proc.wait()
+
+_git_readers = {}
+def _get_git_reader(rev):
+	# one reader per worker process, logs directory and revision
+	key = (get_logs_path("."), rev)
+	if not key in _git_readers:
+		_git_readers[key] = GitBlobReader(key[0], rev)
+	return _git_readers[key]
+
+def read_result(exp_id, run_id, rev = None):
+	# the result.json of a run, from the working directory or from a commit, None if it doesn't exist
+	path = f"{exp_id}/{experiment.get_run_dir(run_id)}/result.json"
+	if rev != None:
+		return _get_git_reader(rev).read(path)
+	try:
+		return exp_pack.read_bytes(get_logs_path(path))
+	except FileNotFoundError:
+		return None
+
+def _compare_chunk(args):
+	(exp_ids, side_a, side_b) = args
+	transitions = []
+	for exp_id in exp_ids:
+		result_a = read_result(exp_id, *side_a)
+		result_b = read_result(exp_id, *side_b)
+		state_a = get_result_state(result_a)
+		state_b = get_result_state(result_b)
+		# cache states can change without a change of the state
+		changed = result_a != result_b
+		transitions.append((exp_id, state_a, state_b, changed))
+	return transitions
+
+def is_expected_transition(state_a, state_b, changed):
+	# repeated runs may only move from or to inconclusive, or vary in the recorded inconclusive output
+	if "inconclusive" in [state_a, state_b]:
+		return True
+	return state_a == state_b and state_a != "missing" and not changed
+
+class RunComparison:
+	def __init__(self, side_a, side_b):
+		# a side is a pair of run_id and git revision, None for the working directory
+		self.side_a = side_a
+		self.side_b = side_b
+		self.n_exps = 0
+		self.cells = {}
+
+	def add(self, exp_id, state_a, state_b, changed):
+		self.n_exps += 1
+		if state_a == state_b and changed and state_a != "inconclusive":
+			state_b = f"{state_b} (changed)"
+		self.cells.setdefault((state_a, state_b), []).append(exp_id)
+
+	def get_unexpected(self):
+		cells = {}
+		for ((state_a, state_b), exp_ids) in self.cells.items():
+			changed = state_b.endswith(" (changed)")
+			if not is_expected_transition(state_a, state_b.replace(" (changed)", ""), changed):
+				cells[(state_a, state_b)] = exp_ids
+		return cells
+
+	def compare(self, exp_ids, jobs = None, chunk_size = 256):
+		def iter_chunks():
+			chunk = []
+			for exp_id in exp_ids:
+				chunk.append(exp_id)
+				if len(chunk) >= chunk_size:
+					yield (chunk, self.side_a, self.side_b)
+					chunk = []
+			if len(chunk) > 0:
+				yield (chunk, self.side_a, self.side_b)
+
+		if jobs == 1:
+			results = map(_compare_chunk, iter_chunks())
+			for transitions in results:
+				for t in transitions:
+					self.add(*t)
+		else:
+			with multiprocessing.Pool(jobs) as pool:
+				for transitions in pool.imap_unordered(_compare_chunk, iter_chunks()):
+					for t in transitions:
+						self.add(*t)
+		for exp_ids in self.cells.values():
+			exp_ids.sort()
+		logging.info(f"compared {self.n_exps} experiments")
+
+	def get_matrix_str(self):
+		states_a = sorted(set(map(lambda x: x[0], self.cells)), key=lambda x: result_states.index(x))
+		states_b = sorted(set(map(lambda x: x[1], self.cells)), key=lambda x: (result_states.index(x.replace(" (changed)", "")), x))
+		width = max([len("a \\ b")] + list(map(len, states_a)))
+		colwidths = list(map(lambda x: max(len(x), 6), states_b))
+		s = "a \\ b".ljust(width) + "".join(map(lambda x: " | " + x[0].rjust(x[1]), zip(states_b, colwidths))) + "\n"
+		s += "-" * width + "".join(map(lambda x: "-+-" + "-" * x, colwidths)) + "\n"
+		for state_a in states_a:
+			s += state_a.ljust(width)
+			for (state_b, colwidth) in zip(states_b, colwidths):
+				s += " | " + str(len(self.cells.get((state_a, state_b), []))).rjust(colwidth)
+			s += "\n"
+		return s
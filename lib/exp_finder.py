@@ -2,17 +2,22 @@
 import sys
 import logging
 import time
+import collections
 
 import experiment
+import exp_catalog
+import dir_watch
 from helpers import *
 
 
+# iterates over a list or a generator, the size is None as long as it is not known
 class ExpsIterList:
 	def __init__(self, listval):
 		self.listval = listval
+		self._listval_iter = iter(listval)
 		self.iter_round = 0
 		self.iter_idx   = 0
-		self.iter_size  = len(listval)
+		self.iter_size  = len(listval) if hasattr(listval, "__len__") else None
 
 	def get_iterinfo(self):
 		return (self.iter_round, self.iter_idx, self.iter_size)
@@ -21,69 +26,86 @@ class ExpsIterList:
 		return self
 
 	def __next__(self):
+		try:
+			next_exp = self._listval_iter.__next__()
+		except StopIteration:
+			self.iter_size = self.iter_idx
+			raise
 		self.iter_idx += 1
-		return self.listval.__next__()
+		return next_exp
 
-def get_exps_from_stdin():
-	exp_list = []
+def iter_exps_from_stdin():
+	# validates each experiment only when it is reached
 	for line in sys.stdin:
 		if line.startswith("#") or line.strip() == "":
 			continue
-		exp_list.append(line.strip())
-
-	for exp_id in exp_list:
+		exp_id = line.strip()
 		exp = experiment.Experiment(exp_id)
 		if not exp.is_valid_experiment():
 			raise Exception(f"not a valid experiment: {exp_id}")
+		yield exp_id
 
-	return ExpsIterList(exp_list)
-
-def get_exps(exp_class, auto_mode = None, progplat_hash = None, board_type = None, exp_prefix = None, checkallvalid = False):
-
-	exps_dir = get_logs_path(exp_class)
-	if not os.path.isdir(exps_dir):
-		raise Exception(f"not a directory in logs: {exp_class}")
-	exp_hashes = next(os.walk(exps_dir))[1]
-
-	exp_list = map(lambda x: exp_class + "/" + x, exp_hashes)
-	exp_list1 = list(map(lambda x: experiment.Experiment(x), exp_list))
-
-	exp_list = list(filter(lambda x: x.is_valid_experiment(), exp_list1))
-	if checkallvalid:
-		assert exp_list1 == exp_list
+def get_exps_from_stdin(streaming = False):
+	if streaming:
+		return ExpsIterList(iter_exps_from_stdin())
+	return ExpsIterList(list(iter_exps_from_stdin()))
 
+def _get_auto_mode_run_id(auto_mode, progplat_hash, board_type):
 	if auto_mode == "all" or auto_mode == None:
-		pass
+		return None
 	elif auto_mode == "fix":
 		assert progplat_hash != None
 		assert board_type != None
-		run_id = experiment.get_run_id(progplat_hash, board_type)
-		exp_list = filter(lambda x: x.is_incomplete_experiment(run_id), exp_list)
+		return experiment.get_run_id(progplat_hash, board_type)
 	else:
 		raise Exception(f"unknown auto_mode: {auto_mode}")
 
-	exp_list = map(lambda x: x.get_exp_id(), exp_list)
+def iter_exps(exp_class, auto_mode = None, progplat_hash = None, board_type = None, exp_prefix = None, catalog = None):
+	# like get_exps, but yields the experiments in directory order while the catalog is refreshed
+	run_id = _get_auto_mode_run_id(auto_mode, progplat_hash, board_type)
+	if catalog == None:
+		catalog = exp_catalog.get_default_catalog()
+	for (exp_id, valid, complete_run_ids) in catalog.iter_refresh(exp_class, exp_prefix = exp_prefix):
+		if valid and (run_id == None or not run_id in complete_run_ids):
+			yield exp_id
+
+def get_exps(exp_class, auto_mode = None, progplat_hash = None, board_type = None, exp_prefix = None, checkallvalid = False, catalog = None):
+	run_id = _get_auto_mode_run_id(auto_mode, progplat_hash, board_type)
+	if catalog == None:
+		catalog = exp_catalog.get_default_catalog()
+	catalog.refresh(exp_class)
 
-	if exp_prefix != None:
-		exp_id_prefix = f"{exp_class}/{exp_prefix}"
-		exp_list = filter(lambda x: x.startswith(exp_id_prefix), exp_list)
+	if checkallvalid:
+		assert len(catalog.get_exp_ids(exp_class, valid = False, refresh = False)) == 0
 
-	return list(exp_list)
+	return catalog.get_exp_ids(exp_class, exp_prefix, incomplete_run_id = run_id, refresh = False)
 
 
+# iterates in rounds over the experiments of a class that are incomplete for a run_id,
+# new or changed experiment directories are picked up from a directory watcher instead of rescanning everything
 class ExpsIter:
-	def __init__(self, exp_class, auto_mode, progplat_hash, board_type = None, poll_max_rounds = 5, poll_round_time = 60):
+	def __init__(self, exp_class, auto_mode, progplat_hash, board_type = None, poll_max_rounds = 5, poll_round_time = 60, watch_interval = 5, catalog = None):
 		assert auto_mode == "fix"
 		self.exp_class = exp_class
 		self.auto_mode = auto_mode
 		self.progplat_hash = progplat_hash
 		self.board_type = board_type
+		self.run_id = experiment.get_run_id(progplat_hash, board_type)
 
 		self.poll_round_time = poll_round_time
 		self.poll_max_rounds = poll_max_rounds
 		if self.poll_max_rounds < 1:
 			self.poll_max_rounds = 1
-		self._exp_list_iter = iter([])
+		self.watch_interval = watch_interval
+		self._catalog = catalog if catalog != None else exp_catalog.get_default_catalog()
+		self._watcher = None
+		self._last_watch = 0
+
+		self._exp_list = collections.deque()
+		self._exp_round = set()
+		self._stream = None
+		# experiments that are not offered anymore, e.g., because the scheduler retries them itself
+		self.exclude = set()
 		self.iter_round = 0
 		self.iter_idx   = 0
 		self.iter_size  = 0
@@ -91,29 +113,89 @@ class ExpsIter:
 	def get_iterinfo(self):
 		return (self.iter_round, self.iter_idx, self.iter_size)
 
+	def _get_incomplete(self, data_ids = None):
+		return self._catalog.get_exp_ids(self.exp_class, incomplete_run_id = self.run_id, data_ids = data_ids)
+
+	def _watch_changes(self, timeout):
+		changed = self._watcher.wait(timeout)
+		self._last_watch = time.monotonic()
+		if changed == None:
+			logging.warning("directory watcher lost track of changes, rescanning everything")
+			return self._get_incomplete()
+		if len(changed) == 0:
+			return []
+		logging.info(f"directory watcher reported {len(changed)} changed experiments")
+		return self._get_incomplete(changed)
+
+	def _queue(self, exp_list):
+		for exp_id in exp_list:
+			if exp_id in self._exp_round or exp_id in self.exclude:
+				continue
+			self._exp_round.add(exp_id)
+			self._exp_list.append(exp_id)
+			if self.iter_size != None:
+				self.iter_size += 1
+
+	def _next_from_stream(self):
+		for exp_id in self._stream:
+			if not exp_id in self._exp_round and not exp_id in self.exclude:
+				self._exp_round.add(exp_id)
+				return exp_id
+		# the size of the round is known at the end of the stream
+		self._stream = None
+		self.iter_size = self.iter_idx + len(self._exp_list)
+		return None
+
 	def update_exps_list(self):
-		for i in range(self.poll_max_rounds):
-			if i > 0:
-				time.sleep(self.poll_round_time)
-			logging.warning("generating new exp_list")
-			exp_list = get_exps(self.exp_class, self.auto_mode, self.progplat_hash, self.board_type)
-			logging.warning(f"generated {len(exp_list)}")
-			if len(exp_list) > 0:
-				break
+		if self._watcher == None:
+			# start watching before the initial scan, so that nothing gets lost in between
+			self._watcher = dir_watch.get_watcher(get_logs_path(self.exp_class))
+			# the initial scan is streamed, the first experiments can run while the rest is still being checked
+			logging.warning("streaming new exp_list")
+			self._stream = iter_exps(self.exp_class, self.auto_mode, self.progplat_hash, self.board_type, catalog = self._catalog)
+			self.iter_round += 1
+			self.iter_idx   = 0
+			self.iter_size  = None
+			self._exp_round = set()
+			return
+
+		# the experiments of the last round that are still incomplete (e.g., failed runs), and whatever changed meanwhile
+		logging.warning("updating exp_list")
+		prev_data_ids = list(map(lambda x: x[len(self.exp_class) + 1:], self._exp_round))
+		exp_list = self._get_incomplete(prev_data_ids) + self._watch_changes(0)
+		# wait for new experiments as long as the polling would have done before
+		deadline = time.monotonic() + (self.poll_max_rounds - 1) * self.poll_round_time
+		while len(exp_list) == 0 and time.monotonic() < deadline:
+			exp_list = self._watch_changes(deadline - time.monotonic())
+		logging.warning(f"generated {len(exp_list)}")
 		self.iter_round += 1
 		self.iter_idx   = 0
-		self.iter_size  = len(exp_list)
-		self._exp_list_iter = iter(exp_list)
+		self.iter_size  = 0
+		self._exp_round = set()
+		self._queue(exp_list)
+
+	def is_round_done(self):
+		# the next experiment needs a new round, which may wait for new experiments
+		return len(self._exp_list) == 0 and self._stream == None
 
 	def __iter__(self):
 		return self
 
 	def __next__(self):
-		self.iter_idx += 1
-		try:
-			next_exp = self._exp_list_iter.__next__()
-		except StopIteration:
+		# queue new experiments as soon as they appear
+		if self._watcher != None and time.monotonic() - self._last_watch >= self.watch_interval:
+			self._queue(self._watch_changes(0))
+		while True:
+			if len(self._exp_list) > 0:
+				next_exp = self._exp_list.popleft()
+				break
+			if self._stream != None:
+				next_exp = self._next_from_stream()
+				if next_exp != None:
+					break
+				continue
 			self.update_exps_list()
-			next_exp = self._exp_list_iter.__next__()
+			if len(self._exp_list) == 0 and self._stream == None:
+				raise StopIteration
+		self.iter_idx += 1
 		return next_exp
-
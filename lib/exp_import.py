@@ -0,0 +1,237 @@
+
+import logging
+import os
+import shutil
+import hashlib
+import json
+import tarfile
+import time
+
+import experiment
+from helpers import *
+
+def get_file_bytes(value):
+	# file contents in json lines are strings or json values
+	if isinstance(value, str):
+		return value.encode("utf-8")
+	return json.dumps(value).encode("utf-8")
+
+def get_prog_id(prog_files):
+	return hashlib.sha1(prog_files["code.asm"]).hexdigest()
+
+def get_data_id(exp_files):
+	h = hashlib.sha1()
+	for filename in sorted(exp_files):
+		h.update(filename.encode() + b"\0" + len(exp_files[filename]).to_bytes(8, "little") + exp_files[filename])
+	return h.hexdigest()
+
+def _dir_matches(path, files):
+	if sorted(os.listdir(path)) != sorted(files):
+		return False
+	for filename in files:
+		with open(os.path.join(path, filename), "rb") as f:
+			if f.read() != files[filename]:
+				return False
+	return True
+
+# imports many experiments and their programs at once, every experiment and program directory
+# is written to a temporary directory and renamed into place, with hardlinks identical files are linked,
+# the linked files are shared between all directories that contain them
+class ExpImporter:
+	def __init__(self, hardlinks = False, batch_size = 256):
+		self.hardlinks = hardlinks
+		self.batch_size = batch_size
+		self.temp_path = get_logs_path(f".cache/import.{os.getpid()}")
+		# sha256 -> path of a written file with this content
+		self._payloads = {}
+		self._progs_done = set()
+		self._batch = []
+		# logs path -> files of the directories in the batch
+		self._batch_dirs = {}
+		self.n_exps = 0
+		self.n_exps_existing = 0
+		self.n_progs = 0
+		self.n_progs_existing = 0
+		self.n_files = 0
+		self.n_links = 0
+		self.n_bytes = 0
+		self._start_time = time.monotonic()
+
+	def _write_file(self, filepath, data):
+		digest = hashlib.sha256(data).digest()
+		linkpath = self._payloads.get(digest) if self.hardlinks else None
+		if linkpath != None:
+			try:
+				os.link(linkpath, filepath)
+				self.n_links += 1
+				return
+			except OSError:
+				pass
+		with open(filepath, "wb") as f:
+			f.write(data)
+		self.n_files += 1
+		self.n_bytes += len(data)
+		self._payloads[digest] = filepath
+
+	def _write_dir(self, path, files):
+		# returns False if the directory already exists with the same files
+		if os.path.isdir(path):
+			if not _dir_matches(path, files):
+				raise Exception(f"directory exists with different content: {path}")
+			return False
+		temp_dir = os.path.join(self.temp_path, os.path.basename(path))
+		os.makedirs(temp_dir)
+		for (filename, data) in files.items():
+			self._write_file(os.path.join(temp_dir, filename), data)
+		parent = os.path.dirname(path)
+		if not os.path.isdir(parent):
+			os.makedirs(parent, exist_ok=True)
+		try:
+			os.rename(temp_dir, path)
+		except OSError:
+			# created concurrently
+			shutil.rmtree(temp_dir)
+			if not _dir_matches(path, files):
+				raise Exception(f"directory exists with different content: {path}")
+			return False
+		# the renamed files are the new link targets
+		for filename in files:
+			digest = hashlib.sha256(files[filename]).digest()
+			if self._payloads.get(digest) == os.path.join(temp_dir, filename):
+				self._payloads[digest] = os.path.join(path, filename)
+		return True
+
+	def add(self, exp_id, exp_files, prog_files = None):
+		# exp_files and prog_files map filenames to bytes,
+		# without code.hash the program id is the hash of the program
+		exp_id_parts = exp_id.split("/")
+		assert len(exp_id_parts) == 4
+		if not "code.hash" in exp_files:
+			assert prog_files != None
+			exp_files = dict(exp_files)
+			exp_files["code.hash"] = f"{get_prog_id(prog_files)}\n".encode()
+		prog_id = exp_files["code.hash"].decode().strip()
+		self._batch.append((exp_id, exp_files, prog_id, prog_files))
+		self._batch_dirs[exp_id] = exp_files
+		if prog_files != None:
+			self._batch_dirs[f"{exp_id_parts[0]}/progs/{prog_id}"] = prog_files
+		if len(self._batch) >= self.batch_size:
+			self.flush()
+
+	def flush(self):
+		batch = self._batch
+		self._batch = []
+		self._batch_dirs = {}
+		if len(batch) == 0:
+			return
+		# the programs first, so that the experiments are complete as soon as they appear
+		for (exp_id, exp_files, prog_id, prog_files) in batch:
+			if prog_files == None or prog_id in self._progs_done:
+				continue
+			arch_id = exp_id.split("/")[0]
+			if self._write_dir(get_logs_path(f"{arch_id}/progs/{prog_id}"), prog_files):
+				self.n_progs += 1
+			else:
+				self.n_progs_existing += 1
+			self._progs_done.add(prog_id)
+		for (exp_id, exp_files, prog_id, prog_files) in batch:
+			if self._write_dir(get_logs_path(exp_id), exp_files):
+				self.n_exps += 1
+			else:
+				self.n_exps_existing += 1
+		logging.info(self.get_stats_str())
+
+	def close(self):
+		self.flush()
+		if os.path.isdir(self.temp_path):
+			shutil.rmtree(self.temp_path)
+
+	def get_stats_str(self):
+		duration = time.monotonic() - self._start_time
+		n_total = self.n_exps + self.n_exps_existing
+		rate = n_total / duration if duration > 0 else 0
+		s  = f"{self.n_exps} new experiments, {self.n_exps_existing} already present, "
+		s += f"{self.n_progs} new programs, {self.n_progs_existing} already present, "
+		s += f"{self.n_files} files written ({self.n_bytes} bytes), {self.n_links} hardlinked, "
+		s += f"{duration:.1f}s, {rate:.0f} experiments/s"
+		return s
+
+	def import_jsonl(self, f):
+		# one experiment per line:
+		# {"exp_id": ..., "files": {"input1.json": ..., ...}, "prog": {"code.asm": ..., ...}}
+		# exp_class can be given instead of exp_id, the data_id is then the hash of the files
+		for line in f:
+			line = line.strip()
+			if line == "":
+				continue
+			d = json.loads(line)
+			exp_files = dict(map(lambda x: (x[0], get_file_bytes(x[1])), d["files"].items()))
+			prog_files = None
+			if "prog" in d:
+				prog_files = dict(map(lambda x: (x[0], get_file_bytes(x[1])), d["prog"].items()))
+			if "exp_id" in d:
+				exp_id = d["exp_id"]
+			else:
+				if prog_files != None and not "code.hash" in exp_files:
+					exp_files["code.hash"] = f"{get_prog_id(prog_files)}\n".encode()
+				exp_id = f"{d['exp_class']}/{get_data_id(exp_files)}"
+			self.add(exp_id, exp_files, prog_files)
+
+	def import_tar(self, fileobj):
+		# a stream of files with paths as in the logs, arch/progs/prog_id/file and arch/type/params/data_id/file,
+		# the files of a directory have to be next to each other in the stream
+		prog_dirs = {}
+		current = None
+		current_files = None
+		def add_current():
+			if current == None:
+				return
+			prog_id = current_files["code.hash"].decode().strip()
+			prog_files = prog_dirs.pop(f"{current.split('/')[0]}/progs/{prog_id}", None)
+			self.add(current, current_files, prog_files)
+		def check_path(name):
+			path = os.path.normpath(name)
+			parts = path.split("/")
+			if path.startswith("..") or os.path.isabs(path) or not len(parts) in [4, 5]:
+				raise Exception(f"unexpected path in tar: {name}")
+			return (path, parts)
+		def read_link_target(name):
+			# hardlinks refer to a file earlier in the stream, which is still pending or already imported
+			(path, parts) = check_path(name)
+			(dirpath, filename) = ("/".join(parts[:-1]), parts[-1])
+			if dirpath == current:
+				return current_files[filename]
+			if dirpath in prog_dirs:
+				return prog_dirs[dirpath][filename]
+			if dirpath in self._batch_dirs:
+				return self._batch_dirs[dirpath][filename]
+			with open(get_logs_path(path), "rb") as f:
+				return f.read()
+		with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+			for member in tar:
+				if member.isfile():
+					(path, parts) = check_path(member.name)
+					data = tar.extractfile(member).read()
+				elif member.islnk():
+					(path, parts) = check_path(member.name)
+					data = read_link_target(member.linkname)
+				else:
+					continue
+				if parts[1] == "progs":
+					assert len(parts) == 4
+					prog_dirs.setdefault("/".join(parts[:3]), {})[parts[3]] = data
+					continue
+				assert len(parts) == 5
+				exp_id = "/".join(parts[:4])
+				if exp_id != current:
+					add_current()
+					current = exp_id
+					current_files = {}
+				current_files[parts[4]] = data
+			add_current()
+		# programs without experiments in this stream
+		for (prog_path, prog_files) in prog_dirs.items():
+			if self._write_dir(get_logs_path(prog_path), prog_files):
+				self.n_progs += 1
+			else:
+				self.n_progs_existing += 1
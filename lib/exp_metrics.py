@@ -0,0 +1,177 @@
+
+import logging
+import os
+import sys
+import json
+import time
+import threading
+import collections
+
+from helpers import *
+
+slot_states = ["idle", "preparing", "running", "quarantined", "retired", "done"]
+
+def format_duration(seconds):
+	if seconds == None:
+		return "?"
+	seconds = int(seconds)
+	if seconds >= 86400:
+		return f"{seconds // 86400}d{(seconds % 86400) // 3600}h"
+	if seconds >= 3600:
+		return f"{seconds // 3600}h{(seconds % 3600) // 60}m"
+	if seconds >= 60:
+		return f"{seconds // 60}m{seconds % 60}s"
+	return f"{seconds}s"
+
+# counters of a batch and the events of the last window for the rates, updated by the scheduler,
+# get_remaining is set to a function that returns the number of experiments still to run, or None if unknown
+class BatchMetrics:
+	def __init__(self, num_slots, window = 3600):
+		self.window = window
+		self.get_remaining = lambda: None
+		self.run_id = None
+
+		self._lock = threading.Lock()
+		self._start_time = time.monotonic()
+		self.counts = dict(map(lambda x: (x, 0), ["done", "interesting", "board_exception", "failed", "given_up"]))
+		# (time, kind) of the events in the window
+		self._events = collections.deque()
+		self._slots = list(map(lambda x: ("idle", None, self._start_time), range(num_slots)))
+
+	def _add_event(self, kind):
+		now = time.monotonic()
+		self.counts[kind] += 1
+		self._events.append((now, kind))
+		while self._events[0][0] < now - self.window:
+			self._events.popleft()
+
+	def add_result(self, run_id, result_val):
+		with self._lock:
+			self.run_id = run_id
+			self._add_event("done")
+			if result_val != True:
+				self._add_event("interesting")
+			if is_board_exception_result(result_val):
+				self._add_event("board_exception")
+
+	def add_failure(self, given_up):
+		with self._lock:
+			self._add_event("failed")
+			if given_up:
+				self._add_event("given_up")
+
+	def set_slot(self, slot, state, exp_id = None):
+		assert state in slot_states
+		with self._lock:
+			if self._slots[slot][0] != state or self._slots[slot][1] != exp_id:
+				self._slots[slot] = (state, exp_id, time.monotonic())
+
+	def get_status(self):
+		now = time.monotonic()
+		remaining = self.get_remaining()
+		with self._lock:
+			while len(self._events) > 0 and self._events[0][0] < now - self.window:
+				self._events.popleft()
+			window_counts = dict(map(lambda x: (x, 0), self.counts))
+			for (t, kind) in self._events:
+				window_counts[kind] += 1
+			uptime = now - self._start_time
+			window = min(self.window, uptime)
+			rate = window_counts["done"] / window if window > 0 else 0
+			eta = remaining / rate if remaining != None and rate > 0 else None
+			slots = list(map(lambda x: {"slot": x[0], "state": x[1][0], "exp_id": x[1][1], "for": round(now - x[1][2], 1)}, enumerate(self._slots)))
+			return {
+				"time": round(time.time()),
+				"run_id": self.run_id,
+				"uptime": round(uptime, 1),
+				"counts": dict(self.counts),
+				"window": self.window,
+				"window_counts": window_counts,
+				"per_hour": round(rate * 3600, 1),
+				"remaining": remaining,
+				"eta": None if eta == None else round(eta),
+				"slots": slots,
+			}
+
+def get_status_line(status):
+	counts = status["counts"]
+	s  = f"### {counts['done']} done ({counts['interesting']} interesting, {counts['failed']} failed runs, {counts['given_up']} given up)"
+	s += f", {status['per_hour']}/h"
+	s += f", {'?' if status['remaining'] == None else status['remaining']} left, ETA {format_duration(status['eta'])}"
+	s += " |" + "".join(map(lambda x: f" b{x['slot']}: {x['state']} {format_duration(x['for'])}", status["slots"]))
+	return s
+
+def get_prometheus_text(status):
+	s = ""
+	def add(name, metric_type, help_str, samples):
+		nonlocal s
+		s += f"# HELP embexp_{name} {help_str}\n"
+		s += f"# TYPE embexp_{name} {metric_type}\n"
+		for (labels, val) in samples:
+			labels_str = "" if len(labels) == 0 else "{" + ",".join(map(lambda x: f'{x[0]}="{x[1]}"', labels)) + "}"
+			s += f"embexp_{name}{labels_str} {val}\n"
+	add("experiments_total", "counter", "Experiment runs of this batch by outcome.", map(lambda x: ([("outcome", x[0])], x[1]), status["counts"].items()))
+	add("experiments_window", "gauge", f"Experiment runs of the last {status['window']} seconds by outcome.", map(lambda x: ([("outcome", x[0])], x[1]), status["window_counts"].items()))
+	add("experiments_per_hour", "gauge", "Completed experiments per hour over the window.", [([], status["per_hour"])])
+	if status["remaining"] != None:
+		add("experiments_remaining", "gauge", "Experiments still to run.", [([], status["remaining"])])
+	if status["eta"] != None:
+		add("eta_seconds", "gauge", "Estimated time until all remaining experiments have run.", [([], status["eta"])])
+	add("uptime_seconds", "gauge", "Time since the start of the batch.", [([], status["uptime"])])
+	samples = []
+	for slot in status["slots"]:
+		for state in slot_states:
+			samples.append(([("slot", slot["slot"]), ("state", state)], 1 if slot["state"] == state else 0))
+	add("board_state", "gauge", "State of the board slots.", samples)
+	return s
+
+# rewrites the status file periodically, as json or, with the extension .prom, for the textfile collector of the prometheus
+# node exporter, and shows a status line on stderr
+class MetricsWriter:
+	def __init__(self, metrics, status_path = None, dashboard = False, interval = 10):
+		self.metrics = metrics
+		self.status_path = status_path
+		self.dashboard = dashboard
+		self.interval = interval
+		self._stop = threading.Event()
+		self._thread = None
+
+	def write(self):
+		status = self.metrics.get_status()
+		if self.status_path != None:
+			if self.status_path.endswith(".prom"):
+				data = get_prometheus_text(status)
+			else:
+				data = json.dumps(status, indent=2) + "\n"
+			# the readers never see a partial file
+			temp_path = f"{self.status_path}.tmp.{os.getpid()}"
+			with open(temp_path, "w") as f:
+				f.write(data)
+			os.replace(temp_path, self.status_path)
+		if self.dashboard:
+			line = get_status_line(status)
+			if sys.stderr.isatty():
+				sys.stderr.write("\r\033[K" + line)
+			else:
+				sys.stderr.write(line + "\n")
+			sys.stderr.flush()
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			try:
+				self.write()
+			except Exception as e:
+				logging.warning(f"could not write the metrics: {e}")
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread != None:
+			self._thread.join()
+		# the final state
+		self.write()
+		if self.dashboard and sys.stderr.isatty():
+			sys.stderr.write("\n")
@@ -0,0 +1,242 @@
+
+import logging
+import os
+import io
+import mmap
+import json
+import struct
+import shutil
+import hashlib
+import threading
+
+from helpers import *
+
+# a pack holds all files of an experiment class in a single file next to the class directory,
+# e.g. arm8/exps2/cache_multiw.pack for arm8/exps2/cache_multiw:
+# header (magic, version, index offset, index size), the file contents, deduplicated, and a json index
+# that maps the paths relative to the class directory to (offset, size) and lists the empty directories,
+# in version 1 the index only has the files.
+# the programs in arm8/progs are not in a class directory and can't be packed
+pack_magic = b"EXPK"
+pack_header = struct.Struct("<4sIQQ")
+pack_suffix = ".pack"
+
+class ExpPack:
+	def __init__(self, pack_path):
+		self.pack_path = pack_path
+		with open(pack_path, "rb") as f:
+			st = os.fstat(f.fileno())
+			self.mtime_ns = st.st_mtime_ns
+			self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		(magic, version, index_offset, index_size) = pack_header.unpack_from(self._mm, 0)
+		if magic != pack_magic or not version in [1, 2]:
+			raise Exception(f"not an experiment pack: {pack_path}")
+		index = json.loads(bytes(self._mm[index_offset:index_offset + index_size]))
+		if version == 1:
+			index = {"files": index, "dirs": []}
+		self.files = index["files"]
+		self.empty_dirs = index["dirs"]
+		# directory -> entries, the other directories are implied by the file paths
+		self.dirs = {"": set()}
+		for path in list(self.files) + self.empty_dirs:
+			parts = path.split("/")
+			for i in range(len(parts)):
+				d = "/".join(parts[:i])
+				self.dirs.setdefault(d, set()).add(parts[i])
+		for path in self.empty_dirs:
+			self.dirs.setdefault(path, set())
+
+	def isfile(self, relpath):
+		return relpath in self.files
+
+	def isdir(self, relpath):
+		return relpath in self.dirs
+
+	def listdir(self, relpath):
+		if not relpath in self.dirs:
+			raise FileNotFoundError(f"{self.pack_path}:{relpath}")
+		return sorted(self.dirs[relpath])
+
+	def get_buffer(self, relpath):
+		if not relpath in self.files:
+			raise FileNotFoundError(f"{self.pack_path}:{relpath}")
+		(offset, size) = self.files[relpath]
+		return memoryview(self._mm)[offset:offset + size]
+
+	def read(self, relpath):
+		return bytes(self.get_buffer(relpath))
+
+def write_pack(pack_path, class_path):
+	# writes the pack to a temporary file that is renamed into place
+	temp_path = f"{pack_path}.tmp.{os.getpid()}"
+	files = {}
+	empty_dirs = []
+	blobs = {}
+	n_bytes = 0
+	with open(temp_path, "wb") as f:
+		f.write(pack_header.pack(pack_magic, 2, 0, 0))
+		offset = pack_header.size
+		for (root, dirs, filenames) in os.walk(class_path):
+			dirs.sort()
+			# e.g. the directory of a run that has been interrupted
+			if len(dirs) == 0 and len(filenames) == 0 and root != class_path:
+				empty_dirs.append(os.path.relpath(root, class_path))
+			for filename in sorted(filenames):
+				filepath = os.path.join(root, filename)
+				relpath = os.path.relpath(filepath, class_path)
+				with open(filepath, "rb") as f_in:
+					data = f_in.read()
+				digest = hashlib.sha256(data).digest()
+				if not digest in blobs:
+					f.write(data)
+					blobs[digest] = (offset, len(data))
+					offset += len(data)
+					n_bytes += len(data)
+				files[relpath] = blobs[digest]
+		index = json.dumps({"files": files, "dirs": empty_dirs}, separators=(",", ":")).encode()
+		f.write(index)
+		f.seek(0)
+		f.write(pack_header.pack(pack_magic, 2, offset, len(index)))
+	os.rename(temp_path, pack_path)
+	logging.info(f"packed {len(files)} files ({len(blobs)} distinct, {n_bytes} bytes) into {pack_path}")
+	return len(files)
+
+def unpack_pack(pack_path, class_path):
+	pack = ExpPack(pack_path)
+	temp_path = f"{class_path}.tmp.{os.getpid()}"
+	for (relpath, (offset, size)) in pack.files.items():
+		filepath = os.path.join(temp_path, relpath)
+		os.makedirs(os.path.dirname(filepath), exist_ok=True)
+		with open(filepath, "wb") as f:
+			f.write(pack.get_buffer(relpath))
+	for relpath in pack.empty_dirs:
+		os.makedirs(os.path.join(temp_path, relpath), exist_ok=True)
+	os.rename(temp_path, class_path)
+	return len(pack.files)
+
+# overlay of the logs in the file system and the packs, used by Experiment and the scans,
+# the file system takes precedence
+_packs = {}
+_packs_lock = threading.Lock()
+
+def get_class_pack_path(exp_class):
+	return get_logs_path(exp_class + pack_suffix)
+
+def _get_pack(pack_path):
+	try:
+		mtime_ns = os.stat(pack_path).st_mtime_ns
+	except FileNotFoundError:
+		return None
+	with _packs_lock:
+		pack = _packs.get(pack_path)
+		if pack == None or pack.mtime_ns != mtime_ns:
+			pack = ExpPack(pack_path)
+			_packs[pack_path] = pack
+		return pack
+
+def _resolve(path):
+	# (pack, path in pack) for a normalized path below a packed class directory, or (None, None)
+	relpath = os.path.relpath(path, get_logs_path("."))
+	parts = relpath.split(os.sep)
+	if len(parts) < 3 or parts[0] == "..":
+		return (None, None)
+	pack = _get_pack(get_logs_path(os.path.join(*parts[:3])) + pack_suffix)
+	if pack == None:
+		return (None, None)
+	return (pack, "/".join(parts[3:]))
+
+def isfile(path):
+	path = os.path.normpath(path)
+	if os.path.isfile(path):
+		return True
+	(pack, relpath) = _resolve(path)
+	return pack != None and pack.isfile(relpath)
+
+def isdir(path):
+	path = os.path.normpath(path)
+	if os.path.isdir(path):
+		return True
+	(pack, relpath) = _resolve(path)
+	return pack != None and pack.isdir(relpath)
+
+def listdir(path):
+	path = os.path.normpath(path)
+	if os.path.isdir(path):
+		return os.listdir(path)
+	(pack, relpath) = _resolve(path)
+	if pack == None:
+		raise FileNotFoundError(path)
+	return pack.listdir(relpath)
+
+def get_mtime_ns(path):
+	# files in packs have the modification time of the pack
+	path = os.path.normpath(path)
+	try:
+		return os.stat(path).st_mtime_ns
+	except FileNotFoundError:
+		(pack, relpath) = _resolve(path)
+		if pack == None or not (pack.isfile(relpath) or pack.isdir(relpath)):
+			raise
+		return pack.mtime_ns
+
+def get_file_key(path):
+	# changes with the file: (mtime, size) in the file system, (pack, mtime) for files in packs
+	path = os.path.normpath(path)
+	try:
+		st = os.stat(path)
+		return (st.st_mtime_ns, st.st_size)
+	except FileNotFoundError:
+		(pack, relpath) = _resolve(path)
+		if pack == None or not pack.isfile(relpath):
+			raise
+		return (pack.pack_path, pack.mtime_ns)
+
+def read_bytes(path):
+	path = os.path.normpath(path)
+	try:
+		with open(path, "rb") as f:
+			return f.read()
+	except FileNotFoundError:
+		(pack, relpath) = _resolve(path)
+		if pack == None:
+			raise
+		return pack.read(relpath)
+
+def open_text(path):
+	path = os.path.normpath(path)
+	try:
+		return open(path, "r")
+	except FileNotFoundError:
+		(pack, relpath) = _resolve(path)
+		if pack == None:
+			raise
+		return io.StringIO(pack.read(relpath).decode())
+
+def get_buffer(path):
+	# read-only buffer of the file contents, mapped if possible
+	path = os.path.normpath(path)
+	try:
+		with open(path, "rb") as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				return memoryview(b"")
+			return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+	except FileNotFoundError:
+		(pack, relpath) = _resolve(path)
+		if pack == None:
+			raise
+		return pack.get_buffer(relpath)
+
+def scandir_dirs(path):
+	# (name, path, mtime_ns) of the subdirectories
+	path = os.path.normpath(path)
+	if os.path.isdir(path):
+		for entry in os.scandir(path):
+			if entry.is_dir():
+				yield (entry.name, entry.path, entry.stat().st_mtime_ns)
+		return
+	(pack, relpath) = _resolve(path)
+	if pack == None:
+		raise FileNotFoundError(path)
+	for name in pack.listdir(relpath):
+		if pack.isdir(f"{relpath}/{name}" if relpath != "" else name):
+			yield (name, os.path.join(path, name), pack.mtime_ns)
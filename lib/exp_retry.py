@@ -0,0 +1,153 @@
+
+import logging
+import os
+import heapq
+import time
+
+from helpers import *
+
+# failures that may not happen again on the next attempt and that indicate a problem with the board
+# rather than with the experiment, build errors and other errors are deterministic
+transient_categories = ["run", "timeout", "parse"]
+
+# failed experiments wait with exponential backoff for another attempt, up to max_attempts in total
+class RetryQueue:
+	def __init__(self, max_attempts = 3, backoff = 30, backoff_max = 600):
+		assert max_attempts >= 1
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.backoff_max = backoff_max
+
+		# (due time, sequence number, exp_id)
+		self._heap = []
+		self._seq = 0
+		self._pending = set()
+		# exp_id -> number of failed attempts, as long as the experiment is not done
+		self.attempts = {}
+		# exp_id -> category of the last failure
+		self.given_up = {}
+		self.n_retries = 0
+		self.counts = dict(map(lambda x: (x, 0), failure_categories))
+
+	def __len__(self):
+		return len(self._heap)
+
+	def is_owned(self, exp_id):
+		# the experiment is waiting for a retry or has been given up
+		return exp_id in self._pending or exp_id in self.given_up
+
+	def get_attempt(self, exp_id):
+		# the number of the next attempt
+		return self.attempts.get(exp_id, 0) + 1
+
+	def count(self, category):
+		self.counts[category] += 1
+
+	def add_success(self, exp_id):
+		self.attempts.pop(exp_id, None)
+
+	def add_failure(self, exp_id, category):
+		# returns the delay until the next attempt, or None if the experiment is given up
+		self.count(category)
+		n = self.attempts.get(exp_id, 0) + 1
+		self.attempts[exp_id] = n
+		if not category in transient_categories or n >= self.max_attempts:
+			self.attempts.pop(exp_id)
+			self.given_up[exp_id] = category
+			return None
+		delay = min(self.backoff * 2 ** (n - 1), self.backoff_max)
+		heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, exp_id))
+		self._seq += 1
+		self._pending.add(exp_id)
+		return delay
+
+	def requeue(self, exp_id):
+		# an experiment that could not be run, e.g., on a board slot that has been retired, is due again right away
+		heapq.heappush(self._heap, (time.monotonic(), self._seq, exp_id))
+		self._seq += 1
+		self._pending.add(exp_id)
+
+	def get_wait_time(self):
+		# seconds until the next retry is due, None if there is none
+		if len(self._heap) == 0:
+			return None
+		return max(0, self._heap[0][0] - time.monotonic())
+
+	def pop_due(self, exp_dir = None):
+		# the next experiment that is due, only if it is in the directory exp_dir if given
+		if len(self._heap) == 0 or self._heap[0][0] > time.monotonic():
+			return None
+		exp_id = self._heap[0][2]
+		if exp_dir != None and os.path.dirname(exp_id) != exp_dir:
+			return None
+		heapq.heappop(self._heap)
+		self._pending.remove(exp_id)
+		self.n_retries += 1
+		return exp_id
+
+	def get_summary_str(self):
+		counts_str = ", ".join(map(lambda x: f"{x}={self.counts[x]}", filter(lambda x: self.counts[x] > 0, failure_categories)))
+		s  = f"failures: {counts_str if counts_str != '' else 'none'}\n"
+		s += f"retries: {self.n_retries}, given up: {len(self.given_up)}, still waiting: {len(self._heap)}"
+		return s
+
+# consecutive board failures of a slot lead to a reset of the board and then to a quarantine,
+# during which the slot takes no experiments, a slot that has been quarantined too often is retired,
+# each of these steps is off if its count is None
+class BoardHealth:
+	def __init__(self, slot, reset_after = None, quarantine_after = None, quarantine_time = 300, max_quarantines = None):
+		assert reset_after == None or reset_after >= 1
+		assert quarantine_after == None or quarantine_after >= 1
+		self.slot = slot
+		self.reset_after = reset_after
+		self.quarantine_after = quarantine_after
+		self.quarantine_time = quarantine_time
+		self.max_quarantines = max_quarantines
+
+		self.n_consecutive = 0
+		self.n_resets = 0
+		self.n_quarantines = 0
+		self.quarantined_until = None
+		self.retired = False
+		self._reset_pending = False
+
+	def report_success(self):
+		self.n_consecutive = 0
+
+	def report_failure(self, category):
+		if not category in transient_categories:
+			return
+		self.n_consecutive += 1
+		if self.quarantine_after != None and self.n_consecutive >= self.quarantine_after:
+			self.n_consecutive = 0
+			self._reset_pending = True
+			self.n_quarantines += 1
+			if self.max_quarantines != None and self.n_quarantines > self.max_quarantines:
+				logging.error(f"board slot {self.slot} failed too often, not using it anymore")
+				self.retired = True
+				return
+			# each quarantine lasts twice as long as the previous one
+			duration = self.quarantine_time * 2 ** (self.n_quarantines - 1)
+			logging.warning(f"board slot {self.slot} quarantined for {duration}s after {self.quarantine_after} consecutive failures")
+			self.quarantined_until = time.monotonic() + duration
+		elif self.reset_after != None and self.n_consecutive % self.reset_after == 0:
+			logging.warning(f"resetting board of slot {self.slot} after {self.n_consecutive} consecutive failures")
+			self._reset_pending = True
+
+	def take_reset(self):
+		# whether the board should be reset before the next run
+		reset_pending = self._reset_pending
+		self._reset_pending = False
+		if reset_pending:
+			self.n_resets += 1
+		return reset_pending
+
+	def get_quarantine_time(self):
+		# seconds of quarantine left
+		if self.quarantined_until == None:
+			return 0
+		t = self.quarantined_until - time.monotonic()
+		if t <= 0:
+			self.quarantined_until = None
+			return 0
+		return t
@@ -1,18 +1,19 @@
 
 import logging
+import os
 import json
 
 import experiment
+import exp_pack
 import progplatform
+import exp_trace
 from helpers import *
 
-def run_experiment(exp_id, progplat = None, board_type = None, branchname = None, conn_mode = None, force_cleanup = None, force_results = False, no_cleanup = False, printeval = False, ignoremismatch = False, write_results = True):
-	logging.info(f"{(exp_id, progplat, board_type, branchname, conn_mode, force_cleanup, force_results, no_cleanup, printeval, ignoremismatch, write_results)}")
-	if progplat == None:
-		progplat = progplatform.get_embexp_ProgPlatform(None)
-
-	exp = experiment.Experiment(exp_id)
+# repetitions of the experiment programs on the board (__PROGPLAT_MUL_RUNS__), in the adaptive mode a list of counts is given
+# and pair experiments run again with the next count as long as they are unequal or inconclusive
+default_mul_runs = 10
 
+def _check_experiment(exp, board_type):
 	# defaults
 	if board_type == None:
 		if exp.get_exp_arch() == "arm8":
@@ -27,61 +28,152 @@ def run_experiment(exp_id, progplat = None, board_type = None, branchname = None
 	# can only handle exps1 and exps2
 	exp_type = exp.get_exp_type()
 	assert exp_type == "exps2" or exp_type == "exps1"
+	return board_type
+
+def evaluate_uart_experiment(exp_type, uartlogdata_bin, board_type):
+	# interpret the experiment result
+	with exp_trace.stage("parse"):
+		try:
+			uartlogdata_lines = list(map(lambda l: l.decode(), uartlogdata_bin.split(b'\n')))
+			if exp_type == "exps2":
+				result_val = eval_uart_pair_cache_experiment(uartlogdata_lines)
+			elif exp_type == "exps1":
+				result_val = parse_uart_single_cache_experiment(uartlogdata_lines, board_type)
+				# if the result is no board exception, convert to the sets with valid lines
+				if not isinstance(result_val, str):
+					result_val = result_val.to_json_sets()
+			else:
+				raise Exception(f"unknown experiment type: {exp_type}")
+		except (KeyboardInterrupt, ExpFailure):
+			raise
+		except Exception as e:
+			raise ExpFailure("parse", str(e))
+	result = json.dumps(result_val)
+	return (result_val, result)
+
+def needs_more_runs(exp_type, result_val):
+	if exp_type != "exps2":
+		return False
+	return result_val == False or (isinstance(result_val, str) and result_val.startswith("special :::: INCONCLUSIVE: "))
+
+def rerun_with_more_runs(progplat, exp, board_type, conn_mode, mul_runs, uartlogdata_bin):
+	# the experiment has been run with the first count of mul_runs, runs it again with the next counts
+	# as long as the result needs more runs, returns the last output and its count
+	num_mul_runs = mul_runs[0]
+	for next_mul_runs in mul_runs[1:]:
+		(result_val, result) = evaluate_uart_experiment(exp.get_exp_type(), uartlogdata_bin, board_type)
+		if not needs_more_runs(exp.get_exp_type(), result_val):
+			break
+		logging.info(f"running experiment again with {next_mul_runs} instead of {num_mul_runs} repetitions, result was: {result}")
+		progplat.configure_experiment(board_type, exp, next_mul_runs)
+		uartlogdata_bin = progplat.run_experiment(conn_mode)
+		num_mul_runs = next_mul_runs
+	return (uartlogdata_bin, num_mul_runs)
+
+def _check_mul_runs(exp, run_id, num_mul_runs, force_results):
+	# results are only compared to recorded ones with the same repetition count, runs without a recorded count
+	# have the default one, with force_results a stale record is removed
+	run_dir = experiment.get_run_dir(run_id)
+	if not exp_pack.isfile(exp.get_path(f"{run_dir}/result.json")):
+		return
+	if force_results:
+		mul_runs_path = exp.get_path(f"{run_dir}/mul_runs.json")
+		if num_mul_runs == None and os.path.isfile(mul_runs_path):
+			os.remove(mul_runs_path)
+		return
+	recorded_mul_runs = exp.get_mul_runs(run_id)
+	recorded_mul_runs = default_mul_runs if recorded_mul_runs == None else recorded_mul_runs
+	num_mul_runs = default_mul_runs if num_mul_runs == None else num_mul_runs
+	if recorded_mul_runs != num_mul_runs:
+		raise Exception(f"the result has been recorded with {recorded_mul_runs} repetitions, not {num_mul_runs}: {exp.get_exp_id()} {run_id}")
+
+def write_experiment_results(exp, run_id, uartlogdata_bin, result, force_results, num_mul_runs = None):
+	logging.info(f"saving experiment data")
+	# TODO: with reset the output format could be: output1/2_uart.log and result_rst.json
+	with exp_trace.stage("write_results"):
+		_check_mul_runs(exp, run_id, num_mul_runs, force_results)
+		outputs = []
+		outputs.append(("output_uart.log", uartlogdata_bin))
+		outputs.append(("result.json",     result.encode('utf-8')))
+		# the repetition count is only recorded if it has been chosen
+		if num_mul_runs != None:
+			outputs.append(("mul_runs.json", json.dumps({"mul_runs": num_mul_runs}).encode('utf-8')))
+		return exp.write_results(run_id, outputs, force_results)
+
+def prepare_experiment(exp_id, progplat, board_type = None, branchname = None, force_cleanup = None, build = False, num_mul_runs = default_mul_runs):
+	# the host side before running an experiment: cleanup, code generation and optionally the build,
+	# returns the experiment and the board type
+	exp_trace.set_exp(exp_id)
+	exp = experiment.Experiment(exp_id)
+	board_type = _check_experiment(exp, board_type)
+	with exp_trace.stage("clean"):
+		progplat.check_clean(force_cleanup)
+	if branchname == None:
+		branchname = progplatform.get_default_branch(board_type)
+	with exp_trace.stage("checkout"):
+		progplat.change_branch(branchname)
+
+	logging.info(f"generating experiment code")
+	progplat.configure_experiment(board_type, exp, num_mul_runs)
+	if build:
+		logging.info(f"building experiment")
+		progplat.build()
+	return (exp, board_type)
+
+def finish_experiment(exp, run_id, board_type, uartlogdata_bin, force_results = False, ignoremismatch = False, write_results = True, num_mul_runs = None):
+	# the host side after running an experiment, independent of the ProgPlatform working copy
+	exp_trace.set_exp(exp.get_exp_id())
+	(result_val, result) = evaluate_uart_experiment(exp.get_exp_type(), uartlogdata_bin, board_type)
+	if write_results:
+		nomismatches = write_experiment_results(exp, run_id, uartlogdata_bin, result, force_results, num_mul_runs)
+		if not nomismatches and not force_results and not ignoremismatch:
+			raise Exception("the output files differ")
+	return result_val
+
+def run_experiment(exp_id, progplat = None, board_type = None, branchname = None, conn_mode = None, force_cleanup = None, force_results = False, no_cleanup = False, printeval = False, ignoremismatch = False, write_results = True, mul_runs = None):
+	# mul_runs is a list of repetition counts for the adaptive mode, the fixed default count is used and not recorded without it
+	logging.info(f"{(exp_id, progplat, board_type, branchname, conn_mode, force_cleanup, force_results, no_cleanup, printeval, ignoremismatch, write_results, mul_runs)}")
+	if progplat == None:
+		progplat = progplatform.get_embexp_ProgPlatform(None)
+	exp_trace.set_exp(exp_id)
+
+	exp = experiment.Experiment(exp_id)
+	board_type = _check_experiment(exp, board_type)
+	exp_type = exp.get_exp_type()
 
 	# make sure that progplatform is clean
 	# ======================================
-	progplat.check_clean(force_cleanup)
+	with exp_trace.stage("clean"):
+		progplat.check_clean(force_cleanup)
 
 	# change to corresponding branch
 	# ======================================
 	if branchname == None:
 		branchname = progplatform.get_default_branch(board_type)
-	progplat.change_branch(branchname)
+	with exp_trace.stage("checkout"):
+		progplat.change_branch(branchname)
 
 	try:
 		# generate the experiment code
 		# ======================================
 		logging.info(f"generating experiment code")
-		progplat.configure_experiment(board_type, exp)
+		progplat.configure_experiment(board_type, exp, default_mul_runs if mul_runs == None else mul_runs[0])
 		run_id = progplat.get_configured_run_id()
 
 		# run the experiment
 		# ======================================
 		logging.info(f"running experiment")
 		uartlogdata_bin = progplat.run_experiment(conn_mode)
-		# interpret the experiment result
-		uartlogdata_lines = list(map(lambda l: l.decode(), uartlogdata_bin.split(b'\n')))
-		if exp_type == "exps2":
-			result_val = eval_uart_pair_cache_experiment(uartlogdata_lines)
-		elif exp_type == "exps1":
-			result_val = parse_uart_single_cache_experiment(uartlogdata_lines, board_type)
-			# if the result is no board exception
-			if not isinstance(result_val, str):
-				# filter sets where at least one line is valid
-				sets_valid = list(filter(lambda x: any(l_val["valid"] for l_val in x["lines"]), result_val))
-				# filter valid lines
-				sets_clean = list(map(lambda x: {"set": x["set"],"lines": list(filter(lambda l_val: l_val["valid"], x["lines"]))}, sets_valid))
-				# remove regs field
-				for s_val in sets_clean:
-					for l_val in s_val["lines"]:
-						for k in list(l_val.keys()):
-							if not k in ["line", "valid", "tag"]:
-								l_val.pop(k)
-				result_val = sets_clean
-		else:
-			raise Exception(f"unknown experiment type: {exp_type}")
-		result = json.dumps(result_val)
+		num_mul_runs = None
+		if mul_runs != None:
+			(uartlogdata_bin, num_mul_runs) = rerun_with_more_runs(progplat, exp, board_type, conn_mode, mul_runs, uartlogdata_bin)
+		(result_val, result) = evaluate_uart_experiment(exp_type, uartlogdata_bin, board_type)
 
 		# save the outputs and test metadata
 		# ======================================
 		nomismatches = True
 		if write_results:
-			logging.info(f"saving experiment data")
-			# TODO: with reset the output format could be: output1/2_uart.log and result_rst.json
-			outputs = []
-			outputs.append(("output_uart.log", uartlogdata_bin))
-			outputs.append(("result.json",     result.encode('utf-8')))
-			nomismatches = exp.write_results(run_id, outputs, force_results)
+			nomismatches = write_experiment_results(exp, run_id, uartlogdata_bin, result, force_results, num_mul_runs)
 
 	finally:
 		if not no_cleanup:
@@ -89,7 +181,8 @@ def run_experiment(exp_id, progplat = None, board_type = None, branchname = None
 			# ======================================
 			logging.info(f"cleaning embexp-progplatform")
 			# make progplatform clean to prepare the next round
-			progplat.check_clean("ignored" if force_cleanup == "ignored" else "all")
+			with exp_trace.stage("clean"):
+				progplat.check_clean("ignored" if force_cleanup == "ignored" else "all")
 
 	if printeval:
 		# the last line is a simple result line, that can be interpreted by another program, if exps2
@@ -102,10 +195,10 @@ def run_experiment(exp_id, progplat = None, board_type = None, branchname = None
 				print(f"board_exception = {result}")
 			else:
 				print("=" * 40)
-				for s_val in sets_clean:
+				for s_val in result_val:
 					print(f"set {s_val['set']}")
 					for l_val in s_val["lines"]:
-						print(f"\tline {l_val['line']}, tag: {l_val['tag']}")
+						print(f"\tline {l_val['line']}, tag: {l_val.get('tag', '-')}")
 				print("=" * 40)
 		else:
 			raise Exception(f"unknown experiment type: {exp_type}")
@@ -115,3 +208,83 @@ def run_experiment(exp_id, progplat = None, board_type = None, branchname = None
 
 	return result_val
 
+def run_experiment_batch(exp_ids, progplat = None, board_type = None, branchname = None, conn_mode = None, force_cleanup = None, force_results = False, no_cleanup = False, ignoremismatch = False, write_results = True, mul_runs = None):
+	# runs several experiments of one class in a single image,
+	# returns a list with the result value or the exception of each experiment,
+	# in the adaptive mode, the experiments that need more runs are run again on their own afterwards
+	logging.info(f"{(exp_ids, progplat, board_type, branchname, conn_mode, force_cleanup, force_results, no_cleanup, ignoremismatch, write_results, mul_runs)}")
+	if progplat == None:
+		progplat = progplatform.get_embexp_ProgPlatform(None)
+	exp_trace.set_exp(exp_ids)
+
+	exps = list(map(experiment.Experiment, exp_ids))
+	board_type = _check_experiment(exps[0], board_type)
+	exp_type = exps[0].get_exp_type()
+
+	# make sure that progplatform is clean
+	# ======================================
+	with exp_trace.stage("clean"):
+		progplat.check_clean(force_cleanup)
+
+	# change to corresponding branch
+	# ======================================
+	if branchname == None:
+		branchname = progplatform.get_default_branch(board_type)
+	with exp_trace.stage("checkout"):
+		progplat.change_branch(branchname)
+
+	try:
+		# generate the experiment code
+		# ======================================
+		logging.info(f"generating experiment code for a batch of {len(exps)}")
+		progplat.configure_experiment_batch(board_type, exps, default_mul_runs if mul_runs == None else mul_runs[0])
+		run_id = progplat.get_configured_run_id()
+
+		# run the experiments
+		# ======================================
+		logging.info(f"running experiment batch")
+		uartlogdata_bin = progplat.run_experiment(conn_mode)
+		try:
+			uartlogdata_bins = split_uart_batch_experiment(uartlogdata_bin, len(exps))
+		except Exception as e:
+			raise ExpFailure("parse", str(e))
+
+		# evaluate and save the outputs of each experiment
+		# ======================================
+		results = []
+		for (exp, exp_uartlogdata_bin) in zip(exps, uartlogdata_bins):
+			exp_trace.set_exp(exp.get_exp_id())
+			try:
+				if exp_uartlogdata_bin == None:
+					raise ExpFailure("parse", f"no output for experiment in batch: {exp.get_exp_id()}")
+				(result_val, result) = evaluate_uart_experiment(exp_type, exp_uartlogdata_bin, board_type)
+				num_mul_runs = None
+				if mul_runs != None:
+					num_mul_runs = mul_runs[0]
+					if len(mul_runs) > 1 and needs_more_runs(exp_type, result_val):
+						# the batch configuration is replaced by the one of this experiment
+						with exp_trace.stage("clean"):
+							progplat.check_clean("ignored" if force_cleanup == "ignored" else "all")
+						(exp_uartlogdata_bin, num_mul_runs) = rerun_with_more_runs(progplat, exp, board_type, conn_mode, mul_runs, exp_uartlogdata_bin)
+						(result_val, result) = evaluate_uart_experiment(exp_type, exp_uartlogdata_bin, board_type)
+				if write_results:
+					nomismatches = write_experiment_results(exp, run_id, exp_uartlogdata_bin, result, force_results, num_mul_runs)
+					if not nomismatches and not force_results and not ignoremismatch:
+						raise Exception("the output files differ")
+				results.append(result_val)
+			except KeyboardInterrupt:
+				raise
+			except Exception as e:
+				logging.warning(f"experiment in batch failed: {exp.get_exp_id()}: {e}")
+				results.append(e)
+
+	finally:
+		if not no_cleanup:
+			# finalize embexp-progplatform
+			# ======================================
+			logging.info(f"cleaning embexp-progplatform")
+			exp_trace.set_exp(exp_ids)
+			with exp_trace.stage("clean"):
+				progplat.check_clean("ignored" if force_cleanup == "ignored" else "all")
+
+	return results
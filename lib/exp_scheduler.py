@@ -0,0 +1,435 @@
+
+import logging
+import os
+import threading
+import concurrent.futures
+
+import exp_runner
+import exp_retry
+import exp_trace
+import exp_metrics
+from helpers import *
+
+def get_pool_branch_commit_hash(progplats, branchname):
+	progplat_hashes = set(map(lambda p: p.get_branch_commit_hash(branchname), progplats))
+	if len(progplat_hashes) != 1:
+		raise Exception(f"ProgPlatform working copies are not on the same commit for branch {branchname}: {progplat_hashes}")
+	return progplat_hashes.pop()
+
+# runs the experiments of an iterator on a pool of ProgPlatform working copies,
+# each working copy is one board slot and takes the next experiment as soon as it is idle,
+# with a second working copy per slot in build_progplats, the next experiment is prepared in it
+# while the board runs the current one and the results are written in the background,
+# failed experiments are retried later and boards that keep failing are reset and quarantined
+class ExpScheduler:
+	def __init__(self, exp_iter, progplats, board_type, run_args = None, batch_size = None, build_progplats = None, retries = None, healths = None):
+		assert len(progplats) > 0
+		assert batch_size == None or batch_size > 0
+		assert build_progplats == None or (len(build_progplats) == len(progplats) and batch_size == None)
+		self.exp_iter = exp_iter
+		self.progplats = progplats
+		self.board_type = board_type
+		self.run_args = run_args if run_args != None else {}
+		self.batch_size = batch_size
+		self.build_progplats = build_progplats
+		self.retries = retries if retries != None else exp_retry.RetryQueue()
+		self.healths = healths if healths != None else list(map(exp_retry.BoardHealth, range(len(progplats))))
+		assert len(self.healths) == len(progplats)
+
+		self._cond = threading.Condition()
+		self._inflight = set()
+		self._held = None
+		self._iter_done = False
+		self._iter_busy = False
+		self._iter_error = None
+		self._stop = False
+
+		self.metrics = exp_metrics.BatchMetrics(len(progplats))
+		self.metrics.get_remaining = self.get_remaining
+
+		self.successful = True
+		self.someSuccessful = False
+		self.run_ids = set()
+
+	def get_run_id(self):
+		if len(self.run_ids) == 0:
+			return None
+		if len(self.run_ids) != 1:
+			raise Exception(f"board slots produced results for different run_ids: {self.run_ids}")
+		return next(iter(self.run_ids))
+
+	def get_remaining(self):
+		# the experiments that are left in the current round of the iterator, waiting for a retry or running,
+		# None while the size of the round is unknown
+		(iter_round, iter_idx, iter_size) = self.exp_iter.get_iterinfo()
+		if self._iter_done:
+			n = 0
+		elif iter_size == None:
+			return None
+		else:
+			n = iter_size - iter_idx + (0 if self._held == None else 1)
+		return n + len(self.retries) + len(self._inflight)
+
+	def _next_exps(self, n, wait = True):
+		# up to n experiments of the same class, as they are available without waiting for other boards,
+		# without wait, an experiment that is still running is left to the next round instead of waiting for it,
+		# retries that are due come first and the experiments that are owned by the retry queue are skipped
+		exps = []
+		with self._cond:
+			while not self._stop and len(exps) < n:
+				exp_id = self.retries.pop_due(None if len(exps) == 0 else os.path.dirname(exps[0][0]))
+				if exp_id != None:
+					self._inflight.add(exp_id)
+					exps.append((exp_id, None))
+					continue
+				if self._held != None:
+					(exp_id, iterinfo) = self._held
+					self._held = None
+				elif self._iter_busy and not self._iter_done:
+					# another slot takes the next experiment from the iterator
+					if len(exps) > 0 or not wait:
+						break
+					self._cond.wait()
+					continue
+				elif not self._iter_done and not ((len(self.retries) > 0 or not wait) and self._is_iter_round_done()):
+					next_exp = self._next_from_iter()
+					if next_exp == None:
+						continue
+					(exp_id, iterinfo) = next_exp
+					if self.retries.is_owned(exp_id):
+						continue
+				else:
+					# wait for retries, and for running experiments, which might fail and need another attempt
+					if len(exps) > 0 or not wait:
+						break
+					wait_time = self.retries.get_wait_time()
+					if wait_time == None and len(self._inflight) == 0:
+						self._stop = True
+						self._cond.notify_all()
+						break
+					self._cond.wait(wait_time)
+					continue
+				if len(exps) > 0 and os.path.dirname(exp_id) != os.path.dirname(exps[0][0]):
+					# keep it for the next batch
+					self._held = (exp_id, iterinfo)
+					break
+				if not exp_id in self._inflight:
+					self._inflight.add(exp_id)
+					exps.append((exp_id, iterinfo))
+					continue
+				# the iterator started a new round while this experiment still runs on a board,
+				# wait for it and leave it to the next round if it is still incomplete then
+				logging.info(f"experiment is running on a board already: {exp_id}")
+				if len(exps) > 0 or not wait:
+					break
+				while exp_id in self._inflight and not self._stop:
+					self._cond.wait()
+		return exps
+
+	def _next_from_iter(self):
+		# called with the lock held, which is released while the iterator scans the logs or waits for new experiments,
+		# so that the other slots can finish their experiments meanwhile, returns None at the end,
+		# an error of the iterator, e.g. an invalid experiment id from stdin, stops all slots and is raised by run
+		self._iter_busy = True
+		self._cond.release()
+		error = None
+		try:
+			try:
+				exp_id = next(self.exp_iter)
+			except StopIteration:
+				exp_id = None
+			iterinfo = self.exp_iter.get_iterinfo()
+		except Exception as e:
+			error = e
+		finally:
+			self._cond.acquire()
+			self._iter_busy = False
+			self._cond.notify_all()
+		if error != None:
+			logging.error(f"selecting the next experiment failed, stopping: {error}")
+			self._iter_error = error
+			self._iter_done = True
+			self.successful = False
+			self._stop = True
+			return None
+		if exp_id == None:
+			self._iter_done = True
+			return None
+		return (exp_id, iterinfo)
+
+	def _is_iter_round_done(self):
+		# the iterator might wait for new experiments at the end of a round, pending retries go first then,
+		# and without wait the next round is left to the next call
+		return hasattr(self.exp_iter, "is_round_done") and self.exp_iter.is_round_done()
+
+	def _finish_exp(self, exp_id):
+		with self._cond:
+			self._inflight.remove(exp_id)
+			self._cond.notify_all()
+
+	def _print_start(self, slot, exp_id, iterinfo):
+		slot_str = f" [b:{slot}]" if len(self.progplats) > 1 else ""
+		if iterinfo == None:
+			with self._cond:
+				attempt = self.retries.get_attempt(exp_id)
+			print(f"===>>> [retry, attempt {attempt} of {self.retries.max_attempts}]{slot_str} {exp_id}", flush=True)
+			return
+		(iter_round, iter_idx, iter_size) = iterinfo
+		# the size is unknown while the experiments are still being discovered
+		if iter_size == None:
+			progress_str = f"{iter_idx} of ?"
+		else:
+			progress_str = f"{(iter_idx/iter_size * 100):.2f}% of {iter_size}"
+		print(f"===>>> [r:{iter_round}, {progress_str}]{slot_str} {exp_id}", flush=True)
+
+	def _print_result(self, result_val):
+		if result_val != True:
+			print(f"         - Interesting result: {result_val}", flush=True)
+
+	def _record_result(self, slot, exp_id, run_id, result_val):
+		with self._cond:
+			self.someSuccessful = True
+			self.run_ids.add(run_id)
+			self.retries.add_success(exp_id)
+			self.healths[slot].report_success()
+			if is_board_exception_result(result_val):
+				self.retries.count("board_exception")
+		self.metrics.add_result(run_id, result_val)
+		self._print_result(result_val)
+
+	def _record_failure(self, slot, exp_ids, e):
+		# one failure of the board for all experiments that failed together
+		category = get_failure_category(e)
+		delays = []
+		with self._cond:
+			self.healths[slot].report_failure(category)
+			for exp_id in exp_ids:
+				delay = self.retries.add_failure(exp_id, category)
+				delays.append(delay)
+				self.metrics.add_failure(delay == None)
+				if delay == None:
+					self.successful = False
+				# the iterator doesn't have to offer it again
+				if hasattr(self.exp_iter, "exclude"):
+					self.exp_iter.exclude.add(exp_id)
+		for (exp_id, delay) in zip(exp_ids, delays):
+			if delay == None:
+				logging.warning(f"- unsuccessful ({category}), giving up: {exp_id}: {e}")
+			else:
+				logging.warning(f"- unsuccessful ({category}), retrying in {delay:.0f}s: {exp_id}: {e}")
+
+	def _wait_healthy(self, slot):
+		# waits while the board of the slot is in quarantine, returns False if the slot is retired
+		health = self.healths[slot]
+		with self._cond:
+			while not health.retired and not self._stop:
+				quarantine_time = health.get_quarantine_time()
+				if quarantine_time <= 0:
+					break
+				self.metrics.set_slot(slot, "quarantined")
+				self._cond.wait(quarantine_time)
+			if not health.retired:
+				self.metrics.set_slot(slot, "idle")
+				return True
+			self.metrics.set_slot(slot, "retired")
+			if all(map(lambda h: h.retired, self.healths)):
+				logging.error("all board slots are retired, stopping")
+				self.successful = False
+				self._stop = True
+				self._cond.notify_all()
+			return False
+
+	def _release_exps(self, exp_ids):
+		# gives experiments that have been taken but not run back to the other slots
+		with self._cond:
+			for exp_id in exp_ids:
+				self._inflight.discard(exp_id)
+				self.retries.requeue(exp_id)
+				if hasattr(self.exp_iter, "exclude"):
+					self.exp_iter.exclude.add(exp_id)
+			self._cond.notify_all()
+
+	def _get_conn_mode(self, slot, progplat):
+		# the configured connection mode, or a reset of the board if the slot asks for one
+		conn_mode = self.run_args.get("conn_mode")
+		with self._cond:
+			reset = self.healths[slot].take_reset()
+		if reset:
+			if progplat.board_conn != None:
+				progplat.board_conn.reconnect()
+			else:
+				conn_mode = "reset"
+		return conn_mode
+
+	def _run_single(self, slot, progplat, exp_id):
+		try:
+			run_args = dict(self.run_args, conn_mode = self._get_conn_mode(slot, progplat))
+			result_val = exp_runner.run_experiment(exp_id, progplat, self.board_type, **run_args)
+			self._record_result(slot, exp_id, progplat.get_configured_run_id(), result_val)
+		except KeyboardInterrupt:
+			raise
+		except Exception as e:
+			self._record_failure(slot, [exp_id], e)
+
+	def _run_batch(self, slot, progplat, exp_ids):
+		try:
+			run_args = dict(self.run_args, conn_mode = self._get_conn_mode(slot, progplat))
+			results = exp_runner.run_experiment_batch(exp_ids, progplat, self.board_type, **run_args)
+		except KeyboardInterrupt:
+			raise
+		except Exception as e:
+			logging.warning(f"- unsuccessful batch of {len(exp_ids)}")
+			self._record_failure(slot, exp_ids, e)
+			return
+		for (exp_id, result_val) in zip(exp_ids, results):
+			print(f"         {exp_id}", flush=True)
+			if isinstance(result_val, Exception):
+				self._record_failure(slot, [exp_id], result_val)
+				continue
+			self._record_result(slot, exp_id, progplat.get_configured_run_id(), result_val)
+
+	def _prepare(self, progplat, exp_id):
+		mul_runs = self.run_args.get("mul_runs")
+		num_mul_runs = exp_runner.default_mul_runs if mul_runs == None else mul_runs[0]
+		return exp_runner.prepare_experiment(exp_id, progplat, self.board_type, build = True, num_mul_runs = num_mul_runs)
+
+	def _finish(self, slot, exp, run_id, board_type, uartlogdata_bin, num_mul_runs):
+		try:
+			result_val = exp_runner.finish_experiment(exp, run_id, board_type, uartlogdata_bin, self.run_args.get("force_results", False), num_mul_runs = num_mul_runs)
+			self._record_result(slot, exp.get_exp_id(), run_id, result_val)
+		except Exception as e:
+			self._record_failure(slot, [exp.get_exp_id()], e)
+		finally:
+			self._finish_exp(exp.get_exp_id())
+
+	def _run_slot_pipelined(self, slot):
+		# the two working copies of the slot take turns, one runs on the board while the other one is prepared
+		progplats = [self.progplats[slot], self.build_progplats[slot]]
+		preparer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=f"board_slot_{slot}_prepare")
+		writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=f"board_slot_{slot}_write")
+		def start(exps, idx):
+			(exp_id, iterinfo) = exps[0]
+			return (exp_id, iterinfo, idx, preparer.submit(self._prepare, progplats[idx], exp_id))
+		try:
+			current = None
+			idx = 0
+			while True:
+				if not self._wait_healthy(slot):
+					if current != None:
+						# let the preparation finish before the experiment goes to another slot
+						concurrent.futures.wait([current[3]])
+						self._release_exps([current[0]])
+					return
+				if current == None:
+					exps = self._next_exps(1)
+					if len(exps) == 0:
+						return
+					current = start(exps, idx)
+				(exp_id, iterinfo, idx, prepared) = current
+				progplat = progplats[idx]
+				try:
+					if not prepared.done():
+						self.metrics.set_slot(slot, "preparing", exp_id)
+					(exp, board_type) = prepared.result()
+				except KeyboardInterrupt:
+					raise
+				except Exception as e:
+					logging.warning(f"- unsuccessful preparation: {exp_id}")
+					self._record_failure(slot, [exp_id], e)
+					self._finish_exp(exp_id)
+					current = None
+					continue
+
+				# prepare the next experiment in the other working copy
+				idx_next = 1 - idx
+				exps = self._next_exps(1, False)
+				current = start(exps, idx_next) if len(exps) > 0 else None
+				if current == None:
+					idx = idx_next
+
+				self._print_start(slot, exp_id, iterinfo)
+				self.metrics.set_slot(slot, "running", exp_id)
+				exp_trace.set_exp(exp_id)
+				try:
+					conn_mode = self._get_conn_mode(slot, progplat)
+					uartlogdata_bin = progplat.run_experiment(conn_mode)
+					# the runs with more repetitions are not pipelined
+					num_mul_runs = None
+					mul_runs = self.run_args.get("mul_runs")
+					if mul_runs != None:
+						(uartlogdata_bin, num_mul_runs) = exp_runner.rerun_with_more_runs(progplat, exp, board_type, conn_mode, mul_runs, uartlogdata_bin)
+				except KeyboardInterrupt:
+					raise
+				except Exception as e:
+					self._record_failure(slot, [exp_id], e)
+					self._finish_exp(exp_id)
+					continue
+				writer.submit(self._finish, slot, exp, progplat.get_configured_run_id(), board_type, uartlogdata_bin, num_mul_runs)
+				self.metrics.set_slot(slot, "idle")
+		finally:
+			preparer.shutdown(wait=True)
+			writer.shutdown(wait=True)
+			for progplat in progplats:
+				progplat.check_clean("all")
+
+	def _run_slot(self, slot):
+		try:
+			if self.build_progplats != None:
+				self._run_slot_pipelined(slot)
+			else:
+				self._run_slot_sequential(slot)
+		finally:
+			if not self.healths[slot].retired:
+				self.metrics.set_slot(slot, "done")
+
+	def _run_slot_sequential(self, slot):
+		progplat = self.progplats[slot]
+		while True:
+			if not self._wait_healthy(slot):
+				return
+			exps = self._next_exps(1 if self.batch_size == None else self.batch_size)
+			if len(exps) == 0:
+				return
+			for (exp_id, iterinfo) in exps:
+				self._print_start(slot, exp_id, iterinfo)
+			exp_ids = list(map(lambda x: x[0], exps))
+			self.metrics.set_slot(slot, "running", exp_ids[0])
+			try:
+				if self.batch_size == None:
+					self._run_single(slot, progplat, exp_ids[0])
+				else:
+					self._run_batch(slot, progplat, exp_ids)
+			finally:
+				self.metrics.set_slot(slot, "idle")
+				for exp_id in exp_ids:
+					self._finish_exp(exp_id)
+
+	def stop(self):
+		with self._cond:
+			self._stop = True
+			self._cond.notify_all()
+
+	def run(self):
+		# a single board runs in this thread, as before
+		if len(self.progplats) == 1:
+			self._run_slot(0)
+			if self._iter_error != None:
+				raise self._iter_error
+			return self.successful
+
+		threads = []
+		for slot in range(len(self.progplats)):
+			t = threading.Thread(target=self._run_slot, args=(slot,), name=f"board_slot_{slot}", daemon=True)
+			threads.append(t)
+			t.start()
+		try:
+			for t in threads:
+				while t.is_alive():
+					t.join(1)
+		except KeyboardInterrupt:
+			self.stop()
+			raise
+		if self._iter_error != None:
+			raise self._iter_error
+		return self.successful
+
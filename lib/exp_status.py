@@ -0,0 +1,100 @@
+
+import logging
+import os
+import multiprocessing
+
+import experiment
+import exp_catalog
+import exp_pack
+from helpers import *
+
+status_categories = ["notrun", "incomplete", "others", "inconclusive", "examples", "cexamples"]
+
+def classify_result(result):
+	if result == b"true":
+		return "examples"
+	elif result == b"false":
+		return "cexamples"
+	elif result.startswith(b"\"special :::: INCONCLUSIVE: "):
+		return "inconclusive"
+	else:
+		return "others"
+
+def _classify_chunk(args):
+	(run_dirname, exp_ids) = args
+	classified = []
+	for exp_id in exp_ids:
+		result = exp_pack.read_bytes(os.path.join(get_logs_path(exp_id), run_dirname, "result.json"))
+		classified.append((exp_id, classify_result(result)))
+	return classified
+
+def count_progs(arch_id):
+	n = 0
+	for entry in os.scandir(get_logs_path(f"{arch_id}/progs")):
+		if entry.is_dir():
+			n += 1
+	return n
+
+def iter_progs(arch_id):
+	for entry in os.scandir(get_logs_path(f"{arch_id}/progs")):
+		if entry.is_dir():
+			yield entry.name
+
+class ExpStatus:
+	def __init__(self, run_id, keep_lists = None):
+		self.run_id = run_id
+		self.n_exps = 0
+		self.counts = dict(map(lambda x: (x, 0), status_categories))
+		# only the requested id lists are kept in memory
+		self.lists = dict(map(lambda x: (x, []), [] if keep_lists == None else keep_lists))
+
+	def add(self, exp_id, category):
+		self.counts[category] += 1
+		if category in self.lists:
+			self.lists[category].append(exp_id)
+
+	def _iter_complete(self, arch_id, catalog, exp_set):
+		# streams the experiments with complete runs, counts the ones without
+		run_dirname = experiment.get_run_dir(self.run_id)
+		for exp_class in catalog.get_exp_classes(arch_id):
+			for (exp_id, valid, complete_run_ids) in catalog.iter_refresh(exp_class):
+				if not valid or (exp_set != None and not exp_id in exp_set):
+					continue
+				self.n_exps += 1
+				if self.run_id in complete_run_ids:
+					yield exp_id
+				elif exp_pack.isdir(os.path.join(get_logs_path(exp_id), run_dirname)):
+					self.add(exp_id, "incomplete")
+				else:
+					self.add(exp_id, "notrun")
+
+	def collect(self, arch_id, catalog = None, exp_set = None, jobs = None, chunk_size = 256):
+		if catalog == None:
+			catalog = exp_catalog.get_default_catalog()
+		run_dirname = experiment.get_run_dir(self.run_id)
+		def iter_chunks():
+			chunk = []
+			for exp_id in self._iter_complete(arch_id, catalog, exp_set):
+				chunk.append(exp_id)
+				if len(chunk) >= chunk_size:
+					yield (run_dirname, chunk)
+					chunk = []
+			if len(chunk) > 0:
+				yield (run_dirname, chunk)
+
+		if jobs == 1:
+			for classified in map(_classify_chunk, iter_chunks()):
+				for (exp_id, category) in classified:
+					self.add(exp_id, category)
+		else:
+			with multiprocessing.Pool(jobs) as pool:
+				for classified in pool.imap_unordered(_classify_chunk, iter_chunks()):
+					for (exp_id, category) in classified:
+						self.add(exp_id, category)
+		# the chunks complete in any order
+		for l in self.lists.values():
+			l.sort()
+		logging.info(f"status of {self.n_exps} experiments collected")
+
+	def to_json_dict(self):
+		return {"run_id": self.run_id, "n_exps": self.n_exps, "counts": self.counts, "lists": self.lists}
@@ -0,0 +1,121 @@
+
+import json
+import math
+import time
+import array
+import threading
+import contextlib
+
+from helpers import *
+
+# timings of the stages of experiment runs, the stages are recorded with the experiment that the current thread works on,
+# nothing is recorded as long as no tracer is set
+_tracer = None
+_local = threading.local()
+
+def set_tracer(tracer):
+	global _tracer
+	_tracer = tracer
+
+def get_tracer():
+	return _tracer
+
+def set_exp(exp_id):
+	# the experiment (or a description of a batch) of the stages that follow in this thread
+	_local.exp_id = exp_id
+
+def record(name, start, end):
+	# start and end as time.monotonic()
+	if _tracer != None:
+		_tracer.add(name, getattr(_local, "exp_id", None), start, end)
+
+@contextlib.contextmanager
+def stage(name):
+	if _tracer == None:
+		yield
+		return
+	start = time.monotonic()
+	try:
+		yield
+	finally:
+		record(name, start, time.monotonic())
+
+def _percentile(sorted_vals, p):
+	# nearest rank
+	return sorted_vals[max(0, math.ceil(p * len(sorted_vals)) - 1)]
+
+# writes the stages as json lines and keeps their durations for a summary,
+# optionally the stages are also written in the chrome trace event format (chrome://tracing, perfetto),
+# as a json array whose events are written as they happen and that is closed at the end
+class StageTracer:
+	def __init__(self, jsonl_path = None, chrome_path = None):
+		self.jsonl_path = jsonl_path
+		self.chrome_path = chrome_path
+		self._lock = threading.Lock()
+		# wall clock time for the monotonic times
+		self._mono0 = time.monotonic()
+		self._wall0 = time.time()
+		self._jsonl_file = None if jsonl_path == None else open(jsonl_path, "w")
+		self._chrome_file = None
+		if chrome_path != None:
+			self._chrome_file = open(chrome_path, "w")
+			self._chrome_file.write("[")
+		self._n_chrome_events = 0
+		self._tids = {}
+		# stage -> durations in seconds, in the order in which the stages appeared first
+		self.durations = {}
+
+	def add(self, name, exp_id, start, end):
+		thread_name = threading.current_thread().name
+		with self._lock:
+			if not name in self.durations:
+				self.durations[name] = array.array("d")
+			self.durations[name].append(end - start)
+			if self._jsonl_file != None:
+				d = {"stage": name, "exp_id": exp_id, "thread": thread_name,
+					"start": round(self._wall0 + start - self._mono0, 6), "end": round(self._wall0 + end - self._mono0, 6), "duration": round(end - start, 6)}
+				self._jsonl_file.write(json.dumps(d) + "\n")
+			if self._chrome_file != None:
+				tid = self._tids.get(thread_name)
+				if tid == None:
+					# the threads are named in the viewer
+					tid = len(self._tids)
+					self._tids[thread_name] = tid
+					self._write_chrome_event({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": thread_name}})
+				self._write_chrome_event({"name": name, "ph": "X", "pid": 0, "tid": tid,
+					"ts": round((start - self._mono0) * 1e6), "dur": round((end - start) * 1e6), "args": {"exp_id": exp_id}})
+
+	def _write_chrome_event(self, event):
+		# called with the lock held
+		self._chrome_file.write(("\n" if self._n_chrome_events == 0 else ",\n") + json.dumps(event))
+		self._n_chrome_events += 1
+
+	def close(self):
+		with self._lock:
+			if self._jsonl_file != None:
+				self._jsonl_file.close()
+				self._jsonl_file = None
+			if self._chrome_file != None:
+				self._chrome_file.write("\n]\n")
+				self._chrome_file.close()
+				self._chrome_file = None
+
+	def get_summary(self):
+		# stage -> (count, mean, p50, p95, total) in seconds
+		summary = {}
+		with self._lock:
+			for (name, durations) in self.durations.items():
+				vals = sorted(durations)
+				total = sum(vals)
+				summary[name] = (len(vals), total / len(vals), _percentile(vals, 0.5), _percentile(vals, 0.95), total)
+		return summary
+
+	def get_summary_str(self):
+		summary = self.get_summary()
+		if len(summary) == 0:
+			return "no stages recorded"
+		width = max(map(len, list(summary) + ["stage"]))
+		s = f"{'stage'.ljust(width)} | {'count':>7} | {'mean':>9} | {'p50':>9} | {'p95':>9} | {'total':>10}\n"
+		for (name, (count, mean, p50, p95, total)) in summary.items():
+			s += f"{name.ljust(width)} | {count:>7} | {mean:>8.3f}s | {p50:>8.3f}s | {p95:>8.3f}s | {total:>9.1f}s\n"
+		return s[:-1]
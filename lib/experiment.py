@@ -2,7 +2,11 @@
 import logging
 import os
 import json
+import array
+import hashlib
+import threading
 
+import exp_pack
 from helpers import *
 
 def get_run_id(progplat_hash, board_type):
@@ -10,12 +14,93 @@ def get_run_id(progplat_hash, board_type):
 def get_run_dir(run_id):
 	return f"run.{run_id}"
 
+# cache state result of an exps1 run as columns of the valid lines, sets, ways and tags are
+# memoryviews into a mapped binary copy in .cache, or arrays if it has just been read from result.json
+class CacheResult:
+	def __init__(self, num_sets, num_ways, tag_width, sets, ways, tags):
+		self.num_sets = num_sets
+		self.num_ways = num_ways
+		self.tag_width = tag_width
+		self.sets = sets
+		self.ways = ways
+		self.tags = tags
+
+	def __len__(self):
+		return len(self.tags)
+
+def read_cache_result_bin(filepath):
+	mv = exp_pack.get_buffer(filepath)
+	size = len(mv)
+	if size < cache_result_bin_header.size:
+		raise Exception(f"truncated cache result: {filepath}")
+	(magic, version, tag_width, num_sets, num_ways, n) = cache_result_bin_header.unpack_from(mv, 0)
+	if magic != cache_result_bin_magic or version != 1:
+		raise Exception(f"not a cache result: {filepath}")
+	offset = cache_result_bin_header.size
+	if size != offset + n * 12:
+		raise Exception(f"truncated cache result: {filepath}")
+	assert sys.byteorder == "little"
+	# the views keep the mapping alive
+	tags = mv[offset:offset + n * 8].cast('Q')
+	offset += n * 8
+	sets = mv[offset:offset + n * 2].cast('H')
+	offset += n * 2
+	ways = mv[offset:offset + n * 2].cast('H')
+	return CacheResult(num_sets, num_ways, tag_width, sets, ways, tags)
+
+def write_cache_result_bin(filepath, result):
+	columns = [array.array('Q', result.tags), array.array('H', result.sets), array.array('H', result.ways)]
+	if sys.byteorder != "little":
+		for a in columns:
+			a.byteswap()
+	header = cache_result_bin_header.pack(cache_result_bin_magic, 1, result.tag_width, result.num_sets, result.num_ways, len(result))
+	# written to a temporary file and renamed, concurrent readers see the old file or the complete new one
+	temp_path = f"{filepath}.tmp.{os.getpid()}.{threading.get_ident()}"
+	with open(temp_path, "wb") as f:
+		f.write(header + b"".join(map(lambda a: a.tobytes(), columns)))
+	os.rename(temp_path, filepath)
+
+def _value_parse_rec(d, convkey = False):
+	d_ = {}
+	for k in d:
+		v = d[k]
+		k = int(k, 16) if convkey else k
+		if isinstance(v, dict):
+			v_ = _value_parse_rec(v, True)
+		else:
+			v_ = int(v, 16)
+		d_[k] = v_
+	return d_
+
+def _parse_input_file(f):
+	return _value_parse_rec(json.load(f))
+
+def _parse_prog_id(f):
+	return f.read().strip()
+
+def _parse_tag(tag_str):
+	if not isinstance(tag_str, str) or not tag_str.startswith("0x"):
+		return None
+	try:
+		tag = int(tag_str, 16)
+	except ValueError:
+		return None
+	return tag if tag < 2**64 else None
+
+def _copy_rec(d):
+	return dict(map(lambda x: (x[0], _copy_rec(x[1]) if isinstance(x[1], dict) else x[1]), d.items()))
+
 class Experiment:
+	__slots__ = ("exp_id", "exp_path", "_id_parts", "_file_cache")
+
 	def __init__(self, exp_id):
-		assert len(exp_id.split('/')) == 4
+		self._id_parts = exp_id.split('/')
+		assert len(self._id_parts) == 4
 		self.exp_id = exp_id
 		self.exp_path = get_logs_path(exp_id)
-		assert os.path.isdir(self.exp_path)
+		assert exp_pack.isdir(self.exp_path)
+		# (filename, parse) -> (file key, value)
+		self._file_cache = {}
 
 	def create(exp_id, files):
 		exp_path = get_logs_path(exp_id)
@@ -32,92 +117,151 @@ class Experiment:
 
 	def get_path(self, path, needfile = False):
 		jpath = os.path.join(self.exp_path, path)
-		if needfile and not os.path.isfile(jpath):
+		if needfile and not exp_pack.isfile(jpath):
 			raise Exception(f"file {jpath} doesn't exist")
 		return jpath
 
+	def _read_cached(self, filename, parse):
+		# parses a file of the experiment once, again only if it changed
+		filepath = self.get_path(filename)
+		try:
+			file_key = exp_pack.get_file_key(filepath)
+		except FileNotFoundError:
+			raise Exception(f"file {filepath} doesn't exist")
+		cached = self._file_cache.get((filename, parse))
+		if cached != None and cached[0] == file_key:
+			return cached[1]
+		with exp_pack.open_text(filepath) as f:
+			value = parse(f)
+		self._file_cache[(filename, parse)] = (file_key, value)
+		return value
+
 	def get_exp_id(self):
 		return self.exp_id
 
+	def get_exp_class(self):
+		return os.path.dirname(self.exp_id)
+
 	def get_exp_arch(self):
-		return os.path.basename(os.path.abspath(self.get_path("../../..")))
+		return self._id_parts[0]
 
 	def get_exp_type(self):
-		return os.path.basename(os.path.abspath(self.get_path("../..")))
+		return self._id_parts[1]
 
 	def get_exp_params_id(self):
-		return os.path.basename(os.path.abspath(self.get_path("..")))
+		return self._id_parts[2]
 
 	def get_exp_data_id(self):
-		return os.path.basename(os.path.abspath(self.get_path(".")))
+		return self._id_parts[3]
 
 	def get_prog_id(self):
-		with open(self.get_path(f"code.hash", True), "r") as f:
-			return f.read().strip()
+		return self._read_cached("code.hash", _parse_prog_id)
 
 	def get_prog_path(self, path, needfile = False):
 		prog_id = self.get_prog_id()
 		return self.get_path(f"../../../progs/{prog_id}/{path}", needfile)
 
 	def get_code(self):
-		with open(self.get_prog_path("code.asm", True), "r") as f:
+		with exp_pack.open_text(self.get_prog_path("code.asm", True)) as f:
 			return f.read()
 
 	def get_input_file(self, filename):
-		def value_parse_rec(d, convkey = False):
-			d_ = {}
-			for k in d:
-				v = d[k]
-				k = int(k, 16) if convkey else k
-				if isinstance(v, dict):
-					v_ = value_parse_rec(v, True)
-				else:
-					v_ = int(v, 16)
-				d_[k] = v_
-			return d_
-
-		with open(self.get_path(filename, True), "r") as f:
-			json_raw = json.load(f)
-			statemap = value_parse_rec(json_raw)
-			return statemap
+		statemap = self._read_cached(filename, _parse_input_file)
+		# the caller gets its own copy
+		return _copy_rec(statemap)
 
 	def get_exp_gens(self):
 		prefix = "gen."
 		gens = []
-		for f in os.listdir(self.get_path(".")):
-			if os.path.isfile(self.get_path(f)) and f.startswith(prefix):
+		for f in exp_pack.listdir(self.get_path(".")):
+			if exp_pack.isfile(self.get_path(f)) and f.startswith(prefix):
 				gens.append(f)
 		return gens
 
 	def get_prog_gens(self):
 		prefix = "gen."
 		gens = []
-		for f in os.listdir(self.get_prog_path(".")):
-			if os.path.isfile(self.get_prog_path(f)) and f.startswith(prefix):
+		for f in exp_pack.listdir(self.get_prog_path(".")):
+			if exp_pack.isfile(self.get_prog_path(f)) and f.startswith(prefix):
 				gens.append(f)
 		return gens
 
 	def get_run_ids(self):
 		prefix = "run."
 		ids = []
-		for d in os.listdir(self.get_path(".")):
-			if os.path.isdir(self.get_path(d)) and d.startswith(prefix):
+		for d in exp_pack.listdir(self.get_path(".")):
+			if exp_pack.isdir(self.get_path(d)) and d.startswith(prefix):
 				ids.append(d[len(prefix):])
 		return ids
 
+	def get_cache_result(self, run_id, board_type = None):
+		# the cache state of an exps1 run, None for board exceptions,
+		# a binary copy is kept in .cache for the next time, result.json stays the only result in the run directory
+		assert self.get_exp_type() == "exps1"
+		run_dir = get_run_dir(run_id)
+		json_path = self.get_path(f"{run_dir}/result.json", True)
+		# the name of the copy includes the file key of result.json, so that a rewritten result is read again
+		bin_dir = get_logs_path(f".cache/cache_results/{self.exp_id}")
+		bin_key = hashlib.sha1(repr(exp_pack.get_file_key(json_path)).encode()).hexdigest()[:16]
+		bin_path = os.path.join(bin_dir, f"{run_dir}.{bin_key}.bin")
+		if os.path.isfile(bin_path):
+			return read_cache_result_bin(bin_path)
+		with exp_pack.open_text(json_path) as f:
+			result = json.load(f)
+		if isinstance(result, str):
+			return None
+		if board_type == None:
+			board_type = run_id.split(".")[-1]
+		(num_sets, num_ways) = get_cache_geometry(board_type)
+		sets = array.array('H')
+		ways = array.array('H')
+		tags = array.array('Q')
+		tag_width = 0
+		skipped = 0
+		for s_val in result:
+			for l_val in s_val["lines"]:
+				tag = _parse_tag(l_val.get("tag"))
+				# the columns need a tag, valid lines without one or with an unreadable one are left out
+				if tag == None:
+					skipped += 1
+					continue
+				sets.append(s_val["set"])
+				ways.append(l_val["line"])
+				tags.append(tag)
+				tag_width = len(l_val["tag"]) - 2
+		if skipped > 0:
+			logging.warning(f"{skipped} valid cache lines without a readable tag are left out: {self.exp_id} {run_id}")
+		cache_result = CacheResult(num_sets, num_ways, tag_width, sets, ways, tags)
+		os.makedirs(bin_dir, exist_ok=True)
+		for filename in os.listdir(bin_dir):
+			if filename.startswith(f"{run_dir}.") and filename.endswith(".bin"):
+				try:
+					os.remove(os.path.join(bin_dir, filename))
+				except FileNotFoundError:
+					pass
+		write_cache_result_bin(bin_path, cache_result)
+		return cache_result
+
+	def get_mul_runs(self, run_id):
+		# the repetition count recorded for a run, None if it is not recorded
+		filepath = self.get_path(f"{get_run_dir(run_id)}/mul_runs.json")
+		if not exp_pack.isfile(filepath):
+			return None
+		with exp_pack.open_text(filepath) as f:
+			return json.load(f)["mul_runs"]
+
 	def is_valid_experiment(self):
 		filenames = ["code.hash", "input1.json"] + (["input2.json"] if self.get_exp_type() == "exps2" else [])
 		for filename in filenames:
-			if not os.path.isfile(self.get_path(filename)):
+			if not exp_pack.isfile(self.get_path(filename)):
 				return False
 			if filename.endswith(".json"):
-				with open(self.get_path(filename, True), "r") as f:
-					try:
-						if not isinstance(json.load(f), dict):
-							return False
-					except:
+				try:
+					if not isinstance(self._read_cached(filename, json.load), dict):
 						return False
-		if not os.path.isfile(self.get_prog_path("code.asm")):
+				except:
+					return False
+		if not exp_pack.isfile(self.get_prog_path("code.asm")):
 			return False
 		return True
 
@@ -125,10 +269,12 @@ class Experiment:
 		is_complete = True
 		# TODO: these filenames are specific to a certain type of experiment
 		for filename in ["output_uart.log", "result.json"]:
-			is_complete = is_complete and os.path.isfile(self.get_path(f"{get_run_dir(run_id)}/{filename}"))
+			is_complete = is_complete and exp_pack.isfile(self.get_path(f"{get_run_dir(run_id)}/{filename}"))
 		return not is_complete
 
 	def write_results(self, run_id, outputs, force_results = False):
+		if not os.path.isdir(self.exp_path):
+			raise Exception(f"experiment is packed and read-only, unpack the class first: {self.exp_id}")
 		exp_dir_results = self.get_path(get_run_dir(run_id))
 		# create the directory
 		call_cmd(["mkdir", "-p", exp_dir_results], "could not create directory")
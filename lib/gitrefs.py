@@ -0,0 +1,93 @@
+
+import os
+import re
+import stat
+
+# resolves git refs by reading HEAD, loose refs and packed-refs directly,
+# file contents are cached and invalidated by their mtime and size
+class GitRefResolver:
+	_hash_re = re.compile(r"^[0-9a-f]{40}$")
+
+	def __init__(self, repo_path):
+		self.repo_path = os.path.abspath(repo_path)
+		self.git_dir = None
+		self.common_dir = None
+		self._files = {}
+
+	def _find_git_dirs(self):
+		git_dir = os.path.join(self.repo_path, ".git")
+		# worktrees and submodules have a gitfile that points to the actual git directory
+		if os.path.isfile(git_dir):
+			with open(git_dir, "r") as f:
+				content = f.read().strip()
+			if not content.startswith("gitdir: "):
+				raise Exception(f"unexpected gitfile: {git_dir}")
+			git_dir = os.path.join(self.repo_path, content[len("gitdir: "):])
+		if not os.path.isdir(git_dir):
+			raise Exception(f"not a git repository: {self.repo_path}")
+		common_dir = git_dir
+		commondir_file = os.path.join(git_dir, "commondir")
+		if os.path.isfile(commondir_file):
+			with open(commondir_file, "r") as f:
+				common_dir = os.path.join(git_dir, f.read().strip())
+		self.git_dir = os.path.abspath(git_dir)
+		self.common_dir = os.path.abspath(common_dir)
+
+	def _read_cached(self, filepath, parse):
+		try:
+			st = os.stat(filepath)
+		except (FileNotFoundError, NotADirectoryError):
+			st = None
+		if st == None or not stat.S_ISREG(st.st_mode):
+			self._files.pop(filepath, None)
+			return None
+		stamp = (st.st_mtime_ns, st.st_size)
+		cached = self._files.get(filepath)
+		if cached != None and cached[0] == stamp:
+			return cached[1]
+		with open(filepath, "r") as f:
+			value = parse(f.read())
+		self._files[filepath] = (stamp, value)
+		return value
+
+	def _parse_packed_refs(self, content):
+		refs = {}
+		for line in content.split("\n"):
+			# skip the header, peeled tag lines and empty lines
+			if line == "" or line.startswith("#") or line.startswith("^"):
+				continue
+			(ref_hash, refname) = line.split(" ", 1)
+			refs[refname] = ref_hash
+		return refs
+
+	def _read_ref(self, refname, depth = 0):
+		if depth > 5:
+			raise Exception(f"too many levels of symbolic refs: {refname}")
+		# HEAD and the other pseudo refs are per worktree, everything below refs/ is shared
+		base_dir = self.common_dir if refname.startswith("refs/") else self.git_dir
+		content = self._read_cached(os.path.join(base_dir, refname), lambda x: x.strip())
+		if content == None:
+			packed_refs = self._read_cached(os.path.join(self.common_dir, "packed-refs"), self._parse_packed_refs)
+			if packed_refs == None:
+				return None
+			return packed_refs.get(refname)
+		if content.startswith("ref: "):
+			return self._read_ref(content[len("ref: "):], depth + 1)
+		if not self._hash_re.match(content):
+			return None
+		return content
+
+	def resolve(self, name):
+		# same lookup order as git rev-parse for a symbolic name, None if it cannot be resolved here
+		if self.git_dir == None:
+			self._find_git_dirs()
+		if self._hash_re.match(name):
+			return name
+		candidates = [name, f"refs/{name}", f"refs/tags/{name}", f"refs/heads/{name}", f"refs/remotes/{name}", f"refs/remotes/{name}/HEAD"]
+		for refname in candidates:
+			if refname != "HEAD" and not refname.startswith("refs/"):
+				continue
+			ref_hash = self._read_ref(refname)
+			if ref_hash != None:
+				return ref_hash
+		return None
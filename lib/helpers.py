@@ -2,6 +2,9 @@
 import sys
 import os
 import logging
+import array
+import struct
+import functools
 import subprocess
 
 # helpers
@@ -10,6 +13,11 @@ logs_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 def get_logs_path(path):
 	return os.path.join(logs_path, path)
 
+def set_logs_path(path):
+	# e.g. a synthetic tree for the benchmarks
+	global logs_path
+	logs_path = os.path.abspath(path)
+
 def call_cmd_get_output(cmdl, error_msg, show_error = True):
 	error_file = None
 	if not show_error:
@@ -59,6 +67,23 @@ def writefile_or_compare(forcenew, filename, content, errmsg):
 	if not comparefile(filename, content, True):
 		raise Exception(f"file {filename} has unexpected content: {errmsg}")
 
+# failures of an experiment run by the stage in which they happened, board exceptions are results and only counted,
+# all other exceptions fall into the category "other"
+failure_categories = ["build", "run", "timeout", "parse", "board_exception", "other"]
+class ExpFailure(Exception):
+	def __init__(self, category, msg):
+		assert category in failure_categories
+		super().__init__(msg)
+		self.category = category
+
+def get_failure_category(e):
+	if isinstance(e, ExpFailure):
+		return e.category
+	return "other"
+
+def is_board_exception_result(result_val):
+	return isinstance(result_val, str) and result_val.startswith("embexp.board.exception :::: ")
+
 def gen_input_code_reg(regmap, printcomments=True):
 	asm = ""
 	use_constmov = True
@@ -99,82 +124,92 @@ def uncacheable(cacheable_addr):
 
 # helper for gen_input_code_mem
 def mem_parse(memmap):
-	flatten  = lambda l: [item for sublist in l for item in sublist]
-	def partition(addresses, patterns):
-		for pat in patterns:
-			yield [a[0] for a in addresses if a[1] == pat]	
-       
+	# (address, offset, value), grouped by the 8 byte aligned addresses
 	adr_mask = ((2**64) - 1) - 0x7
 	off_mask = 7
-	patterns = set(map(lambda x : bin(x & adr_mask), memmap.keys()))
-	addr_pat = list(zip (memmap.keys(), list(map(lambda x : bin(x & adr_mask), memmap.keys()))))
-	partitioned_based_on_pattern = list(partition(addr_pat, patterns))
-	# (address, offset, value)
-	address_and_offset_value = list(map(lambda x :
-                                       (list(map (lambda y :
-                                            (uncacheable(y & adr_mask), y & off_mask, memmap[y]), x))),
-                                       partitioned_based_on_pattern))
-	return (flatten (address_and_offset_value))
+	grouped = {}
+	for addr in memmap:
+		grouped.setdefault(addr & adr_mask, []).append((uncacheable(addr & adr_mask), addr & off_mask, memmap[addr]))
+	return [item for sublist in grouped.values() for item in sublist]
 
-def gen_input_code_mem(memmap):
-	mem_parsed = mem_parse(memmap)
-	memmap = mem_parsed
+# sets reg to val with movz for the first and movk for the other nonzero halfwords
+def gen_mov_imm(reg, val):
 	asm = ""
+	first = True
+	for i in range(4 if reg.startswith("x") else 2):
+		hw = (val >> (16 * i)) & 0xFFFF
+		if hw == 0:
+			continue
+		asm += f"\t{'movz' if first else 'movk'} {reg}, #0x{hw:04x}, lsl #{16 * i}\n"
+		first = False
+	if first:
+		asm += f"\tmovz {reg}, #0\n"
+	return asm
 
-	# group the base addresses
-	memmap_map = {}
-	for (baseaddr,offset,value) in memmap:
-		try:
-			basemap = memmap_map[baseaddr]
-		except KeyError:
-			basemap = {}
-		if offset in list(basemap.keys()):
-			raise Exception("this should not happen!")
-		basemap[offset] = value
-		memmap_map[baseaddr] = basemap
-
-	for baseaddr in memmap_map:
-		basemap = memmap_map[baseaddr]
-		# do we have "all" offsets to make 64bit value?
-		if all((x in list(basemap.keys())) for x in range(0,8)):
-			# construct bytes bs
-			valbytes = []
-			for x in range(0,8):
-				valbytes.append(basemap[x])
-			valbytes.reverse()
-			bs = bytes(valbytes)
-
-			adr_str = (baseaddr).to_bytes(8, byteorder='big').hex()
-			asm += f"\t// MEM[0x{adr_str}] =LONG= 0x{bs.hex()}\n"
-
-			asm += gen_input_code_reg({"x1":(int.from_bytes(bs, byteorder='big'))}, False)
-			asm += gen_input_code_reg({"x0":baseaddr}, False)
-			asm += f"\tstr x1, [x0]\n\n"
-		else:
-			# else, we need to export them individually
-			for offset in basemap:
-				value = basemap[offset]
+mem_size_names = {1: "BYTE", 2: "HALF", 4: "WORD", 8: "LONG"}
 
-				adr_str = (baseaddr+offset).to_bytes(8, byteorder='big').hex()
-				val_str = value.to_bytes(1, byteorder='big').hex()
-				asm += f"\t// MEM[0x{adr_str}] =BYTE= 0x{val_str}\n"
+# str/strh/strb with an unsigned offset: a multiple of the size, at most 4095 times the size
+def is_store_offset(size, offset):
+	return 0 <= offset and offset % size == 0 and offset // size < 4096
 
-				asm += gen_strb_src_reg("w1", value, False)
-				asm += gen_input_code_reg({"x0":baseaddr}, False)
-				asm += f"\tstrb w1, [x0, {str(offset)}]\n\n"
+def gen_input_code_mem(memmap):
+	mem_parsed = mem_parse(memmap)
+	# the bytes by address, stores are generated for runs of consecutive bytes
+	membytes = {}
+	for (baseaddr,offset,value) in mem_parsed:
+		assert 0 <= value < 2**8
+		membytes[baseaddr + offset] = value
+
+	# stores with the widest naturally aligned access: (address, size, value)
+	stores = []
+	addrs = sorted(membytes.keys())
+	i = 0
+	while i < len(addrs):
+		addr = addrs[i]
+		# length of the run of consecutive bytes starting here
+		run_len = 1
+		while i + run_len < len(addrs) and run_len < 8 and addrs[i + run_len] == addr + run_len:
+			run_len += 1
+		for size in [8, 4, 2, 1]:
+			if size <= run_len and addr % size == 0:
+				break
+		value = int.from_bytes(bytes(map(lambda x: membytes[x], range(addr, addr + size))), byteorder='little')
+		stores.append((addr, size, value))
+		i += size
+
+	# only x0 (address) and x1 (value) are used, the caller resets them afterwards
+	asm = ""
+	regvals = {}
+	for (addr, size, value) in stores:
+		adr_str = addr.to_bytes(8, byteorder='big').hex()
+		val_str = value.to_bytes(size, byteorder='big').hex()
+		asm += f"\t// MEM[0x{adr_str}] ={mem_size_names[size]}= 0x{val_str}\n"
+		# the base address in x0 is reused for close stores if the offset can be encoded
+		baseaddr = regvals.get("x0")
+		if baseaddr == None or not is_store_offset(size, addr - baseaddr):
+			baseaddr = addr
+			asm += gen_mov_imm("x0", baseaddr)
+			regvals["x0"] = baseaddr
+		mem_op = f"[x0, #{addr - baseaddr}]" if addr != baseaddr else "[x0]"
+		# zero values are stored from the zero register, w1 is the lower half of x1
+		if value == 0:
+			reg = "xzr" if size == 8 else "wzr"
+		else:
+			reg = "x1" if size == 8 else "w1"
+			mask = 2**64 - 1 if size == 8 else 0xFFFFFFFF
+			if regvals.get("x1") == None or regvals["x1"] & mask != value:
+				asm += gen_mov_imm(reg, value)
+				regvals["x1"] = value
+		op = {8: "str", 4: "str", 2: "strh", 1: "strb"}[size]
+		asm += f"\t{op} {reg}, {mem_op}\n\n"
 	return asm
-	
-def gen_input_code(statemap):
-	memmap={}
-
-	for k in statemap['mem'].keys():
-		memmap[int(k)] = statemap['mem'][k]
-	del statemap['mem']
 
-	asm1 = gen_input_code_reg(statemap)
+@functools.lru_cache(maxsize=256)
+def _gen_input_code_cached(regs, mem):
+	asm1 = gen_input_code_reg(dict(regs))
 	regsetter = asm1
 
-	asm2 = gen_input_code_mem(memmap) # uses registers x0 and x1
+	asm2 = gen_input_code_mem(dict(mem)) # uses registers x0 and x1
 	asm3 = "\n\t// reset the temporary registers to zero\n\tmov x0, #0\n" + "\tmov x1, #0\n"
 	memorysetter = asm2 + asm3
 
@@ -182,6 +217,12 @@ def gen_input_code(statemap):
 
 	return filecontents
 
+def gen_input_code(statemap):
+	# the same inputs, e.g. train.json of the experiments in a class, are generated only once
+	regs = tuple((k, v) for (k, v) in statemap.items() if k != 'mem')
+	mem = tuple((int(k), v) for (k, v) in statemap['mem'].items())
+	return _gen_input_code_cached(regs, mem)
+
 def gen_readable(statemap):
 	s = ""
 	for reg in statemap.keys():
@@ -227,6 +268,173 @@ def check_uart_experiment_base(lines):
 
 	return lines[1:-1]
 
+# incremental parser for the uart output while it is being written,
+# done as soon as all experiments completed or the board reported an exception
+class UartStreamParser:
+	def __init__(self, num_exps = 1):
+		self.num_exps = num_exps
+		self.num_complete = 0
+		self.done = False
+		self.reason = None
+		self._partial = b""
+
+	def feed(self, data):
+		lines = (self._partial + data).split(b'\n')
+		# the last part is not a complete line yet
+		self._partial = lines[-1]
+		for line in lines[:-1]:
+			line = line.rstrip(b'\r')
+			if line.startswith(b"EXCEPTION: "):
+				self.done = True
+				self.reason = line.decode(errors="replace")
+			elif line == b"Experiment complete.":
+				self.num_complete += 1
+				if self.num_complete >= self.num_exps:
+					self.done = True
+					self.reason = "Experiment complete."
+			if self.done:
+				break
+		return self.done
+
+def split_uart_batch_experiment(uartlogdata_bin, num_exps):
+	# a batch image prints the init line once and then each experiment after a delimiter line,
+	# the output of each experiment is turned into the output it would have had in an image of its own
+	initcompleteline = b"Init complete."
+	delimiter_pre    = b"==== BATCH EXPERIMENT "
+	delimiter_post   = b" ===="
+
+	lines = uartlogdata_bin.split(b'\n')
+	if len(lines) < 1 or lines[0] != initcompleteline:
+		raise Exception(f"unexpected output: init has never been completed, first line is: {lines[0]}")
+
+	segments = [None] * num_exps
+	segment = None
+	for line in lines[1:]:
+		if line.startswith(delimiter_pre) and line.endswith(delimiter_post):
+			idx = int(line[len(delimiter_pre):-len(delimiter_post)])
+			if idx < 0 or idx >= num_exps or segments[idx] != None:
+				raise Exception(f"unexpected output: invalid batch delimiter: {line}")
+			segment = [initcompleteline]
+			segments[idx] = segment
+			continue
+		if segment == None:
+			if line.strip() != b"":
+				raise Exception(f"unexpected output: output before the first batch delimiter: {line}")
+			continue
+		segment.append(line)
+
+	uartlogdata_bins = []
+	for segment in segments:
+		# experiments that never started are None, e.g. after an exception on the board
+		if segment == None:
+			uartlogdata_bins.append(None)
+			continue
+		while len(segment) > 0 and segment[-1] == b"":
+			segment = segment[:-1]
+		uartlogdata_bins.append(b'\n'.join(segment) + b'\n')
+	return uartlogdata_bins
+
+# L1 data cache geometry of the boards, (number of sets, number of ways)
+cache_geometries = {
+	"rpi3": (128, 4),
+	"rpi4": (256, 2),
+}
+
+def get_cache_geometry(board_type):
+	if not board_type in cache_geometries:
+		raise Exception(f"unknown board type: {board_type}")
+	return cache_geometries[board_type]
+
+# cache state as sets x ways columns, the tags are kept as integers together with the hex width
+# of the dump so that the json output matches the dump, tags that don't fit this format are kept as strings,
+# the json output keeps the fields of a line in the order of the dump, and for the dump of the valid lines,
+# which may list a line more than once, the entries of the dump are kept as they are
+class CacheState:
+	def __init__(self, num_sets, num_ways):
+		self.num_sets = num_sets
+		self.num_ways = num_ways
+		self.valid   = array.array('B', bytes(num_sets * num_ways))
+		self.has_tag = array.array('B', bytes(num_sets * num_ways))
+		self.tag     = array.array('Q', bytes(8 * num_sets * num_ways))
+		# the tag came before the valid field in the dump
+		self.tag_first = array.array('B', bytes(num_sets * num_ways))
+		self.tag_width = None
+		self._tag_strs = {}
+		# (set, line, field, data) of the dump of the valid lines, None for the full dump
+		self.entries = None
+
+	def _idx(self, s, l):
+		if s < 0 or s >= self.num_sets or l < 0 or l >= self.num_ways:
+			raise Exception(f"cache line out of range: set={s}, line={l}, geometry={self.num_sets}x{self.num_ways}")
+		return s * self.num_ways + l
+
+	def set_valid(self, s, l, valid):
+		self.valid[self._idx(s, l)] = 1 if valid else 0
+
+	def set_tag(self, s, l, tag_str):
+		idx = self._idx(s, l)
+		self.has_tag[idx] = 1
+		if tag_str.startswith("0x"):
+			if self.tag_width == None:
+				self.tag_width = len(tag_str) - 2
+			try:
+				tag = int(tag_str[2:], 16)
+			except ValueError:
+				tag = None
+			if tag != None and tag < 2**64 and self._format_tag(tag) == tag_str:
+				self.tag[idx] = tag
+				return
+		self._tag_strs[idx] = tag_str
+
+	def _format_tag(self, tag):
+		return f"0x{tag:0{self.tag_width}x}"
+
+	def get_tag_str(self, s, l):
+		idx = self._idx(s, l)
+		if not self.has_tag[idx]:
+			return None
+		if idx in self._tag_strs:
+			return self._tag_strs[idx]
+		return self._format_tag(self.tag[idx])
+
+	def to_json_sets(self):
+		# the sets with at least one valid line, with the valid lines only
+		if self.entries != None:
+			return self._entries_to_json_sets()
+		sets = []
+		for s in range(self.num_sets):
+			base = s * self.num_ways
+			lines = []
+			for l in range(self.num_ways):
+				if not self.valid[base + l]:
+					continue
+				l_val = {"line": l}
+				if self.has_tag[base + l] and self.tag_first[base + l]:
+					l_val["tag"] = self.get_tag_str(s, l)
+				l_val["valid"] = True
+				if self.has_tag[base + l] and not self.tag_first[base + l]:
+					l_val["tag"] = self.get_tag_str(s, l)
+				lines.append(l_val)
+			if len(lines) > 0:
+				sets.append({"set": s, "lines": lines})
+		return sets
+
+	def _entries_to_json_sets(self):
+		# an entry per line of the dump, in the order of the dump within the sets, other fields than the tag are dropped
+		lines_of_sets = {}
+		for (s, l, field, data) in self.entries:
+			l_val = {"line": l, "valid": True}
+			l_val[field] = data
+			if not l_val["valid"]:
+				continue
+			lines_of_sets.setdefault(s, []).append(dict(filter(lambda x: x[0] in ["line", "valid", "tag"], l_val.items())))
+		return list(map(lambda s: {"set": s, "lines": lines_of_sets[s]}, sorted(lines_of_sets)))
+
+# cached cache results, see Experiment.get_cache_result: header followed by the columns of the valid cache lines,
+# little endian, tags as u64, then sets and ways as u16, in the order of result.json
+cache_result_bin_magic = b"EXC1"
+cache_result_bin_header = struct.Struct("<4sBBHHxxI")
+
 def parse_uart_single_cache_experiment(lines, board_type):
 	lines = check_uart_experiment_base(lines)
 	# has it been an exception on the board?
@@ -242,74 +450,74 @@ def parse_uart_single_cache_experiment(lines, board_type):
 	assert lines[1] == funcline_full or lines[1] == funcline_simp
 	is_func_full = lines[1] == funcline_full
 	assert lines[2] == sepline
-	lines = lines[3:]
-	assert len(lines) >= 1
-	if lines[-1].startswith(inconclusive_pre):
-		logging.error(f"special result >>> {lines[-1]}")
-		lines = lines[:-1]
-	assert len(lines) >= 1
-	assert lines[-1] == sepline
-	lines = lines[:-1]
+	# the dump is lines[start:end], no copies of the line list
+	start = 3
+	end = len(lines)
+	assert end - start >= 1
+	if lines[end-1].startswith(inconclusive_pre):
+		logging.error(f"special result >>> {lines[end-1]}")
+		end -= 1
+	assert end - start >= 1
+	assert lines[end-1] == sepline
+	end -= 1
 
 	if is_func_full:
-		return parse_uart_single_cache_experiment_full(lines)
+		return parse_uart_single_cache_experiment_full(lines, board_type, start, end)
 	else:
-		return parse_uart_single_cache_experiment_simp(lines, board_type)
-
-def parse_uart_single_cache_experiment_simp(lines, board_type):
-	# find out the number of sets
-	num_sets = None
-	if board_type == "rpi3":
-		num_sets = 128
-	else:
-		raise Exception("unknown board type")
-	assert num_sets != None
-
-	# initialize and fill the data structure
-	sets = []
-	for s in range(0,num_sets):
-		sets.append({"set": s, "lines": []})
-	for line in lines:
-		parts = line.split("::")
+		return parse_uart_single_cache_experiment_simp(lines, board_type, start, end)
+
+def parse_uart_single_cache_experiment_simp(lines, board_type, start = 0, end = None):
+	(num_sets, num_ways) = get_cache_geometry(board_type)
+	cache = CacheState(num_sets, num_ways)
+	cache.entries = []
+	# only the valid lines are printed
+	for i in range(start, len(lines) if end == None else end):
+		parts = lines[i].split("::")
 		s = int(parts[0].strip())
 		l = int(parts[1].strip())
 		d = parts[2].split(":")
 
 		field = d[0].strip()
 		data  = d[1].strip()
-		l_val = {"line": l, "valid": True, field: data}
-		sets[s]["lines"].append(l_val)
-	return sets
-
-def parse_uart_single_cache_experiment_full(lines):
-	s = 0
-	sets = []
-	while len(lines) > 0:
-		assert lines[0] == f"set={s}"
-		lines = lines[1:]
-		s_val = {"set": s, "lines": []}
-		l = 0
-		while len(lines) > 0 and not lines[0].startswith("set"):
-			assert lines[0] == f"line={l}"
-			lines = lines[1:]
-			l_val = {"line": l}
-			while len(lines) > 0 and not lines[0].startswith("set") and not lines[0].startswith("line"):
-				fielddata = lines[0].split(":")
-				lines = lines[1:]
-				field = fielddata[0].strip()
-				data  = fielddata[1].strip()
-
-				if field == "valid":
-					assert data == "0" or data == "1"
-					data = data == "1"
-				assert not field in l_val
-				l_val[field] = data
-			s_val["lines"].append(l_val)
+		cache.set_valid(s, l, True)
+		if field == "tag":
+			cache.set_tag(s, l, data)
+		cache.entries.append((s, l, field, data))
+	return cache
+
+def parse_uart_single_cache_experiment_full(lines, board_type, start = 0, end = None):
+	(num_sets, num_ways) = get_cache_geometry(board_type)
+	cache = CacheState(num_sets, num_ways)
+	s = -1
+	l = None
+	fields = None
+	for i in range(start, len(lines) if end == None else end):
+		line = lines[i]
+		if line.startswith("set"):
+			s += 1
+			assert line == f"set={s}"
+			l = -1
+		elif line.startswith("line"):
+			assert l != None
 			l += 1
-		sets.append(s_val)
-		s += 1
-
-	return sets
+			assert line == f"line={l}"
+			fields = set()
+		else:
+			assert fields != None
+			fielddata = line.split(":")
+			field = fielddata[0].strip()
+			data  = fielddata[1].strip()
+			assert not field in fields
+			fields.add(field)
+
+			if field == "valid":
+				assert data == "0" or data == "1"
+				cache.set_valid(s, l, data == "1")
+			elif field == "tag":
+				cache.set_tag(s, l, data)
+				if not "valid" in fields:
+					cache.tag_first[cache._idx(s, l)] = 1
+	return cache
 
 def eval_uart_pair_cache_experiment(lines):
 	lines = check_uart_experiment_base(lines)
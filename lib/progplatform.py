@@ -1,8 +1,15 @@
 
 import logging
 import os
+import hashlib
+import subprocess
+import signal
+import time
 
 import experiment
+import gitrefs
+import run_times
+import exp_trace
 from helpers import *
 
 def _autodetect_embexp_path(embexp_arg = None):
@@ -14,6 +21,11 @@ def _autodetect_embexp_path(embexp_arg = None):
 	embexp_path = os.path.abspath(embexp_path)
 	return embexp_path
 
+def get_embexp_box_path(embexp_arg):
+	embexp_box_path = os.path.join(_autodetect_embexp_path(embexp_arg), "EmbExp-Box")
+	assert os.path.isdir(embexp_box_path)
+	return embexp_box_path
+
 def get_embexp_ProgPlatform(embexp_arg):
 	const_envnameprogplat = "EMBEXP_PROGPLATFORM"
 	if const_envnameprogplat in os.environ:
@@ -24,6 +36,15 @@ def get_embexp_ProgPlatform(embexp_arg):
 	assert os.path.isdir(progplat_path)
 	return ProgPlatform(progplat_path)
 
+def get_embexp_ProgPlatform_pool(embexp_arg, progplat_paths = None):
+	# one working copy of ProgPlatform per board slot, the default is a single one
+	if progplat_paths == None or len(progplat_paths) == 0:
+		return [get_embexp_ProgPlatform(embexp_arg)]
+	progplat_paths = list(map(os.path.abspath, progplat_paths))
+	if len(set(progplat_paths)) != len(progplat_paths):
+		raise Exception(f"ProgPlatform working copies have to be distinct: {progplat_paths}")
+	return list(map(ProgPlatform, progplat_paths))
+
 def get_default_branch(board_type):
 	assert board_type != None
 	return "scamv_" + board_type
@@ -39,17 +60,44 @@ class ProgPlatform:
 		self._writable = False
 		self.board_type = None
 
-	def get_commit_hash(self):
-		progplat_hash = self._call_git_cmd_get_output(["rev-parse", "HEAD"], "coudln't get commit hash")
+		self._refs = gitrefs.GitRefResolver(self.progplat_path)
+		self.build_cache = None
+		self._batch_size = None
+		self._prebuilt = False
+		self._run_timeout = None
+		# a run_times.RunTimeHistory, the runs are stopped after the timeout learned from it, only with stream_uart
+		self.run_times = None
+		self._run_time_key = None
+		self._run_time_scale = 1
+		# a board_conn.BoardConnection that is kept open for all runs
+		self.board_conn = None
+
+		# follow temp/uart.log while make runs and terminate make early_abort_grace seconds after the output is complete,
+		# off by default, because it cuts short whatever the runlog targets do after the output
+		self.stream_uart = False
+		self.early_abort_grace = 5
+
+	def _resolve_ref(self, name):
+		# resolve in-process, fall back to git for anything the resolver doesn't handle
+		try:
+			progplat_hash = self._refs.resolve(name)
+		except Exception as e:
+			logging.debug(f"couldn't resolve {name} in-process: {e}")
+			progplat_hash = None
+		if progplat_hash != None:
+			return progplat_hash
+		progplat_hash = self._call_git_cmd_get_output(["rev-parse", "--verify", "-q", name], "coudln't get commit hash")
 		return progplat_hash.decode("ascii").strip()
 
+	def get_commit_hash(self):
+		return self._resolve_ref("HEAD")
+
 	def get_branch_commit_hash(self, branchname):
 		try:
-			progplat_hash = self._call_git_cmd_get_output(["rev-parse", branchname], "coudln't get commit hash")
+			return self._resolve_ref(branchname)
 		except:
 			# TODO: fix better handling of this case
-			progplat_hash = self._call_git_cmd_get_output(["rev-parse", f"origin/{branchname}"], "coudln't get commit hash")
-		return progplat_hash.decode("ascii").strip()
+			return self._resolve_ref(f"origin/{branchname}")
 
 	def get_configured_run_id(self):
 		assert self.board_type != None
@@ -106,42 +154,233 @@ class ProgPlatform:
 		with open(os.path.join(self.progplat_path, f"all/inc/experiment/{filename}"), "w+") as f:
 			f.write(contents)
 
-	def configure_experiment(self, board_type, exp, num_mul_runs = 10):
-		assert self._writable
+	def _write_config(self, board_type, exp, num_mul_runs, batch_size = None):
 		exp_type = exp.get_exp_type()
-		assert exp_type == "exps2" or exp_type == "exps1"
-
-		self.board_type = board_type
-
-		logging.debug(f"reading input files")
-		code_asm = exp.get_code()
-		train    = exp.get_input_file("train.json")
-		input1   = exp.get_input_file("input1.json")
-		if exp_type == "exps2":
-			input2   = exp.get_input_file("input2.json")
-
 		config_text = ""
 		config_text += f"PROGPLAT_ARCH         ={exp.get_exp_arch()}\n"
 		config_text += f"PROGPLAT_TYPE         ={exp.get_exp_type()}\n"
 		config_text += f"PROGPLAT_PARAMS       ={exp.get_exp_params_id()}\n"
 		config_text += f"PROGPLAT_BOARD        ={board_type}\n"
+		# a batch gets the time of all its experiments
+		timeout_factor = 1 if batch_size == None else batch_size
+		self._run_timeout = None
 		if exp_type == "exps2":
-			config_text += f"PROGPLAT_RUN_TIMEOUT  =60\n"
+			self._run_timeout = 60 * timeout_factor
 		elif exp_type == "exps1":
-			config_text += f"PROGPLAT_RUN_TIMEOUT  =80\n"
+			self._run_timeout = 80 * timeout_factor
+		if self._run_timeout != None:
+			config_text += f"PROGPLAT_RUN_TIMEOUT  ={self._run_timeout}\n"
+		# the configured timeout stays fixed, so that the build output does not depend on the history
+		self._run_time_key = run_times.get_run_time_key(exp.get_exp_class(), board_type, num_mul_runs)
+		self._run_time_scale = timeout_factor
 		config_text += f"__PROGPLAT_MUL_RUNS__ ={num_mul_runs}\n"
+		if batch_size != None:
+			config_text += f"PROGPLAT_BATCH_SIZE   ={batch_size}\n"
 		with open(os.path.join(self.progplat_path, f"Makefile.config"), "w+") as f:
 			f.write(config_text)
 
-		self.write_experiment_file("asm.h", code_asm)
-		self.write_experiment_file("asm_train.h", gen_input_code(train))
-		self.write_experiment_file("asm_setup1.h", gen_input_code(input1))
-		if exp_type == "exps2":
-			self.write_experiment_file("asm_setup2.h", gen_input_code(input2))
+	def _write_experiment_headers(self, exp, suffix = ""):
+		exp_type = exp.get_exp_type()
+		assert exp_type == "exps2" or exp_type == "exps1"
 
+		logging.debug(f"reading input files")
+		with exp_trace.stage("read_inputs"):
+			code_asm = exp.get_code()
+			train    = exp.get_input_file("train.json")
+			input1   = exp.get_input_file("input1.json")
+			if exp_type == "exps2":
+				input2   = exp.get_input_file("input2.json")
 
-	def run_experiment(self, conn_mode = None):
+		with exp_trace.stage("gen_code"):
+			self.write_experiment_file(f"asm{suffix}.h", code_asm)
+			self.write_experiment_file(f"asm_train{suffix}.h", gen_input_code(train))
+			self.write_experiment_file(f"asm_setup1{suffix}.h", gen_input_code(input1))
+			if exp_type == "exps2":
+				self.write_experiment_file(f"asm_setup2{suffix}.h", gen_input_code(input2))
+
+	def configure_experiment(self, board_type, exp, num_mul_runs = 10):
+		assert self._writable
+		exp_type = exp.get_exp_type()
+		assert exp_type == "exps2" or exp_type == "exps1"
+
+		self.board_type = board_type
+		self._batch_size = None
+		self._prebuilt = False
+
+		self._write_config(board_type, exp, num_mul_runs)
+		self._write_experiment_headers(exp)
+
+	def configure_experiment_batch(self, board_type, exps, num_mul_runs = 10):
+		# several experiments of the same class in one image, experiment i uses the headers with suffix _i,
+		# the image has to delimit their outputs with lines as expected by split_uart_batch_experiment
+		assert self._writable
+		assert len(exps) > 0
+		exp_class = exps[0].get_exp_class()
+		for exp in exps:
+			assert exp.get_exp_class() == exp_class
+
+		self.board_type = board_type
+		self._batch_size = len(exps)
+		self._prebuilt = False
+
+		self._write_config(board_type, exps[0], num_mul_runs, len(exps))
+		for (i, exp) in enumerate(exps):
+			self._write_experiment_headers(exp, f"_{i}")
+		self.write_experiment_file("batch.h", f"#define __PROGPLAT_BATCH_SIZE__ {len(exps)}\n")
+
+	def get_learned_timeout(self):
+		# the timeout of the configured run learned from the history, None without history
+		if self.run_times == None or self._run_timeout == None:
+			return None
+		scale = self._run_time_scale
+		return self.run_times.get_timeout(self._run_time_key, self._run_timeout / scale) * scale
+
+	def _run_make_streaming(self, makecmdl, error_msg, uartlog_path):
+		# tail the uart log while make runs and stop as soon as the experiment output is complete,
+		# instead of waiting for the run timeout of ProgPlatform on hung or crashed boards,
+		# with a run time history, the run is also stopped when it takes longer than the learned timeout
+		output_file = None if self.show_outputs else subprocess.DEVNULL
+		parser = UartStreamParser(1 if self._batch_size == None else self._batch_size)
+		learned_timeout = self.get_learned_timeout()
+		if learned_timeout != None and learned_timeout >= self._run_timeout:
+			learned_timeout = None
+		start_time = time.monotonic()
+		proc = subprocess.Popen(["make", "-C", self.progplat_path] + makecmdl, stdout=output_file, stderr=output_file, start_new_session=True)
+		uartlog_file = None
+		output_time = None
+		done_time = None
+		try:
+			while True:
+				res = proc.poll()
+				if uartlog_file == None and os.path.isfile(uartlog_path):
+					uartlog_file = open(uartlog_path, "rb")
+				if uartlog_file != None and not parser.done:
+					data = uartlog_file.read()
+					if output_time == None and len(data) > 0:
+						output_time = time.monotonic()
+					if parser.feed(data):
+						logging.info(f"experiment output complete: {parser.reason}")
+						done_time = time.monotonic()
+				if res != None:
+					break
+				# let make finish on its own for a moment, e.g. to disconnect properly
+				if done_time != None and time.monotonic() - done_time > self.early_abort_grace:
+					logging.info("stopping the run early")
+					os.killpg(proc.pid, signal.SIGTERM)
+					proc.wait()
+					res = 0
+					break
+				if done_time == None and learned_timeout != None and time.monotonic() - start_time > learned_timeout:
+					os.killpg(proc.pid, signal.SIGTERM)
+					proc.wait()
+					raise ExpFailure("timeout", f"command make {makecmdl} stopped after the learned timeout of {learned_timeout}s : {error_msg}")
+				time.sleep(0.05)
+		except:
+			if proc.poll() == None:
+				os.killpg(proc.pid, signal.SIGTERM)
+				proc.wait()
+			raise
+		finally:
+			if uartlog_file != None:
+				uartlog_file.close()
+			# the stages of the run: until the first output (connection, upload),
+			# until the output is complete, and until make is done
+			end_time = time.monotonic()
+			exp_trace.record("upload", start_time, output_time if output_time != None else end_time)
+			if output_time != None:
+				exp_trace.record("execute", output_time, done_time if done_time != None else end_time)
+			if done_time != None:
+				exp_trace.record("teardown", done_time, end_time)
+		if res != 0:
+			# a run that fails only after the run timeout has not completed on the board in time
+			if self._run_timeout != None and time.monotonic() - start_time >= self._run_timeout:
+				raise ExpFailure("timeout", f"command make {makecmdl} not successful after the run timeout of {self._run_timeout}s: {res} : {error_msg}")
+			raise ExpFailure("run", f"command make {makecmdl} not successful: {res} : {error_msg}")
+		# only complete runs without board exception are representative
+		if self.run_times != None and done_time != None and parser.reason == "Experiment complete.":
+			self.run_times.add(self._run_time_key, (done_time - start_time) / self._run_time_scale)
+
+	def build(self):
+		# builds the configured experiment without running it, so that it can be prepared while a board is busy
+		build_cache_key = None
+		if self.build_cache != None:
+			with exp_trace.stage("build_cache"):
+				build_cache_key = self.build_cache.get_key(self)
+				build_cache_hit = self.build_cache.restore(self, build_cache_key)
+			if build_cache_hit:
+				self._prebuilt = True
+				return
+		try:
+			with exp_trace.stage("build"):
+				self._call_make_cmd([], "building the experiment failed")
+		except Exception as e:
+			raise ExpFailure("build", str(e))
+		if build_cache_key != None:
+			with exp_trace.stage("build_cache"):
+				self.build_cache.store(self, build_cache_key)
+		self._prebuilt = True
+
+	def _run_experiment_target(self, maketarget):
 		error_msg = "experiment didn't run successful"
+		# the timeouts and run times of a streamed run are those of the board, the image is built before
+		if self.stream_uart and not self._prebuilt:
+			self.build()
+		# reuse the build output of an identically configured experiment if possible
+		build_cache_key = None
+		build_cache_hit = False
+		if self.build_cache != None and not self._prebuilt:
+			with exp_trace.stage("build_cache"):
+				build_cache_key = self.build_cache.get_key(self)
+				build_cache_hit = self.build_cache.restore(self, build_cache_key)
+		uartlog_path = os.path.join(self.progplat_path, "temp/uart.log")
+		if self.stream_uart:
+			# don't pick up the output of a previous run
+			if os.path.isfile(uartlog_path):
+				os.remove(uartlog_path)
+			self._run_make_streaming([maketarget], error_msg, uartlog_path)
+		else:
+			try:
+				with exp_trace.stage("run"):
+					self._call_make_cmd([maketarget], error_msg)
+			except Exception as e:
+				raise ExpFailure("run", str(e))
+		if build_cache_key != None and not build_cache_hit:
+			with exp_trace.stage("build_cache"):
+				self.build_cache.store(self, build_cache_key)
+		# read and return the uart output (binary)
+		with open(uartlog_path, "rb") as f:
+				uartlogdata = f.read()
+		return uartlogdata
+
+	def _run_experiment_connected(self):
+		# runs over the managed connection, a failed or timed out run is repeated, first as is and then after reconnecting
+		num_attempts = 3
+		for attempt in range(num_attempts):
+			with exp_trace.stage("connect"):
+				self.board_conn.ensure()
+			try:
+				uartlogdata = self._run_experiment_target("runlog")
+				# a board that doesn't even complete the init is not reachable
+				if not uartlogdata.startswith(b"Init complete."):
+					raise ExpFailure("run", f"no output from the board: {uartlogdata[:80]}")
+				self.board_conn.report_success()
+				return uartlogdata
+			except KeyboardInterrupt:
+				raise
+			except Exception as e:
+				# e.g. a build error doesn't get better with another connection
+				if not get_failure_category(e) in ["run", "timeout"]:
+					raise
+				logging.warning(f"run on board failed: {e}")
+				self.board_conn.report_failure()
+				if attempt == num_attempts - 1:
+					raise
+
+	def run_experiment(self, conn_mode = None):
+		if self.board_conn != None:
+			if conn_mode != None and conn_mode != "run":
+				logging.debug(f"conn_mode {conn_mode} is ignored with a managed board connection")
+			return self._run_experiment_connected()
 		maketarget = "targetdoesnotexist"
 		if conn_mode == "try" or conn_mode == None:
 			maketarget = "runlog_try"
@@ -151,10 +390,131 @@ class ProgPlatform:
 			maketarget = "runlog_reset"
 		else:
 			raise Exception(f"invalid conn_mode: {conn_mode}")
-		self._call_make_cmd([maketarget], error_msg)
-		# read and return the uart output (binary)
-		with open(os.path.join(self.progplat_path, "temp/uart.log"), "rb") as f:
-				uartlogdata = f.read()
-		return uartlogdata
+		return self._run_experiment_target(maketarget)
+
+def _git_blob_hash(filepath):
+	with open(filepath, "rb") as f:
+		data = f.read()
+	return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
 
+# a ProgPlatform session checks out the branch once into a dedicated worktree and keeps it for a whole batch,
+# between experiments only the experiment configuration files are reset and the build output is kept
+class ProgPlatformSession(ProgPlatform):
+	# these are the only files that configure_experiment/write_experiment_file touch
+	managed_files = ["Makefile.config"]
+	managed_dirs  = ["all/inc/experiment"]
+
+	def __init__(self, progplat, branchname, worktree_path = None):
+		if worktree_path == None:
+			worktree_path = f"{progplat.progplat_path}.session.{branchname}"
+		worktree_path = os.path.abspath(worktree_path)
+		self.base_progplat = progplat
+		self.branchname = branchname
+		self.commit_hash = progplat.get_branch_commit_hash(branchname)
+
+		if not os.path.isdir(worktree_path):
+			logging.info(f"creating worktree for session: {worktree_path}")
+			progplat._call_git_cmd(["worktree", "add", "--detach", worktree_path, self.commit_hash], f"couldn't create worktree {worktree_path}")
+		ProgPlatform.__init__(self, worktree_path)
+		if not os.path.isfile(os.path.join(self.progplat_path, ".git")):
+			raise Exception(f"not a worktree of ProgPlatform: {self.progplat_path}")
+
+		# bring the worktree to the branch commit once, keep the ignored build output
+		self._call_git_cmd(["checkout", "--detach", "--force", self.commit_hash], f"couldn't checkout {self.commit_hash} in session worktree")
+		self._call_git_cmd(["clean", "-fd", self.progplat_path], "couldn't clean session worktree")
+		is_clean = self._call_git_cmd_get_output(["status", "--porcelain"], "error checking for clean repo") == b''
+		if not is_clean:
+			raise Exception(f"session worktree is not clean: {self.progplat_path}")
+
+		self._build_manifest()
+		self._writable = True
+
+	def _build_manifest(self):
+		# tracked files with their blob hashes and stat information, so that integrity checks only need stat calls
+		self._manifest = {}
+		self._managed_contents = {}
+		lines = self._call_git_cmd_get_output(["ls-files", "-s", "-z"], "couldn't list tracked files").split(b'\0')
+		for line in lines:
+			if line == b'':
+				continue
+			(info, path) = line.decode().split("\t", 1)
+			(mode, blob_hash, stage) = info.split(" ")
+			# skip submodules and symlinks, they are not touched by experiments
+			if not mode.startswith("100"):
+				continue
+			filepath = os.path.join(self.progplat_path, path)
+			st = os.stat(filepath)
+			self._manifest[path] = (blob_hash, st.st_mtime_ns, st.st_size)
+			if self._is_managed(path):
+				with open(filepath, "rb") as f:
+					self._managed_contents[path] = f.read()
+
+	def _is_managed(self, path):
+		return path in self.managed_files or os.path.dirname(path) in self.managed_dirs
+
+	def _reset_managed(self):
+		# restore tracked configuration files and remove any other files in the experiment directories
+		for path in self._managed_contents:
+			filepath = os.path.join(self.progplat_path, path)
+			(blob_hash, mtime_ns, size) = self._manifest[path]
+			st = os.stat(filepath) if os.path.isfile(filepath) else None
+			if st != None and st.st_mtime_ns == mtime_ns and st.st_size == size:
+				continue
+			with open(filepath, "wb") as f:
+				f.write(self._managed_contents[path])
+			st = os.stat(filepath)
+			self._manifest[path] = (blob_hash, st.st_mtime_ns, st.st_size)
+		for d in self.managed_dirs:
+			dirpath = os.path.join(self.progplat_path, d)
+			if not os.path.isdir(dirpath):
+				continue
+			for filename in os.listdir(dirpath):
+				path = f"{d}/{filename}"
+				if not path in self._manifest:
+					os.remove(os.path.join(dirpath, filename))
+		for path in self.managed_files:
+			filepath = os.path.join(self.progplat_path, path)
+			if not path in self._manifest and os.path.isfile(filepath):
+				os.remove(filepath)
+
+	def _verify_manifest(self):
+		for path in self._manifest:
+			(blob_hash, mtime_ns, size) = self._manifest[path]
+			filepath = os.path.join(self.progplat_path, path)
+			try:
+				st = os.stat(filepath)
+			except FileNotFoundError:
+				raise Exception(f"tracked file has been removed in session worktree: {filepath}")
+			if st.st_mtime_ns == mtime_ns and st.st_size == size:
+				continue
+			# only hash the contents if the stat information changed
+			if _git_blob_hash(filepath) != blob_hash:
+				raise Exception(f"tracked file has been modified in session worktree: {filepath}")
+			self._manifest[path] = (blob_hash, st.st_mtime_ns, st.st_size)
+
+	def get_commit_hash(self):
+		return self.commit_hash
+
+	def get_branch_commit_hash(self, branchname):
+		return self.base_progplat.get_branch_commit_hash(branchname)
+
+	def check_clean(self, force_cleanup = None):
+		if force_cleanup == "ignored":
+			logging.debug("cleaning only ignored files/directories in the session worktree")
+			self._call_git_cmd(["clean", "-fdX", self.progplat_path],  "couldn't clean session worktree")
+		elif force_cleanup == "all" or force_cleanup == None:
+			pass
+		else:
+			raise Exception(f"unknown option for force_cleanup: {force_cleanup}")
+		logging.debug("resetting experiment files and checking session worktree")
+		self._reset_managed()
+		self._verify_manifest()
+		self._writable = True
+
+	def change_branch(self, branchname):
+		assert self._writable
+		if branchname != self.branchname:
+			raise Exception(f"session is for branch {self.branchname}, cannot change to {branchname}")
 
+	def close(self):
+		self._reset_managed()
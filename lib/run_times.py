@@ -0,0 +1,78 @@
+
+import logging
+import os
+import math
+import time
+import sqlite3
+import threading
+
+from helpers import *
+
+def get_default_run_times_path():
+	return get_logs_path(".cache/run_times.sqlite")
+
+_default_run_times = None
+def get_default_run_times():
+	global _default_run_times
+	if _default_run_times == None:
+		_default_run_times = RunTimeHistory(get_default_run_times_path())
+	return _default_run_times
+
+def get_run_time_key(exp_class, board_type, num_mul_runs):
+	return f"{exp_class}/{board_type}/{num_mul_runs}"
+
+# durations of the successful runs per experiment class, board type and repetition count,
+# the timeout of a run is a high percentile of the recent durations times a safety factor
+class RunTimeHistory:
+	def __init__(self, history_path, window = 200, percentile = 0.95, factor = 3, min_samples = 10, min_timeout = 10):
+		history_dir = os.path.dirname(history_path)
+		if not os.path.isdir(history_dir):
+			os.makedirs(history_dir)
+		self.window = window
+		self.percentile = percentile
+		self.factor = factor
+		self.min_samples = min_samples
+		self.min_timeout = min_timeout
+
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(history_path, timeout=60, check_same_thread=False)
+		self._db.executescript("""
+			CREATE TABLE IF NOT EXISTS run_times (
+				key      TEXT NOT NULL,
+				duration REAL NOT NULL,
+				time     REAL NOT NULL
+			);
+			CREATE INDEX IF NOT EXISTS run_times_key ON run_times (key);
+		""")
+		self._db.commit()
+		self._n_added = 0
+
+	def add(self, key, duration):
+		with self._lock:
+			self._db.execute("INSERT INTO run_times VALUES (?, ?, ?)", (key, duration, time.time()))
+			self._n_added += 1
+			# only the last durations are used, drop the older ones from time to time
+			if self._n_added % self.window == 0:
+				self._db.execute("DELETE FROM run_times WHERE key = ? AND rowid NOT IN (SELECT rowid FROM run_times WHERE key = ? ORDER BY rowid DESC LIMIT ?)", (key, key, self.window))
+			self._db.commit()
+
+	def get_durations(self, key):
+		with self._lock:
+			rows = self._db.execute("SELECT duration FROM run_times WHERE key = ? ORDER BY rowid DESC LIMIT ?", (key, self.window)).fetchall()
+		return list(map(lambda x: x[0], rows))
+
+	def get_timeout(self, key, default):
+		# the learned timeout in seconds, at most the default, which is also used without enough history
+		durations = sorted(self.get_durations(key))
+		if len(durations) < self.min_samples:
+			return default
+		# nearest rank
+		duration = durations[max(0, math.ceil(self.percentile * len(durations)) - 1)]
+		timeout = max(self.min_timeout, math.ceil(duration * self.factor))
+		return min(timeout, default)
+
+	def get_summary(self):
+		# key -> (number of durations, learned timeout without upper bound)
+		with self._lock:
+			keys = list(map(lambda x: x[0], self._db.execute("SELECT DISTINCT key FROM run_times ORDER BY key").fetchall()))
+		return dict(map(lambda key: (key, (len(self.get_durations(key)), self.get_timeout(key, math.inf))), keys))
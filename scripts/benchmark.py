@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
+
+import argparse
+import logging
+import json
+
+import exp_bench
+from helpers import *
+
+# parse arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-f", "--filter",      help="only run the benchmarks whose names start with one of these prefixes, for example: micro tree/status", nargs="+")
+parser.add_argument("-n", "--num_exps",    help="comma separated sizes of the synthetic experiment trees, default: 1000,10000", default="1000,10000")
+parser.add_argument("-td", "--tree_dir",   help="directory for the synthetic experiment trees, which are reused when they exist, default: .cache/bench")
+parser.add_argument("-r", "--repeat",      help="repetitions of the micro benchmarks, default: 5", type=int, default=5)
+parser.add_argument("-rt", "--repeat_tree", help="repetitions of the benchmarks on the trees, default: 3", type=int, default=3)
+parser.add_argument("-j", "--jobs",        help="number of processes to collect the status with, default: 1", type=int, default=1)
+parser.add_argument("-s", "--seed",        help="seed of the synthetic inputs and trees, default: 0", type=int, default=0)
+
+parser.add_argument("-o", "--output",      help="write the results as json to this file, e.g. as baseline")
+parser.add_argument("-b", "--baseline",    help="compare the results with a json file written before with -o")
+parser.add_argument("-t", "--threshold",   help="relative difference of the minimum time from which a benchmark counts as slower or faster, default: 0.1", type=float, default=0.1)
+parser.add_argument("--json",              help="print the results as json", action="store_true")
+
+parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+args = parser.parse_args()
+
+# set log level
+if args.verbose:
+	logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+else:
+	logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+
+sizes = list(map(int, args.num_exps.split(",")))
+tree_dir = args.tree_dir
+if tree_dir == None:
+	tree_dir = get_logs_path(".cache/bench")
+name_filter = lambda name: args.filter == None or any(map(lambda x: name.startswith(x), args.filter))
+
+results = exp_bench.run_micro_benchmarks(name_filter, args.repeat, args.seed)
+results.update(exp_bench.run_tree_benchmarks(name_filter, tree_dir, sizes, args.repeat_tree, args.jobs, args.seed))
+if len(results) == 0:
+	raise Exception("no benchmark matches the filter")
+results_json = exp_bench.get_results_json(results)
+
+if args.output != None:
+	with open(args.output, "w") as f:
+		json.dump(results_json, f, indent=2, sort_keys=True)
+		f.write("\n")
+
+if args.json:
+	print(json.dumps(results_json, indent=2, sort_keys=True))
+else:
+	print(exp_bench.get_results_str(results))
+
+if args.baseline != None:
+	with open(args.baseline, "r") as f:
+		baseline = json.load(f)
+	# the benchmarks that have not been run are not missing
+	baseline["benchmarks"] = dict(filter(lambda x: name_filter(x[0]), baseline["benchmarks"].items()))
+	rows = exp_bench.compare_results(baseline, results_json, args.threshold)
+	if not args.json:
+		print()
+		print(exp_bench.get_comparison_str(rows))
+	# e.g. for a check before merging
+	if any(map(lambda x: x[4] == "slower", rows)):
+		logging.error("some benchmarks are slower than the baseline")
+		sys.exit(1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
+
+import argparse
+import logging
+import json
+
+import exp_catalog
+import exp_compare
+from helpers import *
+
+# parse arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("exp_class", help="class of experiment: arm8/exps2/exp_cache_multiw")
+parser.add_argument("run_id", help="id of run to compare, for example: 13700076ab79095f15468f0c489fa587ac225626.rpi3")
+
+parser.add_argument("-rb", "--run_id_b", help="id of run to compare with in the working directory, default: the same run_id")
+parser.add_argument("-r", "--rev",       help="git revision to take the results of run_id from, default: HEAD, or the working directory if run_id_b is given")
+
+parser.add_argument("-p", "--print_ids", help="print the experiment ids of the unexpected transitions", action="store_true")
+parser.add_argument("-pa", "--print_all_ids", help="print the experiment ids of all transitions", action="store_true")
+parser.add_argument("-j", "--jobs",      help="number of processes to read the results with, default: number of cpus", type=int)
+parser.add_argument("--json",            help="print the comparison as json", action="store_true")
+
+parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+args = parser.parse_args()
+
+# set log level
+if args.verbose:
+	logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+else:
+	logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+
+exp_class = args.exp_class
+run_id_a = args.run_id
+run_id_b = args.run_id_b
+rev = args.rev
+# defaults, compare the committed results with the rerun in the working directory
+if run_id_b == None:
+	run_id_b = run_id_a
+	if rev == None:
+		rev = "HEAD"
+side_a = (run_id_a, rev)
+side_b = (run_id_b, None)
+assert side_a != side_b
+
+catalog = exp_catalog.get_default_catalog()
+exp_ids = catalog.get_exp_ids(exp_class)
+
+comparison = exp_compare.RunComparison(side_a, side_b)
+comparison.compare(exp_ids, args.jobs)
+unexpected = comparison.get_unexpected()
+
+def side_str(side):
+	(run_id, rev) = side
+	return run_id if rev == None else f"{rev}:{run_id}"
+
+if args.json:
+	cells = comparison.cells if args.print_all_ids else unexpected
+	print(json.dumps({
+		"a": side_str(side_a),
+		"b": side_str(side_b),
+		"n_exps": comparison.n_exps,
+		"n_unexpected": sum(map(len, unexpected.values())),
+		"matrix": list(map(lambda x: {"a": x[0][0], "b": x[0][1], "n": len(x[1]), "expected": not x[0] in unexpected}, sorted(comparison.cells.items()))),
+		"ids": list(map(lambda x: {"a": x[0][0], "b": x[0][1], "exp_ids": x[1]}, sorted(cells.items()) if (args.print_ids or args.print_all_ids) else [])),
+	}, indent=2))
+else:
+	print(f"a = {side_str(side_a)}")
+	print(f"b = {side_str(side_b)}")
+	print()
+	print(f"n_exps = {comparison.n_exps}")
+	print()
+	print(comparison.get_matrix_str())
+	print(f"n_unexpected = {sum(map(len, unexpected.values()))}")
+	print()
+
+	cells = comparison.cells if args.print_all_ids else unexpected
+	if args.print_ids or args.print_all_ids:
+		for ((state_a, state_b), cell_exp_ids) in sorted(cells.items()):
+			print(f"{state_a} -> {state_b}:")
+			print("=" * 40)
+			for exp_id in cell_exp_ids:
+				print(exp_id)
+			print()
+			print()
+
+# only transitions from or to inconclusive are expected in a rerun
+if len(unexpected) > 0:
+	sys.exit(1)
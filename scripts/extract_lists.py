@@ -10,6 +10,7 @@ import json
 import subprocess
 
 import experiment
+import exp_pack
 from helpers import *
 
 # parse arguments
@@ -39,11 +40,11 @@ print(f"Name of lists:   {name}")
 print(f"Number of lists: {num_lists}")
 print()
 
+# the class may also be packed
 exps_dir = get_logs_path(exp_class)
-if not os.path.isdir(exps_dir):
+if not exp_pack.isdir(exps_dir):
 	raise Exception(f"not a directory in logs: {exp_class}")
-directory_content = next(os.walk(exps_dir))
-exp_hashes = directory_content[1] + directory_content[2]
+exp_hashes = exp_pack.listdir(exps_dir)
 
 lists_dir = get_logs_path("lists")
 if not os.path.isdir(lists_dir):
@@ -57,11 +58,11 @@ for exp_hash in exp_hashes:
 	exp_id = exp_class + "/" + exp_hash
 	exp_path = exps_dir + "/" + exp_hash
 
-	if not os.path.isdir(exp_path):
+	if not exp_pack.isdir(exp_path):
 		print("WARN: not a directory: " + exp_hash)
 		continue
 
-	if len(next(os.walk(exp_path))[2]) == 0:
+	if not any(map(lambda x: exp_pack.isfile(exp_path + "/" + x), exp_pack.listdir(exp_path))):
 		print("WARN: empty directory (no files): " + exp_hash)
 		continue
 
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
+
+import argparse
+import logging
+
+import exp_import
+from helpers import *
+
+# parse arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-f", "--format",         help="format of the experiments on stdin, default: jsonl", choices=['jsonl', 'tar'])
+parser.add_argument("-bs", "--batch_size",    help="number of experiments to write at once, default: 256", type=int, default=256)
+parser.add_argument("-l", "--hardlinks",     help="store identical files as hardlinks instead of copies", action="store_true")
+
+parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+args = parser.parse_args()
+
+# set log level
+if args.verbose:
+	logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+else:
+	logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+
+importer = exp_import.ExpImporter(args.hardlinks, args.batch_size)
+try:
+	if args.format == "tar":
+		importer.import_tar(sys.stdin.buffer)
+	else:
+		importer.import_jsonl(sys.stdin)
+finally:
+	importer.close()
+
+print(importer.get_stats_str())
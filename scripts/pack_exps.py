@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
+
+import argparse
+import logging
+import shutil
+
+import exp_pack
+from helpers import *
+
+# parse arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("command", help="pack the class directory into a single file or unpack it again", choices=['pack', 'unpack'])
+parser.add_argument("exp_class", help="class of experiment: arm8/exps2/exp_cache_multiw")
+
+parser.add_argument("-k", "--keep", help="keep the class directory after packing or the pack after unpacking", action="store_true")
+
+parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+args = parser.parse_args()
+
+# set log level
+if args.verbose:
+	logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+else:
+	logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+
+exp_class  = args.exp_class.rstrip("/")
+# the packs are looked up for the class of an experiment, e.g. arm8/exps2/cache_multiw,
+# the programs are shared by the classes and stay directories
+if len(exp_class.split("/")) != 3 or exp_class.split("/")[1] == "progs":
+	raise Exception(f"not an experiment class: {exp_class}")
+class_path = get_logs_path(exp_class)
+pack_path  = exp_pack.get_class_pack_path(exp_class)
+
+if args.command == "pack":
+	if not os.path.isdir(class_path):
+		raise Exception(f"not a directory in logs: {exp_class}")
+	n = exp_pack.write_pack(pack_path, class_path)
+	if not args.keep:
+		shutil.rmtree(class_path)
+	print(f"packed {n} files into {pack_path}")
+elif args.command == "unpack":
+	if os.path.exists(class_path):
+		raise Exception(f"class directory exists already: {class_path}")
+	if not os.path.isfile(pack_path):
+		raise Exception(f"pack doesn't exist: {pack_path}")
+	n = exp_pack.unpack_pack(pack_path, class_path)
+	if not args.keep:
+		os.remove(pack_path)
+	print(f"unpacked {n} files into {class_path}")
+else:
+	raise Exception(f"unknown command: {args.command}")
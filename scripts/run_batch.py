@@ -8,8 +8,14 @@ import argparse
 import logging
 
 import progplatform
-import exp_runner
+import build_cache
+import board_conn
 import exp_finder
+import exp_scheduler
+import exp_retry
+import run_times
+import exp_trace
+import exp_metrics
 
 # parse arguments
 parser = argparse.ArgumentParser()
@@ -19,10 +25,39 @@ parser.add_argument("-bt", "--board_type", help="broad_type", choices=['rpi3', '
 parser.add_argument("-am", "--auto_mode", help="automatic mode: all, fix (default). run for all present experiments or just fix the unfinished ones that run with the current master branch of ProgPlatform (no result file)")
 
 parser.add_argument("-ep", "--embexp_path",   help="see run_experiment.py.")
-
+parser.add_argument("-pp", "--progplat_path", help="working copy of ProgPlatform for one board slot, can be given multiple times to run on several boards at once", action="append")
+
+parser.add_argument("-s", "--session",       help="check out the ProgPlatform branch once into a dedicated worktree per board slot and keep the build output between experiments", action="store_true")
+parser.add_argument("-bc", "--build_cache",   help="directory for caching the ProgPlatform build output of identically configured experiments")
+parser.add_argument("-bcs", "--build_cache_size", help="maximum size of the build cache in MB, default: 2048", type=int, default=2048)
+parser.add_argument("-bca", "--build_cache_artifacts", help="comma separated directories of the ProgPlatform working copy with the build output, default: output", default="output")
+
+parser.add_argument("-pl", "--pipeline",      help="prepare and build the next experiment in a second session worktree per board slot while the board runs the current one, needs -s", action="store_true")
+parser.add_argument("-bs", "--batch_size",    help="compile this many experiments of a class into one image, needs a ProgPlatform branch with batch support", type=int)
+
+parser.add_argument("-c", "--connect",        help="keep a connection to the board of each slot open for the whole batch and reconnect when runs fail, instead of connecting for each experiment", action="store_true")
+parser.add_argument("-ccmd", "--connect_cmd", help="command for the connection with {board_type} and {slot} as placeholders, default: EmbExp-Box/interface/remote.py {board_type}, or EMBEXP_BOX_CONNECT_CMD")
+parser.add_argument("-crp", "--connect_ready_pattern", help="regular expression for the output of the connection command that indicates an established connection, default: wait a few seconds")
+parser.add_argument("-ra", "--retry_attempts", help="attempts per experiment if runs fail in a way that may not happen again (run, timeout, parse), default: 3", type=int, default=3)
+parser.add_argument("-rbo", "--retry_backoff", help="seconds before the first retry of a failed experiment, doubled for each further retry, default: 30", type=int, default=30)
+parser.add_argument("-rsa", "--reset_after",  help="reset the board after this many consecutive failed runs, default: never", type=int)
+parser.add_argument("-qa", "--quarantine_after", help="stop using a board for a while after this many consecutive failed runs, default: never", type=int)
+parser.add_argument("-qt", "--quarantine_time", help="seconds of the first quarantine of a board, doubled for each further one, default: 300", type=int, default=300)
+parser.add_argument("-qm", "--max_quarantines", help="stop using a board for the rest of the batch after this many quarantines, default: never", type=int)
+parser.add_argument("-su", "--stream_uart",   help="see run_experiment.py.", action="store_true")
+parser.add_argument("-lt", "--learn_timeouts", help="record the durations of successful runs per class and stop runs that take much longer than usual, instead of waiting for the fixed run timeout, needs -su", action="store_true")
+parser.add_argument("-ltf", "--learned_timeout_factor", help="the learned timeout is the 95th percentile of the recent durations times this factor, default: 3", type=float, default=3)
+parser.add_argument("-mr", "--mul_runs",      help="repetition counts of the experiment programs, comma separated, e.g., 3,10,30: experiments run with the first count and again with the next one as long as they are unequal or inconclusive, the count is recorded in mul_runs.json, default: always 10 without record")
 parser.add_argument("-cm", "--conn_mode",     help="see run_experiment.py.")
 parser.add_argument("-fr", "--force_results", help="see run_experiment.py.", action="store_true")
 
+parser.add_argument("-tr", "--trace",         help="write the start and end of each stage of the experiment runs to this file as json lines")
+parser.add_argument("-trc", "--trace_chrome", help="write the stages of the experiment runs to this file in the chrome trace event format, for chrome://tracing or perfetto")
+
+parser.add_argument("-ms", "--metrics_status", help="rewrite this file periodically with the throughput, counts, board states and ETA, as json or, with the extension .prom, as prometheus textfile")
+parser.add_argument("-db", "--dashboard",     help="show a status line with the throughput, counts, board states and ETA on stderr", action="store_true")
+parser.add_argument("-mi", "--metrics_interval", help="seconds between the updates of the status file and line, default: 10", type=float, default=10)
+
 parser.add_argument("-v", "--verbose",        help="increase output verbosity", action="store_true")
 args = parser.parse_args()
 
@@ -37,52 +72,105 @@ do_auto = exp_class != None
 if do_auto:
 	assert len(exp_class.split('/')) == 3
 
-# create prog platform object
-progplat = progplatform.get_embexp_ProgPlatform(args.embexp_path)
+# create prog platform objects, one per board slot
+progplats = progplatform.get_embexp_ProgPlatform_pool(args.embexp_path, args.progplat_path)
 
 board_type = args.board_type
+if args.session:
+	if board_type == None:
+		raise Exception("a session needs the board type to select the branch")
+	branchname = progplatform.get_default_branch(board_type)
+	build_progplats = None
+	if args.pipeline:
+		if args.batch_size != None:
+			raise Exception("pipelining is not supported together with batches")
+		build_progplats = list(map(lambda p: progplatform.ProgPlatformSession(p, branchname, f"{p.progplat_path}.session.{branchname}.pipeline"), progplats))
+	progplats = list(map(lambda p: progplatform.ProgPlatformSession(p, branchname), progplats))
+elif args.pipeline:
+	raise Exception("pipelining needs sessions (-s)")
+else:
+	build_progplats = None
+if args.build_cache != None:
+	cache = build_cache.BuildCache(args.build_cache, args.build_cache_size * 1024**2, args.build_cache_artifacts.split(","))
+	for p in progplats + ([] if build_progplats == None else build_progplats):
+		p.build_cache = cache
+for p in progplats + ([] if build_progplats == None else build_progplats):
+	p.stream_uart = args.stream_uart
+if args.learn_timeouts:
+	if not args.stream_uart:
+		raise Exception("learning timeouts needs streaming of the uart output (-su)")
+	history = run_times.get_default_run_times()
+	history.factor = args.learned_timeout_factor
+	for p in progplats + ([] if build_progplats == None else build_progplats):
+		p.run_times = history
 auto_mode = "fix" if args.auto_mode == None else args.auto_mode
-
-# select experiments (could be made as iterator to simplify the code and not require processing to complete in the beginning, i guess)
+mul_runs = None if args.mul_runs == None else list(map(int, args.mul_runs.split(",")))
+
+# the connections are shared by the working copies of a slot
+board_conns = []
+if args.connect:
+	if board_type == None:
+		raise Exception("a board connection needs the board type")
+	connect_cmd = args.connect_cmd if args.connect_cmd != None else board_conn.get_default_connect_cmd(args.embexp_path)
+	for (slot, p) in enumerate(progplats):
+		conn = board_conn.BoardConnection(connect_cmd, board_type, slot, args.connect_ready_pattern)
+		board_conns.append(conn)
+		p.board_conn = conn
+		if build_progplats != None:
+			build_progplats[slot].board_conn = conn
+
+# select experiments, they are discovered and validated while the first ones already run
 # ======================================
 logging.info(f"selecting experiments")
 
 if not do_auto:
-	exp_iter = exp_finder.get_exps_from_stdin()
+	exp_iter = exp_finder.get_exps_from_stdin(streaming=True)
 else:
 	assert board_type == "rpi3" or board_type == "rpi4"
 
-	progplat_hash = progplat.get_branch_commit_hash(progplatform.get_default_branch(board_type))
+	# all board slots have to produce results for the same run_id
+	progplat_hash = exp_scheduler.get_pool_branch_commit_hash(progplats + ([] if build_progplats == None else build_progplats), progplatform.get_default_branch(board_type))
 
 	if auto_mode == "fix":
 		exp_iter = exp_finder.ExpsIter(exp_class, auto_mode, progplat_hash, board_type)
 	else:
-		exp_iter = exp_finder.get_exps(exp_class, auto_mode, progplat_hash, board_type)
+		exp_iter = exp_finder.ExpsIterList(exp_finder.iter_exps(exp_class, auto_mode, progplat_hash, board_type))
 
-# launch the runner script for each experiment in the list
+# launch the runner script for each experiment in the list, on all board slots
 # ======================================
 logging.info(f"running all selected experiments")
-successful = True
-someSuccessful = False
-for exp_id in exp_iter:
-	(iter_round, iter_idx, iter_size) = exp_iter.get_iterinfo()
-	print(f"===>>> [r:{iter_round}, {(iter_idx/iter_size * 100):.2f}% of {iter_size}] {exp_id}")
-	try:
-		result_val = exp_runner.run_experiment(exp_id, progplat, board_type, conn_mode=args.conn_mode, force_results=args.force_results)
-		someSuccessful = True
-		if result_val != True:
-			print(f"         - Interesting result: {result_val}")
-	except KeyboardInterrupt:
-		raise
-	except:
-		successful = False
-		logging.warning("- unsuccessful")
+retries = exp_retry.RetryQueue(args.retry_attempts, args.retry_backoff)
+healths = list(map(lambda slot: exp_retry.BoardHealth(slot, args.reset_after, args.quarantine_after, args.quarantine_time, args.max_quarantines), range(len(progplats))))
+# the stages are always timed for the summary at the end
+tracer = exp_trace.StageTracer(args.trace, args.trace_chrome)
+exp_trace.set_tracer(tracer)
+scheduler = exp_scheduler.ExpScheduler(exp_iter, progplats, board_type, {"conn_mode": args.conn_mode, "force_results": args.force_results, "mul_runs": mul_runs}, args.batch_size, build_progplats, retries, healths)
+metrics_writer = None
+if args.metrics_status != None or args.dashboard:
+	metrics_writer = exp_metrics.MetricsWriter(scheduler.metrics, args.metrics_status, args.dashboard, args.metrics_interval)
+	metrics_writer.start()
+try:
+	successful = scheduler.run()
+finally:
+	for conn in board_conns:
+		conn.disconnect()
+	tracer.close()
+	if metrics_writer != None:
+		metrics_writer.stop()
+someSuccessful = scheduler.someSuccessful
 
 print()
 print("="*40)
 print("="*40)
 if (someSuccessful):
-	print(f"run_id = {progplat.get_configured_run_id()}")
+	print(f"run_id = {scheduler.get_run_id()}")
+print("="*40)
+print(retries.get_summary_str())
+print("="*40)
+print(tracer.get_summary_str())
+for health in healths:
+	if health.n_resets > 0 or health.n_quarantines > 0:
+		print(f"board slot {health.slot}: {health.n_resets} resets, {health.n_quarantines} quarantines{', retired' if health.retired else ''}")
 print("="*40)
 if successful:
 	print("ALL EXPERIMENTS COMPLETED")
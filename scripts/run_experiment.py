@@ -22,9 +22,12 @@ parser.add_argument("-cm", "--conn_mode", help="connection mode: try (default),
 parser.add_argument("-fca", "--force_cleanup_all",     help="force full cleanup before running", action="store_true")
 parser.add_argument("-fci", "--force_cleanup_ignored", help="force cleanup of all gitignored files before running", action="store_true")
 
+parser.add_argument("-mr", "--mul_runs",    help="repetition counts of the experiment program, comma separated, e.g., 3,10,30: run with the first count and again with the next one as long as the result is unequal or inconclusive, the count is recorded in mul_runs.json, default: always 10 without record")
+
 parser.add_argument("-nr", "--no_results",    help="do not write results of this run", action="store_true")
 parser.add_argument("-fr", "--force_results", help="force the current results as latest experiment results", action="store_true")
 parser.add_argument("-nc", "--no_cleanup",    help="do not cleanup after running", action="store_true")
+parser.add_argument("-su", "--stream_uart",   help="build the image first, follow the uart output while running and terminate make (SIGTERM to its process group) 5 seconds after the output is complete or the board reported an exception", action="store_true")
 
 parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
 args = parser.parse_args()
@@ -48,10 +51,13 @@ elif args.force_cleanup_ignored:
 else:
 	force_cleanup = None
 
+mul_runs = None if args.mul_runs == None else list(map(int, args.mul_runs.split(",")))
+
 # create prog platform object
 progplat = progplatform.get_embexp_ProgPlatform(args.embexp_path)
+progplat.stream_uart = args.stream_uart
 
-exp_runner.run_experiment(args.exp_id, progplat, args.board_type, args.branchname, args.conn_mode, force_cleanup, args.force_results, args.no_cleanup, True, write_results=not args.no_results)
+exp_runner.run_experiment(args.exp_id, progplat, args.board_type, args.branchname, args.conn_mode, force_cleanup, args.force_results, args.no_cleanup, True, write_results=not args.no_results, mul_runs=mul_runs)
 
 
 
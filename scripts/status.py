@@ -6,9 +6,12 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
 
 import argparse
 import logging
+import json
 
 import progplatform
 import experiment
+import exp_catalog
+import exp_status
 from helpers import *
 from exp_runner import *
 
@@ -27,6 +30,9 @@ parser.add_argument("-pc", "--print_counterexamples", help="print the list of co
 parser.add_argument("-pi", "--print_inconclusive",    help="print the list of inconclusive examples", action="store_true")
 parser.add_argument("-po", "--print_others",          help="print the list of unclear examples", action="store_true")
 
+parser.add_argument("-j", "--jobs",  help="number of processes to read the results with, default: number of cpus", type=int)
+parser.add_argument("--json",        help="print the status as json", action="store_true")
+
 parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
 args = parser.parse_args()
 
@@ -54,9 +60,6 @@ if run_id == None:
 		progplatform.get_default_branch(board_type))
 	run_id = experiment.get_run_id(progplat_hash, board_type)
 
-print(f"run_id = {run_id}")
-print()
-
 listfile = args.listfile
 exp_set = None
 if listfile != None:
@@ -69,123 +72,52 @@ if listfile != None:
 			continue
 		exp_set.add(line.strip())
 
-# all of this should be moved to library file experiment or experiments or similar
-def collect_structure(startpath):
-	struct = {"dirs": {}, "files": []}
-
-	for root, dirs, files in os.walk(startpath):
-		relpath = root.replace(startpath, '').split(os.sep)
-		assert relpath[0] == ""
-		relpath = relpath[1:]
-		# find the right place
-		relstruct = struct
-		for d in relpath:
-			relstruct = relstruct["dirs"][d]
-		# place all dirs and files there
-		relstruct["files"].extend(files)
-		for d in dirs:
-			relstruct["dirs"][d] = {"dirs": {}, "files": []}
-
-	return struct
-
-def rewrite_structure(struct):
-	newstruct = {}
-	for f in struct["files"]:
-		newstruct[f] = None
-	for dn in struct["dirs"]:
-		newstruct[dn] = rewrite_structure(struct["dirs"][dn])
-	return newstruct
-
-def structure_dirs(s):
-	return list(filter(lambda x: x != None, s))
-
-def structure_files(s):
-	return list(filter(lambda x: x == None, s))
-
-# collect directory and file tree
-logging.info("collecting directory and file tree of arm8")
-rootpath = get_logs_path(arch_id)
-arch_structure = rewrite_structure(collect_structure(rootpath))
-progs = structure_dirs(arch_structure["progs"])
-expts = list(filter(lambda x: x != "progs", structure_dirs(arch_structure)))
-exps = []
-for et in expts:
-	et2s = structure_dirs(arch_structure[et])
-	for et2 in et2s:
-		for ei in structure_dirs(arch_structure[et][et2]):
-			exp_id = f"{arch_id}/{et}/{et2}/{ei}"
-			if (exp_set == None) or (exp_id in exp_set):
-				exps.append(exp_id)
-
-# filter out the valid experiments
-exps = map(lambda x: experiment.Experiment(x), exps)
-exps = list(filter(lambda exp: exp.is_valid_experiment(), exps))
-
-# collect all programs and experiments
-logging.info("collecting all programs and experiments")
-print(f"n_progs = {len(progs)} (this number is only based on the number of progs subdirectories)")
-print(f"n_exps  = {len(exps)}")
+# collect the status, only the counters and the requested lists are kept in memory
+logging.info(f"collecting programs and experiments of {arch_id}")
+keep_lists = []
+if args.print_examples:
+	keep_lists.append("examples")
+if args.print_counterexamples:
+	keep_lists.append("cexamples")
+if args.print_inconclusive:
+	keep_lists.append("inconclusive")
+if args.print_others:
+	keep_lists.append("others")
+status = exp_status.ExpStatus(run_id, keep_lists)
+status.collect(arch_id, exp_catalog.get_default_catalog(), exp_set, args.jobs)
+n_progs = exp_status.count_progs(arch_id)
+
+if args.json:
+	status_json = status.to_json_dict()
+	status_json["n_progs"] = n_progs
+	if args.print_progs:
+		status_json["lists"]["progs"] = sorted(exp_status.iter_progs(arch_id))
+	print(json.dumps(status_json, indent=2, sort_keys=True))
+	sys.exit(0)
+
+print(f"run_id = {run_id}")
+print()
+
+print(f"n_progs = {n_progs} (this number is only based on the number of progs subdirectories)")
+print(f"n_exps  = {status.n_exps}")
 print()
 print()
 
-# collect statistics
-e_notrun = []
-e_incomplete = []
-e_examples = []
-e_cexamples = []
-e_inconclusive = []
-e_others = []
-for exp in exps:
-	assert exp.get_exp_arch() == arch_id
-	s = arch_structure[exp.get_exp_type()][exp.get_exp_params_id()][exp.get_exp_data_id()]
-	exp_id = exp.get_exp_id()
-
-	# did it run?
-	run_dirname = experiment.get_run_dir(run_id)
-	if not run_dirname in s:
-		e_notrun.append(exp_id)
-		continue
-	r = s[run_dirname]
-
-	# is it complete?
-	if exp.is_incomplete_experiment(run_id):
-		continue
-
-	# this is unnecessary
-	resultfile = "result.json"
-	if not resultfile in r:
-		e_others.append(exp_id)
-		logging.error("this should not happen, considering experiment {exp_id} as \"other\"")
-		continue
-
-	# what's the result?
-	# TODO: better use json here for parsing the result file
-	with open(get_logs_path(exp_id) + f"/{run_dirname}/{resultfile}", "r") as f:
-		result = f.read()
-	if result == "true":
-		e_examples.append(exp_id)
-	elif result == "false":
-		e_cexamples.append(exp_id)
-	elif result.startswith("\"special :::: INCONCLUSIVE: "):
-		e_inconclusive.append(exp_id)
-	else:
-		e_others.append(exp_id)
-
-print(f"n_notrun     = {len(e_notrun)}")
-print(f"n_incomplete = {len(e_incomplete)}")
+print(f"n_notrun     = {status.counts['notrun']}")
+print(f"n_incomplete = {status.counts['incomplete']}")
 print()
 
-print(f"n_others       = {len(e_others)}")
-print(f"n_inconclusive = {len(e_inconclusive)}")
-print(f"n_examples     = {len(e_examples)}")
-print(f"n_cexamples    = {len(e_cexamples)}")
+print(f"n_others       = {status.counts['others']}")
+print(f"n_inconclusive = {status.counts['inconclusive']}")
+print(f"n_examples     = {status.counts['examples']}")
+print(f"n_cexamples    = {status.counts['cexamples']}")
 print()
 print()
 
 if args.print_progs:
 	print("programs:")
 	print("=" * 40)
-	for p in progs:
+	for p in sorted(exp_status.iter_progs(arch_id)):
 		print(p)
 	print()
 	print()
@@ -193,7 +125,7 @@ if args.print_progs:
 if args.print_examples:
 	print("validation examples:")
 	print("=" * 40)
-	for exp_id in e_examples:
+	for exp_id in status.lists["examples"]:
 		print(exp_id)
 	print()
 	print()
@@ -201,7 +133,7 @@ if args.print_examples:
 if args.print_counterexamples:
 	print("validation counterexamples:")
 	print("=" * 40)
-	for exp_id in e_cexamples:
+	for exp_id in status.lists["cexamples"]:
 		print(exp_id)
 	print()
 	print()
@@ -209,7 +141,7 @@ if args.print_counterexamples:
 if args.print_inconclusive:
 	print("inconclusive examples:")
 	print("=" * 40)
-	for exp_id in e_inconclusive:
+	for exp_id in status.lists["inconclusive"]:
 		print(exp_id)
 	print()
 	print()
@@ -217,9 +149,8 @@ if args.print_inconclusive:
 if args.print_others:
 	print("unclear result:")
 	print("=" * 40)
-	for exp_id in e_others:
+	for exp_id in status.lists["others"]:
 		print(exp_id)
 	print()
 	print()
 
-
@@ -0,0 +1,63 @@
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "../lib"))
+
+import json
+import hashlib
+import subprocess
+
+standin_path = os.path.abspath(os.path.dirname(__file__))
+
+# a ProgPlatform working copy whose make targets don't need a toolchain or a board,
+# the image is the concatenation of the configuration and the headers and the runlog targets call standin_board.py
+# STANDIN_BUILD_SLEEP is the build time in seconds
+standin_makefile = """include Makefile.config
+STANDIN_BUILD_SLEEP ?= 0
+output/image: Makefile.config $(wildcard all/inc/experiment/*.h)
+	@sleep $(STANDIN_BUILD_SLEEP); mkdir -p output; cat $^ > $@
+build: output/image
+runlog runlog_try runlog_reset: output/image
+	@python3 {board_py} $(CURDIR) $@
+.PHONY: build runlog runlog_try runlog_reset
+"""
+
+def _git(path, cmdl):
+	# a fixed date, so that all stand-ins are on the same commit
+	env = dict(os.environ, GIT_AUTHOR_DATE="2020-01-01T00:00:00Z", GIT_COMMITTER_DATE="2020-01-01T00:00:00Z")
+	subprocess.run(["git", "-C", path, "-c", "user.name=standin", "-c", "user.email=standin@localhost"] + cmdl, check=True, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def create_progplatform(path, board_type = "rpi3"):
+	os.makedirs(os.path.join(path, "all/inc/experiment"))
+	with open(os.path.join(path, ".gitignore"), "w") as f:
+		f.write("temp/\noutput/\n")
+	with open(os.path.join(path, "Makefile.config"), "w") as f:
+		f.write("# default\n")
+	with open(os.path.join(path, "all/inc/experiment/asm.h"), "w") as f:
+		f.write("\n")
+	with open(os.path.join(path, "Makefile"), "w") as f:
+		f.write(standin_makefile.format(board_py=os.path.join(standin_path, "standin_board.py")))
+	_git(path, ["init", "-q", "-b", f"scamv_{board_type}"])
+	_git(path, ["add", "-A"])
+	_git(path, ["commit", "-q", "-m", "stand-in"])
+	return path
+
+def create_exps(logs_path, exp_class, n, prog_id = "p0"):
+	# n valid experiments of exp_class with the same program, returns their ids
+	prog_path = os.path.join(logs_path, os.path.dirname(os.path.dirname(exp_class)), "progs", prog_id)
+	if not os.path.isdir(prog_path):
+		os.makedirs(prog_path)
+		with open(os.path.join(prog_path, "code.asm"), "w") as f:
+			f.write("\tldr x9, [x5]\n")
+	exp_ids = []
+	for i in range(n):
+		exp_id = f"{exp_class}/{hashlib.sha1(str(i).encode()).hexdigest()}"
+		exp_path = os.path.join(logs_path, exp_id)
+		os.makedirs(exp_path)
+		with open(os.path.join(exp_path, "code.hash"), "w") as f:
+			f.write(f"{prog_id}\n")
+		for filename in ["input1.json", "input2.json", "train.json"]:
+			with open(os.path.join(exp_path, filename), "w") as f:
+				json.dump({"x5": hex(0x80100000 + i * 64), "mem": {hex(0x80100000 + i * 64 + j): hex(j) for j in range(8)}}, f)
+		exp_ids.append(exp_id)
+	return exp_ids
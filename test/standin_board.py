@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# stand-in for a board behind the runlog targets of a ProgPlatform working copy:
+# writes the uart output of the configured experiment to temp/uart.log, for a batch image (PROGPLAT_BATCH_SIZE)
+# the output of each experiment follows a delimiter line as expected by split_uart_batch_experiment,
+# STANDIN_BOARD_SLEEP is the run time in seconds and STANDIN_BOARD_LOG a file to note the runs in,
+# with STANDIN_BOARD_UNEQUAL_BELOW, pair experiments are unequal with fewer repetitions than this
+
+import sys
+import os
+import time
+
+progplat_path = sys.argv[1]
+target = sys.argv[2]
+
+config = {}
+with open(os.path.join(progplat_path, "Makefile.config"), "r") as f:
+	for line in f:
+		if "=" in line:
+			(k, v) = line.split("=", 1)
+			config[k.strip()] = v.strip()
+
+def get_output(exp_type):
+	if exp_type == "exps2":
+		if int(config.get("__PROGPLAT_MUL_RUNS__", "10")) < int(os.environ.get("STANDIN_BOARD_UNEQUAL_BELOW", "0")):
+			return "RESULT: UNEQUAL\n"
+		return "RESULT: EQUAL\n"
+	# a few valid lines of the cache dump
+	return "----\nprint_cache_valid\n----\n0 :: 0 :: tag: 0x00080100\n1 :: 2 :: tag: 0x00080101\n----\n"
+
+time.sleep(float(os.environ.get("STANDIN_BOARD_SLEEP", "0.1")))
+
+if "PROGPLAT_BATCH_SIZE" in config:
+	uartlog = "Init complete.\n"
+	for i in range(int(config["PROGPLAT_BATCH_SIZE"])):
+		uartlog += f"==== BATCH EXPERIMENT {i} ====\n" + get_output(config["PROGPLAT_TYPE"]) + "Experiment complete.\n"
+else:
+	uartlog = "Init complete.\n" + get_output(config["PROGPLAT_TYPE"]) + "Experiment complete.\n"
+
+os.makedirs(os.path.join(progplat_path, "temp"), exist_ok=True)
+with open(os.path.join(progplat_path, "temp/uart.log"), "w") as f:
+	f.write(uartlog)
+
+if "STANDIN_BOARD_LOG" in os.environ:
+	with open(os.environ["STANDIN_BOARD_LOG"], "a") as f:
+		f.write(f"{progplat_path} {target}\n")
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+# stand-in for interface/remote.py of EmbExp-Box as the connect command of a BoardConnection:
+# prints a ready line and keeps the connection until it is terminated, the mode changes this,
+# "exit" terminates after the ready line, "fail" before it and "hang" never gets ready
+
+import sys
+import time
+
+board_type = sys.argv[1]
+slot = sys.argv[2]
+mode = sys.argv[3] if len(sys.argv) > 3 else "ok"
+
+print(f"connecting to {board_type} for slot {slot}", flush=True)
+if mode == "fail":
+	sys.exit(1)
+if mode != "hang":
+	print("board ready", flush=True)
+if mode == "exit":
+	time.sleep(0.2)
+	sys.exit(1)
+while True:
+	time.sleep(1)
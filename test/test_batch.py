@@ -0,0 +1,44 @@
+
+import os
+import unittest
+import tempfile
+import subprocess
+
+import standin
+from helpers import *
+
+class TestBatchOutput(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def _run_standin_board(self, config_text):
+		progplat_path = self.temp_dir.name
+		with open(os.path.join(progplat_path, "Makefile.config"), "w") as f:
+			f.write(config_text)
+		subprocess.run(["python3", os.path.join(standin.standin_path, "standin_board.py"), progplat_path, "runlog"], check=True, env=dict(os.environ, STANDIN_BOARD_SLEEP="0"))
+		with open(os.path.join(progplat_path, "temp/uart.log"), "rb") as f:
+			return f.read()
+
+	def test_split_standin_output(self):
+		for exp_type in ["exps1", "exps2"]:
+			single = self._run_standin_board(f"PROGPLAT_TYPE         ={exp_type}\n")
+			batch = self._run_standin_board(f"PROGPLAT_TYPE         ={exp_type}\nPROGPLAT_BATCH_SIZE   =3\n")
+			self.assertIn(b"==== BATCH EXPERIMENT 2 ====", batch)
+			# each part looks like the output of the experiment on its own
+			self.assertEqual(split_uart_batch_experiment(batch, 3), [single] * 3)
+
+	def test_split_missing_experiments(self):
+		# the board stopped with an exception in the second experiment
+		uartlog = b"Init complete.\n==== BATCH EXPERIMENT 0 ====\nRESULT: EQUAL\nExperiment complete.\n==== BATCH EXPERIMENT 1 ====\nEXCEPTION: data abort\n"
+		self.assertEqual(split_uart_batch_experiment(uartlog, 3), [b"Init complete.\nRESULT: EQUAL\nExperiment complete.\n", b"Init complete.\nEXCEPTION: data abort\n", None])
+
+	def test_split_invalid_delimiter(self):
+		uartlog = b"Init complete.\n==== BATCH EXPERIMENT 3 ====\nRESULT: EQUAL\nExperiment complete.\n"
+		with self.assertRaisesRegex(Exception, "invalid batch delimiter"):
+			split_uart_batch_experiment(uartlog, 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,132 @@
+
+import os
+import sys
+import time
+import signal
+import unittest
+import tempfile
+
+import standin
+import board_conn
+import progplatform
+from helpers import *
+
+def standin_connect_cmd(mode = "ok"):
+	return f"{sys.executable} {os.path.join(standin.standin_path, 'standin_box.py')} {{board_type}} {{slot}} {mode}"
+
+def wait_dead(conn):
+	deadline = time.monotonic() + 10
+	while conn.is_alive() and time.monotonic() < deadline:
+		time.sleep(0.05)
+
+class TestBoardConnection(unittest.TestCase):
+	def setUp(self):
+		self.conns = []
+
+	def tearDown(self):
+		for conn in self.conns:
+			conn.disconnect()
+
+	def _conn(self, mode = "ok", **kwargs):
+		conn = board_conn.BoardConnection(standin_connect_cmd(mode), "rpi3", 1, **kwargs)
+		self.conns.append(conn)
+		return conn
+
+	def test_connect(self):
+		conn = self._conn(ready_pattern = "board ready")
+		conn.connect()
+		self.assertTrue(conn.is_alive())
+		self.assertIn("connecting to rpi3 for slot 1", conn._output)
+		conn.disconnect()
+		self.assertFalse(conn.is_alive())
+
+		# without a pattern the connection is established after the settle time
+		conn = self._conn(settle_time = 0.3)
+		conn.connect()
+		self.assertTrue(conn.is_alive())
+
+	def test_killed(self):
+		conn = self._conn(ready_pattern = "board ready")
+		conn.ensure()
+		self.assertEqual(conn.n_connects, 1)
+		conn.ensure()
+		self.assertEqual(conn.n_connects, 1)
+
+		# a connection that died is replaced
+		os.killpg(conn._proc.pid, signal.SIGKILL)
+		wait_dead(conn)
+		conn.ensure()
+		self.assertTrue(conn.is_alive())
+		self.assertEqual(conn.n_connects, 2)
+
+	def test_not_ready(self):
+		conn = self._conn("hang", ready_pattern = "board ready", ready_timeout = 0.5)
+		with self.assertRaisesRegex(Exception, "not ready after"):
+			conn.connect()
+		self.assertFalse(conn.is_alive())
+
+		conn = self._conn("fail", ready_pattern = "board ready")
+		with self.assertRaisesRegex(Exception, "terminated while connecting"):
+			conn.connect()
+
+	def test_report_failure(self):
+		conn = self._conn(ready_pattern = "board ready")
+		conn.connect()
+		# a live connection is replaced after two failures in a row
+		self.assertFalse(conn.report_failure())
+		conn.report_success()
+		self.assertFalse(conn.report_failure())
+		self.assertTrue(conn.report_failure())
+		self.assertEqual(conn.n_connects, 2)
+		self.assertEqual(conn.n_failures, 0)
+
+		# a dead one right away
+		conn = self._conn("exit", ready_pattern = "board ready")
+		conn.connect()
+		wait_dead(conn)
+		self.assertTrue(conn.report_failure())
+		self.assertEqual(conn.n_connects, 2)
+
+class TestConnectedRun(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.progplat = progplatform.ProgPlatform(standin.create_progplatform(os.path.join(self.temp_dir.name, "pp")))
+		self.progplat.board_conn = board_conn.BoardConnection(standin_connect_cmd(), "rpi3", 0, "board ready")
+		self.targets = []
+
+	def tearDown(self):
+		self.progplat.board_conn.disconnect()
+		self.temp_dir.cleanup()
+
+	def _fail_with(self, category):
+		def run_target(maketarget):
+			self.targets.append(maketarget)
+			raise ExpFailure(category, f"stand-in {category} failure")
+		self.progplat._run_experiment_target = run_target
+
+	def test_run(self):
+		# the stand-in board only needs the type from the configuration
+		with open(os.path.join(self.progplat.progplat_path, "Makefile.config"), "w") as f:
+			f.write("PROGPLAT_TYPE=exps2\n")
+		self.assertTrue(self.progplat.run_experiment().startswith(b"Init complete."))
+		self.assertEqual(self.progplat.board_conn.n_connects, 1)
+
+	def test_run_failures(self):
+		# repeated, and after the second failure with a new connection
+		self._fail_with("run")
+		with self.assertRaisesRegex(ExpFailure, "stand-in run failure"):
+			self.progplat.run_experiment()
+		self.assertEqual(self.targets, ["runlog"] * 3)
+		self.assertEqual(self.progplat.board_conn.n_connects, 2)
+
+	def test_build_failure(self):
+		# not repeated and the connection is kept
+		self._fail_with("build")
+		with self.assertRaisesRegex(ExpFailure, "stand-in build failure"):
+			self.progplat.run_experiment()
+		self.assertEqual(self.targets, ["runlog"])
+		self.assertEqual(self.progplat.board_conn.n_connects, 1)
+		self.assertEqual(self.progplat.board_conn.n_failures, 0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,76 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import progplatform
+import build_cache
+
+class TestBuildCache(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.progplat = progplatform.ProgPlatform(standin.create_progplatform(os.path.join(self.temp_dir.name, "pp")))
+		self.progplat.check_clean()
+		self.cache = build_cache.BuildCache(os.path.join(self.temp_dir.name, "cache"))
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def _configure(self, text):
+		self.progplat.write_experiment_file("input.h", text)
+		return self.cache.get_key(self.progplat)
+
+	def _read_image(self):
+		with open(os.path.join(self.progplat.progplat_path, "output/image"), "r") as f:
+			return f.read()
+
+	def test_hit_and_miss(self):
+		key_a = self._configure("a\n")
+		self.assertFalse(self.cache.restore(self.progplat, key_a))
+		self.progplat.build()
+		self.cache.store(self.progplat, key_a)
+
+		key_b = self._configure("b\n")
+		self.assertNotEqual(key_a, key_b)
+		self.assertFalse(self.cache.restore(self.progplat, key_b))
+		self.progplat.build()
+		self.assertIn("b\n", self._read_image())
+
+		# the image of the first configuration comes back
+		self.assertEqual(self._configure("a\n"), key_a)
+		self.assertTrue(self.cache.restore(self.progplat, key_a))
+		self.assertIn("a\n", self._read_image())
+		self.assertNotIn("b\n", self._read_image())
+
+	def test_missing_artifacts(self):
+		# nothing is cached if the build output isn't where the cache expects it
+		cache = build_cache.BuildCache(os.path.join(self.temp_dir.name, "cache_build"), artifact_dirs = ["build"])
+		key = self._configure("a\n")
+		self.progplat.build()
+		cache.store(self.progplat, key)
+		self.assertFalse(cache.restore(self.progplat, key))
+		self.assertEqual(os.listdir(cache.cache_path), [])
+
+		# and the entries of another artifact configuration are not used
+		self.cache.store(self.progplat, key)
+		self.assertFalse(build_cache.BuildCache(self.cache.cache_path, artifact_dirs = ["output", "build"]).restore(self.progplat, key))
+
+	def test_eviction(self):
+		self._configure("a\n")
+		self.progplat.build()
+		size = os.path.getsize(os.path.join(self.progplat.progplat_path, "output/image"))
+		# room for two entries
+		cache = build_cache.BuildCache(os.path.join(self.temp_dir.name, "cache_small"), max_size = 2 * size + size // 2)
+		keys = []
+		for text in ["a\n", "b\n", "c\n"]:
+			keys.append(self._configure(text))
+			self.progplat.build()
+			cache.store(self.progplat, keys[-1])
+			# distinct modification times for the order of use
+			os.utime(os.path.join(cache.cache_path, keys[-1]), (len(keys), len(keys)))
+		# the least recently used entry is gone
+		self.assertEqual(sorted(os.listdir(cache.cache_path)), sorted(keys[1:]))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,75 @@
+
+import os
+import json
+import unittest
+import tempfile
+
+import standin
+import experiment
+from helpers import *
+
+def parse_to_json(dump_lines, board_type = "rpi3"):
+	lines = ["Init complete.", "----"] + dump_lines + ["----", "Experiment complete.", ""]
+	return json.dumps(parse_uart_single_cache_experiment(lines, board_type).to_json_sets())
+
+class TestCacheParse(unittest.TestCase):
+	def test_full_field_order(self):
+		# the fields of a line are in the order of the dump, invalid lines and other fields are dropped
+		dump = ["print_cache_full", "----", "set=0", "line=0", "tag: 0x00000001", "valid: 1", "line=1", "valid: 1", "data: 0x12", "tag: 0x00000002", "line=2", "valid: 0", "tag: 0x00000003", "line=3", "valid: 1"]
+		dump += ["set=1", "line=0", "valid: 0"]
+		self.assertEqual(parse_to_json(dump), '[{"set": 0, "lines": [{"line": 0, "tag": "0x00000001", "valid": true}, {"line": 1, "valid": true, "tag": "0x00000002"}, {"line": 3, "valid": true}]}]')
+
+	def test_simp_entries(self):
+		# the entries are kept in the order of the dump within the sets, also if a line is listed more than once
+		dump = ["print_cache_valid", "----", "5 :: 3 :: tag: 0x00000001", "2 :: 1 :: tag: 0x00000002", "5 :: 0 :: tag: 0x00000003", "5 :: 3 :: data: 0x12"]
+		self.assertEqual(parse_to_json(dump), '[{"set": 2, "lines": [{"line": 1, "valid": true, "tag": "0x00000002"}]}, {"set": 5, "lines": [{"line": 3, "valid": true, "tag": "0x00000001"}, {"line": 0, "valid": true, "tag": "0x00000003"}, {"line": 3, "valid": true}]}]')
+
+	def test_tag_strings(self):
+		# tags that can't be stored as integers of the dump's width are kept as they are
+		dump = ["print_cache_full", "----", "set=0", "line=0", "valid: 1", "tag: 0x0001", "line=1", "valid: 1", "tag: 0x1", "line=2", "valid: 1", "tag: zz"]
+		self.assertEqual(parse_to_json(dump), '[{"set": 0, "lines": [{"line": 0, "valid": true, "tag": "0x0001"}, {"line": 1, "valid": true, "tag": "0x1"}, {"line": 2, "valid": true, "tag": "zz"}]}]')
+
+class TestCacheResult(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_lines_without_tag(self):
+		# a result.json with valid lines without a tag or with a tag that isn't a number
+		[exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps1/cls", 1)
+		dump = ["print_cache_full", "----", "set=0", "line=0", "valid: 1", "tag: 0x00000001", "line=1", "valid: 1", "line=2", "valid: 1", "tag: zz"]
+		dump += ["set=1", "line=0", "valid: 0", "line=1", "valid: 1", "tag: 0x00000002"]
+		exp = experiment.Experiment(exp_id)
+		exp.write_results("abc.rpi3", [("result.json", parse_to_json(dump).encode())])
+
+		result = exp.get_cache_result("abc.rpi3")
+		self.assertEqual((list(result.sets), list(result.ways), list(result.tags)), ([0, 1], [0, 1], [1, 2]))
+		self.assertEqual(result.tag_width, 8)
+
+	def test_cached_copy(self):
+		[exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps1/cls", 1)
+		exp = experiment.Experiment(exp_id)
+		dump = ["print_cache_valid", "----", "0 :: 0 :: tag: 0x00080100", "1 :: 2 :: tag: 0x00080101"]
+		exp.write_results("abc.rpi3", [("result.json", parse_to_json(dump).encode())])
+		exp.get_cache_result("abc.rpi3")
+
+		# the second time from the binary copy in .cache, the run directory only has the result
+		result = exp.get_cache_result("abc.rpi3")
+		self.assertIsInstance(result.tags, memoryview)
+		self.assertEqual((list(result.sets), list(result.ways), list(result.tags)), ([0, 1], [0, 2], [0x80100, 0x80101]))
+		self.assertEqual(os.listdir(exp.get_path("run.abc.rpi3")), ["result.json"])
+
+		# a rewritten result is read again and replaces the copy
+		dump = ["print_cache_valid", "----", "3 :: 1 :: tag: 0x00080102"]
+		exp.write_results("abc.rpi3", [("result.json", parse_to_json(dump).encode())], True)
+		result = exp.get_cache_result("abc.rpi3")
+		self.assertEqual((list(result.sets), list(result.ways), list(result.tags)), ([3], [1], [0x80102]))
+		self.assertEqual(len(os.listdir(get_logs_path(f".cache/cache_results/{exp_id}"))), 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,41 @@
+
+import os
+import errno
+import unittest
+import tempfile
+
+import standin
+import dir_watch
+
+class TestInotifyWatcher(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.exps_dir = self.temp_dir.name
+		os.mkdir(os.path.join(self.exps_dir, "e0"))
+		self.watcher = dir_watch.InotifyWatcher(self.exps_dir)
+
+	def tearDown(self):
+		self.watcher.close()
+		self.temp_dir.cleanup()
+
+	def test_changes(self):
+		os.mkdir(os.path.join(self.exps_dir, "e1"))
+		self.assertEqual(self.watcher.wait(5), {"e1"})
+		with open(os.path.join(self.exps_dir, "e0", "result.json"), "w") as f:
+			f.write("true")
+		self.assertEqual(self.watcher.wait(5), {"e0"})
+		self.assertEqual(self.watcher.wait(0.1), set())
+
+	def test_no_more_watches(self):
+		# like at the limit of fs.inotify.max_user_watches
+		def add_watch(path, mask):
+			raise OSError(errno.ENOSPC, f"inotify_add_watch failed for {path}: {os.strerror(errno.ENOSPC)}")
+		self.watcher._add_watch = add_watch
+		os.mkdir(os.path.join(self.exps_dir, "e1"))
+		# everything has to be rescanned once, afterwards the directories are scanned
+		self.assertEqual(self.watcher.wait(5), None)
+		os.mkdir(os.path.join(self.exps_dir, "e2"))
+		self.assertEqual(self.watcher.wait(5), {"e2"})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,38 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import exp_catalog
+from helpers import *
+
+class TestExpCatalog(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.catalog = exp_catalog.ExpCatalog(get_logs_path(".cache/catalog.sqlite"))
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_run_completed_within_mtime_tick(self):
+		exp_class = "arm8/exps2/cls"
+		[exp_id] = standin.create_exps(get_logs_path("."), exp_class, 1)
+		run_path = get_logs_path(f"{exp_id}/run.abc.rpi3")
+		os.mkdir(run_path)
+		with open(os.path.join(run_path, "output_uart.log"), "w") as f:
+			f.write("Init complete.\nRESULT: EQUAL\nExperiment complete.\n")
+		self.assertEqual(self.catalog.get_exp_ids(exp_class, incomplete_run_id = "abc.rpi3"), [exp_id])
+
+		# the result is written in the same mtime tick of the run directory as the scan before
+		st = os.stat(run_path)
+		with open(os.path.join(run_path, "result.json"), "w") as f:
+			f.write("true")
+		os.utime(run_path, ns = (st.st_atime_ns, st.st_mtime_ns))
+		self.assertEqual(self.catalog.get_exp_ids(exp_class, incomplete_run_id = "abc.rpi3"), [])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,52 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import exp_compare
+from helpers import *
+
+class TestRunComparison(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 5)
+
+	def tearDown(self):
+		for reader in exp_compare._git_readers.values():
+			reader.close()
+		exp_compare._git_readers.clear()
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def _write_result(self, exp_id, result):
+		run_path = get_logs_path(f"{exp_id}/run.abc.rpi3")
+		os.makedirs(run_path, exist_ok=True)
+		with open(os.path.join(run_path, "result.json"), "w") as f:
+			f.write(result)
+
+	def test_transitions(self):
+		# the results committed before and the ones of a revalidation in the working directory
+		before = ["true", "false", "\"special :::: INCONCLUSIVE: too few runs\"", "[{\"set\": 0, \"lines\": []}]"]
+		after = ["false", "false", "true", "[{\"set\": 1, \"lines\": []}]", "true"]
+		for (exp_id, result) in zip(self.exp_ids, before):
+			self._write_result(exp_id, result)
+		standin._git(get_logs_path("."), ["init", "-q"])
+		standin._git(get_logs_path("."), ["add", "-A"])
+		standin._git(get_logs_path("."), ["commit", "-q", "-m", "results"])
+		for (exp_id, result) in zip(self.exp_ids, after):
+			self._write_result(exp_id, result)
+
+		expected = {("equal", "unequal"): [self.exp_ids[0]], ("unequal", "unequal"): [self.exp_ids[1]], ("inconclusive", "equal"): [self.exp_ids[2]], ("cachestate", "cachestate (changed)"): [self.exp_ids[3]], ("missing", "equal"): [self.exp_ids[4]]}
+		for jobs in [2, 1]:
+			comparison = exp_compare.RunComparison(("abc.rpi3", "HEAD"), ("abc.rpi3", None))
+			comparison.compare(self.exp_ids, jobs = jobs, chunk_size = 2)
+			self.assertEqual(comparison.n_exps, len(self.exp_ids))
+			self.assertEqual(comparison.cells, expected)
+			# moving from or to inconclusive is expected for repeated runs
+			self.assertEqual(sorted(comparison.get_unexpected()), [("cachestate", "cachestate (changed)"), ("equal", "unequal"), ("missing", "equal")])
+
+if __name__ == "__main__":
+	unittest.main()
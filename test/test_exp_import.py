@@ -0,0 +1,124 @@
+
+import io
+import os
+import json
+import hashlib
+import tarfile
+import unittest
+import tempfile
+
+import standin
+import exp_import
+import experiment
+from helpers import *
+
+def make_tar(entries):
+	# entries are (name, data) for files and (name, None, linkname) for hardlinks
+	buf = io.BytesIO()
+	with tarfile.open(fileobj=buf, mode="w") as tar:
+		for entry in entries:
+			info = tarfile.TarInfo(entry[0])
+			if entry[1] == None:
+				info.type = tarfile.LNKTYPE
+				info.linkname = entry[2]
+				tar.addfile(info)
+			else:
+				info.size = len(entry[1])
+				tar.addfile(info, io.BytesIO(entry[1]))
+	buf.seek(0)
+	return buf
+
+class TestExpImport(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		os.makedirs(get_logs_path("."))
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_data_id(self):
+		files = {"input1.json": b"{}", "code.hash": b"p0\n"}
+		data_id = exp_import.get_data_id(files)
+		self.assertEqual(data_id, exp_import.get_data_id(dict(reversed(list(files.items())))))
+		# the file names and contents are separated
+		self.assertNotEqual(data_id, exp_import.get_data_id({"input1.json": b"{}c", "ode.hash": b"p0\n"}))
+		self.assertNotEqual(data_id, exp_import.get_data_id({"input1.json": b"{}", "code.hash": b"p1\n"}))
+
+	def test_jsonl(self):
+		inputs = {"x5": "0x80100000", "mem": {}}
+		lines = [
+			{"exp_class": "arm8/exps2/cls", "files": {"input1.json": inputs, "input2.json": inputs}, "prog": {"code.asm": "\tnop\n"}},
+			{"exp_id": "arm8/exps2/cls/abc", "files": {"input1.json": inputs, "input2.json": "{}", "code.hash": "p0\n"}},
+		]
+		importer = exp_import.ExpImporter(batch_size = 1)
+		importer.import_jsonl(io.StringIO("".join(map(lambda d: json.dumps(d) + "\n", lines))))
+		importer.close()
+		self.assertEqual((importer.n_exps, importer.n_progs), (2, 1))
+
+		prog_id = hashlib.sha1(b"\tnop\n").hexdigest()
+		exp_files = {"input1.json": json.dumps(inputs).encode(), "input2.json": json.dumps(inputs).encode(), "code.hash": f"{prog_id}\n".encode()}
+		exp = experiment.Experiment(f"arm8/exps2/cls/{exp_import.get_data_id(exp_files)}")
+		self.assertTrue(exp.is_valid_experiment())
+		self.assertEqual(exp.get_code(), "\tnop\n")
+		self.assertEqual(exp.get_input_file("input1.json"), {"x5": 0x80100000, "mem": {}})
+		with open(get_logs_path("arm8/exps2/cls/abc/input2.json")) as f:
+			self.assertEqual(f.read(), "{}")
+
+	def test_tar(self):
+		importer = exp_import.ExpImporter()
+		importer.import_tar(make_tar([
+			("arm8/progs/p0/code.asm", b"\tnop\n"),
+			("arm8/progs/p1/code.asm", b"\tret\n"),
+			("arm8/exps2/cls/e0/code.hash", b"p0\n"),
+			("arm8/exps2/cls/e0/input1.json", b"{\"x5\": \"0x0\"}"),
+			("arm8/exps2/cls/e0/input2.json", None, "arm8/exps2/cls/e0/input1.json"),
+			("arm8/exps2/cls/e1/code.hash", None, "arm8/exps2/cls/e0/code.hash"),
+			("arm8/exps2/cls/e1/input1.json", b"{}"),
+		]))
+		importer.close()
+		self.assertEqual((importer.n_exps, importer.n_progs), (2, 2))
+		self.assertEqual(experiment.Experiment("arm8/exps2/cls/e0").get_input_file("input2.json"), {"x5": 0})
+		self.assertEqual(experiment.Experiment("arm8/exps2/cls/e1").get_code(), "\tnop\n")
+		self.assertTrue(os.path.isfile(get_logs_path("arm8/progs/p1/code.asm")))
+
+		with self.assertRaisesRegex(Exception, "unexpected path"):
+			exp_import.ExpImporter().import_tar(make_tar([("../arm8/progs/p0/code.asm", b"")]))
+
+	def test_atomic_dirs(self):
+		files = {"code.hash": b"p0\n", "input1.json": b"{}"}
+		importer = exp_import.ExpImporter()
+		importer.add("arm8/exps2/cls/e0", files, {"code.asm": b"\tnop\n"})
+		importer.flush()
+		# the directories are renamed into place, the temporary directory is gone afterwards
+		self.assertEqual(os.listdir(importer.temp_path), [])
+		importer.close()
+		self.assertFalse(os.path.exists(importer.temp_path))
+
+		# an existing identical directory is kept, a different one is an error
+		importer = exp_import.ExpImporter()
+		importer.add("arm8/exps2/cls/e0", files, {"code.asm": b"\tnop\n"})
+		importer.flush()
+		self.assertEqual((importer.n_exps, importer.n_exps_existing, importer.n_progs_existing), (0, 1, 1))
+		importer.add("arm8/exps2/cls/e0", dict(files, **{"input1.json": b"[]"}))
+		with self.assertRaisesRegex(Exception, "different content"):
+			importer.flush()
+		importer.close()
+
+	def test_hardlinks(self):
+		files = {"code.hash": b"p0\n", "input1.json": b"{}"}
+		def import_two(hardlinks, exp_class):
+			importer = exp_import.ExpImporter(hardlinks)
+			importer.add(f"{exp_class}/e0", files)
+			importer.add(f"{exp_class}/e1", files)
+			importer.close()
+			return os.stat(get_logs_path(f"{exp_class}/e1/input1.json")).st_nlink
+
+		# copies by default, hardlinks only if asked for
+		self.assertEqual(import_two(False, "arm8/exps2/a"), 1)
+		self.assertEqual(import_two(True, "arm8/exps2/b"), 2)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,73 @@
+
+import os
+import json
+import time
+import unittest
+import tempfile
+
+import standin
+import exp_metrics
+from helpers import *
+
+class TestExpMetrics(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def _create_metrics(self):
+		metrics = exp_metrics.BatchMetrics(2)
+		metrics.get_remaining = lambda: 3
+		# as if the batch has been running for the whole window
+		metrics._start_time -= metrics.window
+		for result_val in [True, True, True, False, "embexp.board.exception :::: data abort", True]:
+			metrics.add_result("abc.rpi3", result_val)
+		metrics.add_failure(False)
+		metrics.add_failure(True)
+		metrics.set_slot(0, "running", "arm8/exps2/cls/e0")
+		metrics.set_slot(1, "quarantined")
+		return metrics
+
+	def test_status(self):
+		status = self._create_metrics().get_status()
+		self.assertEqual(status["counts"], {"done": 6, "interesting": 2, "board_exception": 1, "failed": 2, "given_up": 1})
+		self.assertEqual(status["window_counts"], status["counts"])
+		# 6 experiments in the last hour, 3 left
+		self.assertEqual((status["run_id"], status["per_hour"], status["remaining"], status["eta"]), ("abc.rpi3", 6.0, 3, 1800))
+		self.assertEqual(list(map(lambda x: (x["slot"], x["state"], x["exp_id"]), status["slots"])), [(0, "running", "arm8/exps2/cls/e0"), (1, "quarantined", None)])
+		line = exp_metrics.get_status_line(status)
+		self.assertTrue(line.startswith("### 6 done (2 interesting, 2 failed runs, 1 given up), 6.0/h, 3 left, ETA 30m0s |"), line)
+
+	def test_window(self):
+		metrics = exp_metrics.BatchMetrics(1, window = 0.05)
+		metrics.add_result("abc.rpi3", True)
+		time.sleep(0.1)
+		status = metrics.get_status()
+		# the totals stay, the rate only counts the window, the ETA is unknown without a rate or remaining experiments
+		self.assertEqual((status["counts"]["done"], status["window_counts"]["done"], status["per_hour"]), (1, 0, 0))
+		self.assertEqual((status["remaining"], status["eta"]), (None, None))
+
+	def test_format_duration(self):
+		self.assertEqual(list(map(exp_metrics.format_duration, [None, 5, 65, 3720, 90000])), ["?", "5s", "1m5s", "1h2m", "1d1h"])
+
+	def test_writer(self):
+		metrics = self._create_metrics()
+		json_path = os.path.join(self.temp_dir.name, "status.json")
+		exp_metrics.MetricsWriter(metrics, json_path).write()
+		with open(json_path, "r") as f:
+			self.assertEqual(json.load(f)["counts"]["done"], 6)
+
+		prom_path = os.path.join(self.temp_dir.name, "status.prom")
+		exp_metrics.MetricsWriter(metrics, prom_path).write()
+		with open(prom_path, "r") as f:
+			lines = f.read().splitlines()
+		self.assertIn("# TYPE embexp_experiments_total counter", lines)
+		self.assertIn('embexp_experiments_total{outcome="given_up"} 1', lines)
+		self.assertIn("embexp_eta_seconds 1800", lines)
+		self.assertIn('embexp_board_state{slot="1",state="quarantined"} 1', lines)
+		self.assertIn('embexp_board_state{slot="1",state="idle"} 0', lines)
+		self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["status.json", "status.prom"])
+
+if __name__ == "__main__":
+	unittest.main()
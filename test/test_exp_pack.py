@@ -0,0 +1,51 @@
+
+import os
+import shutil
+import unittest
+import tempfile
+
+import standin
+import exp_pack
+import experiment
+from helpers import *
+
+class TestExpPack(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_empty_dirs(self):
+		exp_class = "arm8/exps2/cls"
+		exp_ids = standin.create_exps(get_logs_path("."), exp_class, 2)
+		os.mkdir(get_logs_path(f"{exp_ids[0]}/run.abc.rpi3"))
+		class_path = get_logs_path(exp_class)
+		pack_path = exp_pack.get_class_pack_path(exp_class)
+		exp_pack.write_pack(pack_path, class_path)
+		shutil.rmtree(class_path)
+
+		# the interrupted run is still there in the pack and after unpacking
+		self.assertEqual(experiment.Experiment(exp_ids[0]).get_run_ids(), ["abc.rpi3"])
+		self.assertTrue(experiment.Experiment(exp_ids[0]).is_incomplete_experiment("abc.rpi3"))
+		exp_pack.unpack_pack(pack_path, class_path)
+		self.assertTrue(os.path.isdir(get_logs_path(f"{exp_ids[0]}/run.abc.rpi3")))
+
+	def test_read_cached_size(self):
+		[exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 1)
+		exp = experiment.Experiment(exp_id)
+		self.assertEqual(exp.get_prog_id(), "p0")
+
+		# a change within the same mtime tick is noticed by the size
+		filepath = exp.get_path("code.hash")
+		st = os.stat(filepath)
+		with open(filepath, "w") as f:
+			f.write("p10\n")
+		os.utime(filepath, ns = (st.st_atime_ns, st.st_mtime_ns))
+		self.assertEqual(exp.get_prog_id(), "p10")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,98 @@
+
+import time
+import unittest
+
+import standin
+import exp_retry
+from helpers import *
+
+class TestRetryQueue(unittest.TestCase):
+	def test_backoff(self):
+		retries = exp_retry.RetryQueue(max_attempts = 4, backoff = 30, backoff_max = 100)
+		self.assertEqual(retries.add_failure("e0", "run"), 30)
+		self.assertEqual(retries.add_failure("e0", "timeout"), 60)
+		# the delay is capped
+		self.assertEqual(retries.add_failure("e0", "parse"), 100)
+		self.assertEqual(retries.get_attempt("e0"), 4)
+		# the last attempt failed as well
+		self.assertEqual(retries.add_failure("e0", "run"), None)
+		self.assertEqual(retries.given_up, {"e0": "run"})
+		self.assertEqual((retries.counts["run"], retries.counts["timeout"], retries.counts["parse"]), (2, 1, 1))
+
+	def test_deterministic(self):
+		retries = exp_retry.RetryQueue()
+		# build and other errors are given up right away
+		self.assertEqual(retries.add_failure("e0", "build"), None)
+		self.assertEqual(retries.add_failure("e1", "other"), None)
+		self.assertEqual(len(retries), 0)
+		self.assertTrue(retries.is_owned("e0"))
+
+	def test_due(self):
+		retries = exp_retry.RetryQueue(backoff = 0)
+		retries.add_failure("a/e0", "run")
+		retries.add_failure("b/e1", "run")
+		self.assertTrue(retries.is_owned("a/e0"))
+		self.assertEqual(retries.get_wait_time(), 0)
+		# only an experiment of the given directory is taken
+		self.assertEqual(retries.pop_due("b"), None)
+		self.assertEqual(retries.pop_due("a"), "a/e0")
+		self.assertEqual(retries.pop_due(), "b/e1")
+		self.assertEqual((retries.pop_due(), retries.get_wait_time(), retries.n_retries), (None, None, 2))
+		self.assertFalse(retries.is_owned("a/e0"))
+
+		# a success forgets the earlier attempts
+		retries.add_success("a/e0")
+		self.assertEqual(retries.get_attempt("a/e0"), 1)
+
+		# far in the future, until it is requeued
+		retries = exp_retry.RetryQueue(backoff = 1000, backoff_max = 1000)
+		retries.add_failure("a/e0", "run")
+		self.assertEqual(retries.pop_due(), None)
+		self.assertGreater(retries.get_wait_time(), 900)
+		retries.requeue("a/e1")
+		self.assertEqual(retries.pop_due(), "a/e1")
+
+class TestBoardHealth(unittest.TestCase):
+	def report_failures(self, health, n, category = "run"):
+		for i in range(n):
+			health.report_failure(category)
+
+	def test_default_off(self):
+		health = exp_retry.BoardHealth(0)
+		self.report_failures(health, 100)
+		self.assertFalse(health.take_reset())
+		self.assertEqual((health.get_quarantine_time(), health.retired), (0, False))
+
+	def test_transitions(self):
+		health = exp_retry.BoardHealth(0, reset_after = 2, quarantine_after = 5, quarantine_time = 100, max_quarantines = 2)
+		# deterministic failures are not the board's fault
+		self.report_failures(health, 10, "build")
+		self.assertFalse(health.take_reset())
+
+		# a success starts the count again
+		self.report_failures(health, 1)
+		health.report_success()
+		self.report_failures(health, 1)
+		self.assertFalse(health.take_reset())
+		self.report_failures(health, 1)
+		self.assertTrue(health.take_reset())
+		self.assertFalse(health.take_reset())
+		self.assertEqual(health.n_resets, 1)
+
+		# quarantined with a reset, twice as long the second time
+		self.report_failures(health, 3)
+		self.assertTrue(health.take_reset())
+		self.assertAlmostEqual(health.get_quarantine_time(), 100, delta = 5)
+		health.quarantined_until = time.monotonic()
+		self.assertEqual(health.get_quarantine_time(), 0)
+		self.report_failures(health, 5)
+		self.assertAlmostEqual(health.get_quarantine_time(), 200, delta = 5)
+		self.assertFalse(health.retired)
+
+		# retired after max_quarantines
+		self.report_failures(health, 5)
+		self.assertTrue(health.retired)
+		self.assertEqual(health.n_quarantines, 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,86 @@
+
+import os
+import json
+import unittest
+import tempfile
+
+import standin
+import progplatform
+import experiment
+import exp_runner
+from helpers import *
+
+class TestExpRunner(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.board_log = os.path.join(self.temp_dir.name, "board.log")
+		os.environ["STANDIN_BOARD_LOG"] = self.board_log
+		[self.exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 1)
+		self.progplat = progplatform.ProgPlatform(standin.create_progplatform(os.path.join(self.temp_dir.name, "pp")))
+
+	def tearDown(self):
+		del os.environ["STANDIN_BOARD_LOG"]
+		os.environ.pop("STANDIN_BOARD_UNEQUAL_BELOW", None)
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def _count_board_runs(self):
+		with open(self.board_log, "r") as f:
+			return len(f.read().splitlines())
+
+	def _run(self, mul_runs, force_results = False):
+		return exp_runner.run_experiment(self.exp_id, self.progplat, "rpi3", force_results = force_results, mul_runs = mul_runs)
+
+	def test_needs_more_runs(self):
+		self.assertTrue(exp_runner.needs_more_runs("exps2", False))
+		self.assertTrue(exp_runner.needs_more_runs("exps2", "special :::: INCONCLUSIVE: 3 of 10"))
+		self.assertFalse(exp_runner.needs_more_runs("exps2", True))
+		self.assertFalse(exp_runner.needs_more_runs("exps2", "embexp.board.exception :::: data abort"))
+		# single experiments have no equality
+		self.assertFalse(exp_runner.needs_more_runs("exps1", False))
+
+	def test_rerun_with_more_runs(self):
+		# unequal with 3 repetitions, equal with 10, the run with 30 is not needed
+		os.environ["STANDIN_BOARD_UNEQUAL_BELOW"] = "10"
+		self.assertEqual(self._run([3, 10, 30]), True)
+		self.assertEqual(self._count_board_runs(), 2)
+		exp = experiment.Experiment(self.exp_id)
+		run_id = self.progplat.get_configured_run_id()
+		self.assertEqual(exp.get_mul_runs(run_id), 10)
+
+		# the last count is recorded with its result if it doesn't help either
+		os.environ["STANDIN_BOARD_UNEQUAL_BELOW"] = "100"
+		self.assertEqual(self._run([3, 10, 30], True), False)
+		self.assertEqual(self._count_board_runs(), 5)
+		self.assertEqual(exp.get_mul_runs(run_id), 30)
+
+		# without more counts, the first output is kept
+		uartlogdata_bin = b"Init complete.\nRESULT: UNEQUAL\nExperiment complete.\n"
+		self.assertEqual(exp_runner.rerun_with_more_runs(self.progplat, exp, "rpi3", None, [3], uartlogdata_bin), (uartlogdata_bin, 3))
+		self.assertEqual(self._count_board_runs(), 5)
+
+	def test_mul_runs_mismatch(self):
+		exp = experiment.Experiment(self.exp_id)
+		self.assertEqual(self._run([10, 30]), True)
+		run_id = self.progplat.get_configured_run_id()
+		self.assertEqual(exp.get_mul_runs(run_id), 10)
+		# the fixed default count is the same
+		self.assertEqual(self._run(None), True)
+
+		# a different count is not compared to the recorded result
+		with self.assertRaisesRegex(Exception, "recorded with 10 repetitions, not 3"):
+			self._run([3, 10])
+		self.assertEqual(exp.get_mul_runs(run_id), 10)
+
+		# unless the result is replaced, a fixed run replaces the record as well
+		self.assertEqual(self._run([3, 10], True), True)
+		self.assertEqual(exp.get_mul_runs(run_id), 3)
+		self.assertEqual(self._run(None, True), True)
+		self.assertEqual(exp.get_mul_runs(run_id), None)
+		with self.assertRaisesRegex(Exception, "recorded with 10 repetitions, not 30"):
+			self._run([30])
+
+if __name__ == "__main__":
+	unittest.main()
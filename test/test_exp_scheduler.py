@@ -0,0 +1,142 @@
+
+import os
+import time
+import unittest
+import tempfile
+
+import standin
+import progplatform
+import experiment
+import exp_finder
+import exp_scheduler
+import run_times
+from helpers import *
+
+class TestExpScheduler(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.board_log = os.path.join(self.temp_dir.name, "board.log")
+		os.environ["STANDIN_BOARD_LOG"] = self.board_log
+
+	def tearDown(self):
+		del os.environ["STANDIN_BOARD_LOG"]
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def _create_progplats(self, n):
+		return list(map(lambda i: progplatform.ProgPlatform(standin.create_progplatform(os.path.join(self.temp_dir.name, f"pp{i}"))), range(n)))
+
+	def _read_board_log(self):
+		with open(self.board_log, "r") as f:
+			return list(map(lambda x: x.split(" ")[0], f.read().splitlines()))
+
+	def test_several_slots(self):
+		exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 9)
+		progplats = self._create_progplats(3)
+		progplat_hash = exp_scheduler.get_pool_branch_commit_hash(progplats, progplatform.get_default_branch("rpi3"))
+
+		scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(list(exp_ids)), progplats, "rpi3")
+		self.assertTrue(scheduler.run())
+		self.assertEqual(scheduler.get_run_id(), f"{progplat_hash}.rpi3")
+
+		# every experiment ran once and the runs were spread over the slots
+		board_runs = self._read_board_log()
+		self.assertEqual(len(board_runs), len(exp_ids))
+		self.assertGreater(len(set(board_runs)), 1)
+		for exp_id in exp_ids:
+			with open(get_logs_path(f"{exp_id}/run.{scheduler.get_run_id()}/result.json"), "r") as f:
+				self.assertEqual(f.read(), "true")
+
+		# the working copies are left clean
+		for progplat in progplats:
+			progplat.check_clean()
+
+	def test_pipelined(self):
+		exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 6)
+		branchname = progplatform.get_default_branch("rpi3")
+		base_progplats = self._create_progplats(2)
+		build_progplats = list(map(lambda p: progplatform.ProgPlatformSession(p, branchname, f"{p.progplat_path}.session.{branchname}.pipeline"), base_progplats))
+		progplats = list(map(lambda p: progplatform.ProgPlatformSession(p, branchname), base_progplats))
+
+		scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(list(exp_ids)), progplats, "rpi3", build_progplats = build_progplats)
+		self.assertTrue(scheduler.run())
+
+		# every experiment got exactly one result, the runs alternated between the working copies of a slot
+		board_runs = self._read_board_log()
+		self.assertEqual(len(board_runs), len(exp_ids))
+		self.assertTrue(set(board_runs) & set(map(lambda p: p.progplat_path, build_progplats)))
+		self.assertEqual(scheduler.metrics.counts["done"], len(exp_ids))
+		for exp_id in exp_ids:
+			self.assertEqual(experiment.Experiment(exp_id).get_run_ids(), [scheduler.get_run_id()])
+			with open(get_logs_path(f"{exp_id}/run.{scheduler.get_run_id()}/result.json"), "r") as f:
+				self.assertEqual(f.read(), "true")
+		for progplat in progplats + build_progplats:
+			progplat.check_clean()
+
+	def test_batches(self):
+		exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 5)
+		progplats = self._create_progplats(2)
+
+		scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(list(exp_ids)), progplats, "rpi3", batch_size = 2)
+		self.assertTrue(scheduler.run())
+
+		# 2 + 2 + 1 experiments in three images, each with the same output as a single run
+		self.assertEqual(len(self._read_board_log()), 3)
+		for exp_id in exp_ids:
+			with open(get_logs_path(f"{exp_id}/run.{scheduler.get_run_id()}/output_uart.log"), "rb") as f:
+				self.assertEqual(f.read(), b"Init complete.\nRESULT: EQUAL\nExperiment complete.\n")
+
+	def test_iterator_waits_without_lock(self):
+		exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 2)
+		progplats = self._create_progplats(2)
+		scheduler = None
+		waited = []
+		def iter_exps():
+			yield from exp_ids
+			# like ExpsIter at the end of a round, waits for new experiments while the other slot finishes
+			deadline = time.monotonic() + 10
+			while scheduler.metrics.counts["done"] < len(exp_ids) and time.monotonic() < deadline:
+				time.sleep(0.05)
+			waited.append(scheduler.metrics.counts["done"])
+
+		scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(iter_exps()), progplats, "rpi3")
+		self.assertTrue(scheduler.run())
+		self.assertEqual(waited, [len(exp_ids)])
+
+	def test_iterator_error(self):
+		exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 2)
+		progplats = self._create_progplats(2)
+		def iter_exps():
+			yield exp_ids[0]
+			raise Exception("not a valid experiment: arm8/exps2/cls/invalid")
+
+		scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(iter_exps()), progplats, "rpi3")
+		with self.assertRaisesRegex(Exception, "not a valid experiment"):
+			scheduler.run()
+		self.assertFalse(scheduler.successful)
+		# the experiment that was taken before still ran
+		self.assertEqual(len(self._read_board_log()), 1)
+
+	def test_run_times(self):
+		exp_class = "arm8/exps2/cls"
+		exp_ids = standin.create_exps(get_logs_path("."), exp_class, 2)
+		progplats = self._create_progplats(1)
+		history = run_times.RunTimeHistory(get_logs_path(".cache/run_times.sqlite"))
+		progplats[0].run_times = history
+		progplats[0].stream_uart = True
+		os.environ["STANDIN_BUILD_SLEEP"] = "1"
+		try:
+			scheduler = exp_scheduler.ExpScheduler(exp_finder.ExpsIterList(list(exp_ids)), progplats, "rpi3")
+			self.assertTrue(scheduler.run())
+		finally:
+			del os.environ["STANDIN_BUILD_SLEEP"]
+
+		# the recorded durations are those of the board without the build
+		durations = history.get_durations(run_times.get_run_time_key(exp_class, "rpi3", 10))
+		self.assertEqual(len(durations), len(exp_ids))
+		self.assertLess(max(durations), 0.9)
+
+if __name__ == "__main__":
+	unittest.main()
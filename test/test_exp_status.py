@@ -0,0 +1,52 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import exp_catalog
+import exp_status
+from helpers import *
+
+class TestExpStatus(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.catalog = exp_catalog.ExpCatalog(get_logs_path(".cache/catalog.sqlite"))
+
+		self.exp_ids = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 7)
+		results = ["true", "false", "\"special :::: INCONCLUSIVE: too few runs\"", "\"embexp.board.exception :::: data abort\"", "true", None]
+		for (exp_id, result) in zip(self.exp_ids, results):
+			run_path = get_logs_path(f"{exp_id}/run.abc.rpi3")
+			os.mkdir(run_path)
+			with open(os.path.join(run_path, "output_uart.log"), "w") as f:
+				f.write("Init complete.\n")
+			# without result the run is incomplete
+			if result != None:
+				with open(os.path.join(run_path, "result.json"), "w") as f:
+					f.write(result)
+		self.expected = {"notrun": [self.exp_ids[6]], "incomplete": [self.exp_ids[5]], "others": [self.exp_ids[3]], "inconclusive": [self.exp_ids[2]], "examples": sorted(self.exp_ids[0:5:4]), "cexamples": [self.exp_ids[1]]}
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_classify(self):
+		for jobs in [1, 2]:
+			status = exp_status.ExpStatus("abc.rpi3", exp_status.status_categories)
+			status.collect("arm8", self.catalog, jobs = jobs, chunk_size = 2)
+			self.assertEqual(status.n_exps, len(self.exp_ids))
+			self.assertEqual(status.lists, self.expected)
+			self.assertEqual(status.counts, dict(map(lambda x: (x[0], len(x[1])), self.expected.items())))
+
+	def test_exp_set(self):
+		# only the lists that are asked for are kept
+		status = exp_status.ExpStatus("abc.rpi3", ["examples"])
+		status.collect("arm8", self.catalog, exp_set = set(self.exp_ids[:2]), jobs = 1)
+		self.assertEqual(status.n_exps, 2)
+		self.assertEqual(status.lists, {"examples": [self.exp_ids[0]]})
+		self.assertEqual(status.counts["cexamples"], 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,78 @@
+
+import os
+import json
+import time
+import unittest
+import tempfile
+import threading
+
+import standin
+import exp_trace
+from helpers import *
+
+class TestExpTrace(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.jsonl_path = os.path.join(self.temp_dir.name, "trace.jsonl")
+		self.chrome_path = os.path.join(self.temp_dir.name, "trace.json")
+
+	def tearDown(self):
+		exp_trace.set_tracer(None)
+		self.temp_dir.cleanup()
+
+	def test_summary(self):
+		tracer = exp_trace.StageTracer()
+		exp_trace.set_tracer(tracer)
+		for i in range(20):
+			exp_trace.record("run", i, i + (i + 1) * 0.5)
+		exp_trace.record("build", 0, 2)
+		(count, mean, p50, p95, total) = tracer.get_summary()["run"]
+		self.assertEqual((count, p50, p95, total), (20, 5.0, 9.5, 105.0))
+		self.assertAlmostEqual(mean, 5.25)
+		# in the order in which the stages appeared first
+		self.assertEqual(list(tracer.get_summary()), ["run", "build"])
+		self.assertEqual(tracer.get_summary_str().splitlines()[1].split(), ["run", "|", "20", "|", "5.250s", "|", "5.000s", "|", "9.500s", "|", "105.0s"])
+
+		# nothing is recorded without a tracer
+		exp_trace.set_tracer(None)
+		with exp_trace.stage("run"):
+			pass
+		self.assertEqual(tracer.get_summary()["run"][0], 20)
+
+	def test_files(self):
+		tracer = exp_trace.StageTracer(self.jsonl_path, self.chrome_path)
+		exp_trace.set_tracer(tracer)
+		def run_exp(exp_id):
+			exp_trace.set_exp(exp_id)
+			with exp_trace.stage("build"):
+				time.sleep(0.01)
+			with exp_trace.stage("run"):
+				pass
+		threads = list(map(lambda i: threading.Thread(target=run_exp, args=(f"e{i}",), name=f"slot_{i}"), range(2)))
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		# the chrome events are written as they happen, a json array without the end
+		tracer._chrome_file.flush()
+		with open(self.chrome_path, "r") as f:
+			self.assertEqual(len(json.loads(f.read() + "]")), 6)
+		tracer.close()
+
+		with open(self.chrome_path, "r") as f:
+			events = json.load(f)
+		tids = dict(map(lambda x: (x["args"]["name"], x["tid"]), filter(lambda x: x["ph"] == "M", events)))
+		self.assertEqual(set(tids), {"slot_0", "slot_1"})
+		stages = sorted(map(lambda x: (x["args"]["exp_id"], x["name"], x["tid"]), filter(lambda x: x["ph"] == "X", events)))
+		self.assertEqual(stages, [("e0", "build", tids["slot_0"]), ("e0", "run", tids["slot_0"]), ("e1", "build", tids["slot_1"]), ("e1", "run", tids["slot_1"])])
+		self.assertGreaterEqual(min(map(lambda x: x["dur"], filter(lambda x: x["name"] == "build", events))), 10000)
+
+		with open(self.jsonl_path, "r") as f:
+			lines = list(map(json.loads, f.read().splitlines()))
+		self.assertEqual(sorted(map(lambda x: (x["exp_id"], x["stage"], x["thread"]), lines)), [("e0", "build", "slot_0"), ("e0", "run", "slot_0"), ("e1", "build", "slot_1"), ("e1", "run", "slot_1")])
+		for d in lines:
+			self.assertAlmostEqual(d["end"] - d["start"], d["duration"], places = 5)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,59 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import experiment
+from helpers import *
+
+class TestExperiment(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		[self.exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 1)
+		self.exp = experiment.Experiment(self.exp_id)
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def test_id_parts(self):
+		self.assertEqual((self.exp.get_exp_arch(), self.exp.get_exp_type(), self.exp.get_exp_params_id()), ("arm8", "exps2", "cls"))
+		self.assertEqual(self.exp.get_exp_class(), "arm8/exps2/cls")
+		self.assertEqual(self.exp.get_exp_data_id(), os.path.basename(self.exp_id))
+
+	def test_read_cached(self):
+		parsed = []
+		def parse(f):
+			parsed.append(f.read())
+			return parsed[-1]
+		self.assertEqual(self.exp._read_cached("code.hash", parse), "p0\n")
+		self.assertEqual(self.exp._read_cached("code.hash", parse), "p0\n")
+		self.assertEqual(len(parsed), 1)
+
+		# a new modification time is noticed, also with the same size
+		filepath = self.exp.get_path("code.hash")
+		with open(filepath, "w") as f:
+			f.write("p1\n")
+		st = os.stat(filepath)
+		os.utime(filepath, ns = (st.st_atime_ns, st.st_mtime_ns + 10**9))
+		self.assertEqual(self.exp._read_cached("code.hash", parse), "p1\n")
+		self.assertEqual(len(parsed), 2)
+		self.assertEqual(self.exp.get_prog_id(), "p1")
+
+		os.remove(filepath)
+		with self.assertRaisesRegex(Exception, "doesn't exist"):
+			self.exp._read_cached("code.hash", parse)
+
+	def test_input_copies(self):
+		# the parsed inputs are cached, every caller gets its own copy
+		input1 = self.exp.get_input_file("input1.json")
+		input1["mem"].clear()
+		input1["x5"] = 0
+		self.assertEqual(self.exp.get_input_file("input1.json")["x5"], 0x80100000)
+		self.assertEqual(len(self.exp.get_input_file("input1.json")["mem"]), 8)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,60 @@
+
+import os
+import subprocess
+import unittest
+import tempfile
+
+import standin
+import gitrefs
+import progplatform
+
+def rev_parse(path, name):
+	return subprocess.run(["git", "-C", path, "rev-parse", "--verify", "-q", name], check=True, stdout=subprocess.PIPE).stdout.decode().strip()
+
+class TestGitRefResolver(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.path = standin.create_progplatform(os.path.join(self.temp_dir.name, "pp"))
+		standin._git(self.path, ["tag", "-a", "-m", "annotated", "v1"])
+		standin._git(self.path, ["tag", "v1-light"])
+		standin._git(self.path, ["branch", "scamv_rpi4"])
+		self.names = ["HEAD", "scamv_rpi3", "refs/heads/scamv_rpi4", "v1", "v1-light", "tags/v1"]
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_loose_and_packed(self):
+		resolver = gitrefs.GitRefResolver(self.path)
+		for name in self.names:
+			self.assertEqual(resolver.resolve(name), rev_parse(self.path, name), name)
+		self.assertEqual(resolver.resolve("nonexisting"), None)
+
+		# the same after packing, annotated tags have a peeled line in packed-refs
+		standin._git(self.path, ["pack-refs", "--all"])
+		with open(os.path.join(self.path, ".git/packed-refs"), "r") as f:
+			self.assertIn("\n^", f.read())
+		for name in self.names:
+			self.assertEqual(resolver.resolve(name), rev_parse(self.path, name), name)
+
+	def test_updated_branch(self):
+		resolver = gitrefs.GitRefResolver(self.path)
+		old_hash = resolver.resolve("scamv_rpi3")
+		standin._git(self.path, ["commit", "-q", "--allow-empty", "-m", "next"])
+		self.assertNotEqual(resolver.resolve("scamv_rpi3"), old_hash)
+		self.assertEqual(resolver.resolve("scamv_rpi3"), rev_parse(self.path, "scamv_rpi3"))
+
+	def test_worktree(self):
+		progplat = progplatform.ProgPlatform(self.path)
+		session = progplatform.ProgPlatformSession(progplat, "scamv_rpi3")
+		resolver = gitrefs.GitRefResolver(session.progplat_path)
+		self.assertEqual(resolver.resolve("HEAD"), rev_parse(self.path, "scamv_rpi3"))
+		self.assertEqual(resolver.resolve("scamv_rpi4"), rev_parse(self.path, "scamv_rpi4"))
+
+	def test_fallback(self):
+		# abbreviated hashes are left to git rev-parse
+		full_hash = rev_parse(self.path, "HEAD")
+		self.assertEqual(gitrefs.GitRefResolver(self.path).resolve(full_hash[:10]), None)
+		self.assertEqual(progplatform.ProgPlatform(self.path).get_branch_commit_hash(full_hash[:10]), full_hash)
+
+if __name__ == "__main__":
+	unittest.main()
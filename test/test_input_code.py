@@ -0,0 +1,69 @@
+
+import re
+import unittest
+
+import standin
+from helpers import *
+
+def run_mem_code(asm):
+	# executes the movz/movk and stores of the memory setup code, checks the registers and the offset encodings
+	regs = {"x0": 0, "x1": 0}
+	mem = {}
+	for line in asm.splitlines():
+		line = line.strip()
+		if line == "" or line.startswith("//"):
+			continue
+		m = re.fullmatch(r"(movz|movk) ([xw])([01]), #(0x[0-9a-f]+|0)(?:, lsl #(\d+))?", line)
+		if m != None:
+			(op, width, n, imm, shift) = m.groups()
+			shift = 0 if shift == None else int(shift)
+			reg = f"x{n}"
+			imm = int(imm, 16) << shift
+			if op == "movz":
+				regs[reg] = imm
+			else:
+				regs[reg] = (regs[reg] & ~(0xFFFF << shift)) | imm
+			if width == "w":
+				regs[reg] &= 0xFFFFFFFF
+			continue
+		m = re.fullmatch(r"(str|strh|strb) ([xw](?:[01]|zr)), \[x0(?:, #(\d+))?\]", line)
+		if m == None:
+			raise Exception(f"unexpected instruction: {line}")
+		(op, reg, offset) = m.groups()
+		offset = 0 if offset == None else int(offset)
+		size = {"strh": 2, "strb": 1}.get(op, 8 if reg.startswith("x") else 4)
+		if offset % size != 0 or offset // size >= 4096:
+			raise Exception(f"offset can't be encoded: {line}")
+		value = 0 if reg.endswith("zr") else regs["x" + reg[1]]
+		for i in range(size):
+			mem[regs["x0"] + offset + i] = (value >> (8 * i)) & 0xFF
+	return mem
+
+class TestInputCode(unittest.TestCase):
+	def check_mem(self, memmap):
+		mem = run_mem_code(gen_input_code_mem(memmap))
+		self.assertEqual(mem, dict(map(lambda x: (uncacheable(x[0]), x[1]), memmap.items())))
+
+	def test_value_loaded(self):
+		# every 8 byte store is preceded by the load of its value
+		asm = gen_input_code_mem({0x80001000 + i: i + 1 for i in range(8)})
+		self.assertIn("movz x1, #0x0201, lsl #0", asm)
+		self.check_mem({0x80001000 + i: i + 1 for i in range(8)})
+		self.check_mem({0x80001000 + i: (i % 3) * 0x11 for i in range(64)})
+
+	def test_offsets(self):
+		# unaligned and far offsets from the reused base address
+		memmap = {0x80001001: 1, 0x80001002: 2, 0x80001004: 4, 0x80001005: 5, 0x80001006: 6, 0x80001007: 7}
+		memmap.update({0x80001000 + 0x2000 + i: 0xff for i in range(8)})
+		memmap.update({0x80001000 + 0x10000 + i: i for i in range(3)})
+		memmap.update({0x80001000 + 0x7ff8 + i: i + 0x10 for i in range(8)})
+		self.check_mem(memmap)
+
+	def test_temporary_registers(self):
+		# only x0 and x1 are used and both are reset afterwards
+		asm = gen_input_code({"x5": 0x80100000, "mem": {0x80100000 + i: i for i in range(16)}})
+		self.assertEqual(set(re.findall(r"\b[xw]\d+\b", asm.split("reset the temporary registers")[0])), {"x0", "x1"})
+		self.assertIn("\tmov x0, #0\n\tmov x1, #0\n", asm)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,64 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import progplatform
+import experiment
+from helpers import *
+
+class TestProgPlatformSession(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.prev_logs_path = get_logs_path(".")
+		set_logs_path(os.path.join(self.temp_dir.name, "logs"))
+		self.progplat = progplatform.ProgPlatform(standin.create_progplatform(os.path.join(self.temp_dir.name, "pp")))
+		self.session = progplatform.ProgPlatformSession(self.progplat, "scamv_rpi3")
+
+	def tearDown(self):
+		set_logs_path(self.prev_logs_path)
+		self.temp_dir.cleanup()
+
+	def _read(self, path):
+		with open(os.path.join(self.session.progplat_path, path), "r") as f:
+			return f.read()
+
+	def test_worktree(self):
+		self.assertEqual(self.session.progplat_path, os.path.join(self.temp_dir.name, "pp.session.scamv_rpi3"))
+		self.assertEqual(self.session.get_commit_hash(), self.progplat.get_branch_commit_hash("scamv_rpi3"))
+		# the working copy itself is not touched
+		self.progplat.check_clean()
+		with self.assertRaisesRegex(Exception, "cannot change to"):
+			self.session.change_branch("scamv_rpi4")
+
+		# an existing worktree is reused
+		session = progplatform.ProgPlatformSession(self.progplat, "scamv_rpi3")
+		self.assertEqual(session.progplat_path, self.session.progplat_path)
+
+	def test_reset_between_experiments(self):
+		[exp_id] = standin.create_exps(get_logs_path("."), "arm8/exps2/cls", 1)
+		self.session.configure_experiment("rpi3", experiment.Experiment(exp_id))
+		self.session.build()
+		self.assertNotEqual(self._read("all/inc/experiment/asm.h"), "\n")
+
+		# the experiment files are reset, the build output is kept
+		self.session.check_clean()
+		self.assertEqual(self._read("Makefile.config"), "# default\n")
+		self.assertEqual(sorted(os.listdir(os.path.join(self.session.progplat_path, "all/inc/experiment"))), ["asm.h"])
+		self.assertEqual(self._read("all/inc/experiment/asm.h"), "\n")
+		self.assertTrue(os.path.isfile(os.path.join(self.session.progplat_path, "output/image")))
+
+	def test_modified_tracked_file(self):
+		# other tracked files are only hashed when their stat information changes
+		with open(os.path.join(self.session.progplat_path, "Makefile"), "a") as f:
+			f.write("# changed\n")
+		with self.assertRaisesRegex(Exception, "has been modified"):
+			self.session.check_clean()
+
+		os.remove(os.path.join(self.session.progplat_path, "Makefile"))
+		with self.assertRaisesRegex(Exception, "has been removed"):
+			self.session.check_clean()
+
+if __name__ == "__main__":
+	unittest.main()
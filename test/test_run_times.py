@@ -0,0 +1,51 @@
+
+import os
+import unittest
+import tempfile
+
+import standin
+import run_times
+from helpers import *
+
+class TestRunTimes(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.history_path = os.path.join(self.temp_dir.name, "cache/run_times.sqlite")
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_timeout(self):
+		history = run_times.RunTimeHistory(self.history_path, factor = 2, min_samples = 20, min_timeout = 5)
+		key = run_times.get_run_time_key("arm8/exps2/cls", "rpi3", 10)
+		# 1..20 seconds, in another order
+		for i in range(20):
+			history.add(key, float((i * 7) % 20 + 1))
+			# the default without enough durations
+			if i < 19:
+				self.assertEqual(history.get_timeout(key, 60), 60)
+		# the nearest rank of the 95th percentile is 19 of 20
+		self.assertEqual(history.get_timeout(key, 60), 38)
+		# at most the default
+		self.assertEqual(history.get_timeout(key, 30), 30)
+		self.assertEqual(history.get_summary(), {key: (20, 38)})
+
+		# at least the minimum timeout
+		key_fast = run_times.get_run_time_key("arm8/exps2/cls", "rpi3", 3)
+		for i in range(20):
+			history.add(key_fast, 0.1)
+		self.assertEqual(history.get_timeout(key_fast, 60), 5)
+
+	def test_window(self):
+		history = run_times.RunTimeHistory(self.history_path, window = 10, min_samples = 1, factor = 1, min_timeout = 0)
+		for i in range(25):
+			history.add("k", float(i))
+		# only the last durations count, also after reopening
+		self.assertEqual(history.get_durations("k"), list(map(float, range(24, 14, -1))))
+		self.assertEqual(history.get_timeout("k", 60), 24)
+		history = run_times.RunTimeHistory(self.history_path, window = 10, min_samples = 1, factor = 1, min_timeout = 0)
+		self.assertEqual(len(history.get_durations("k")), 10)
+		self.assertEqual(history.get_durations("other"), [])
+
+if __name__ == "__main__":
+	unittest.main()
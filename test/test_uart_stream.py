@@ -0,0 +1,45 @@
+
+import unittest
+
+import standin
+from helpers import *
+
+class TestUartStreamParser(unittest.TestCase):
+	def test_complete(self):
+		parser = UartStreamParser()
+		self.assertFalse(parser.feed(b"Init complete.\nRESULT: EQUAL\n"))
+		self.assertTrue(parser.feed(b"Experiment complete.\r\n"))
+		self.assertEqual(parser.reason, "Experiment complete.")
+
+	def test_exception(self):
+		parser = UartStreamParser()
+		self.assertTrue(parser.feed(b"Init complete.\nEXCEPTION: data abort\nExperiment complete.\n"))
+		self.assertEqual(parser.reason, "EXCEPTION: data abort")
+		self.assertEqual(parser.num_complete, 0)
+
+	def test_partial_lines(self):
+		# lines are only complete with their newline, however the output is split
+		parser = UartStreamParser()
+		data = b"Init complete.\nRESULT: EQUAL\nExperiment complete.\n"
+		for i in range(len(data) - 1):
+			self.assertFalse(parser.feed(data[i:i+1]))
+		self.assertTrue(parser.feed(data[-1:]))
+
+		parser = UartStreamParser()
+		self.assertFalse(parser.feed(b"Init complete.\nExperiment complete."))
+		self.assertFalse(parser.feed(b"Experiment complete. or not\n"))
+
+	def test_batch(self):
+		parser = UartStreamParser(3)
+		self.assertFalse(parser.feed(b"Init complete.\n==== BATCH EXPERIMENT 0 ====\nRESULT: EQUAL\nExperiment complete.\n"))
+		self.assertFalse(parser.feed(b"==== BATCH EXPERIMENT 1 ====\nRESULT: EQUAL\nExperiment complete.\n"))
+		self.assertEqual(parser.num_complete, 2)
+		self.assertTrue(parser.feed(b"==== BATCH EXPERIMENT 2 ====\nRESULT: UNEQUAL\nExperiment complete.\n"))
+
+		# an exception ends the batch early
+		parser = UartStreamParser(3)
+		self.assertTrue(parser.feed(b"Init complete.\n==== BATCH EXPERIMENT 0 ====\nEXCEPTION: undefined instruction\n"))
+		self.assertEqual(parser.num_complete, 0)
+
+if __name__ == "__main__":
+	unittest.main()